@@ -162,35 +162,48 @@ class App:
             if perform_scraping:
                 self.update_status("--- Iniciando Fase de Scraping (Secuencial) ---")
                 self.stop_task_button.config(state="normal")  # Habilitar para la fase de scraping
+                # Parser en modo watch: parsea en segundo plano cada export que llega a 'data/' mientras
+                # los scrapers siguen descargando. Tiene su propio evento para detenerse al acabar el scraping.
+                watcher_stop_event = threading.Event()
+                watcher_thread = threading.Thread(target=Parser.run_watcher,
+                                                  args=(self.update_status, self.project_root_dir, watcher_stop_event))
+                watcher_thread.daemon = True
+                watcher_thread.start()
                 scraper_modules_and_names = [
                     (AcademicSearch, "AcademicSearch_Original"),
                     (AppliedScience, "AppliedScience_Original"),
                     (ScienceDirect, "ScienceDirect_Original"),
                 ]
 
-                for module, name in scraper_modules_and_names:
-                    if self.stop_current_task_event.is_set():
-                        self.update_status(
-                            f"Fase de Scraping detenida por usuario antes de {name}. Se saltarán los scrapers restantes.")
-                        # Actualizar progreso para los scrapers no ejecutados
-                        remaining_scrapers = len(scraper_modules_and_names) - scraper_modules_and_names.index(
-                            (module, name))
-                        for _ in range(remaining_scrapers):
-                            advance_to_next_stage()
-                        break  # Salir del bucle de scrapers
-
-                    self.update_status(f"Ejecutando scraper: {name} (puede ser detenido)...")
-                    module.run_scraper(query, self.stop_current_task_event, self.update_status, chrome_profile, name)
-                    advance_to_next_stage()
-
-                    if self.stop_current_task_event.is_set():  # Si este scraper fue el que se detuvo
-                        self.update_status(f"Scraper {name} detenido por usuario. Se saltarán los scrapers restantes.")
-                        # Actualizar progreso para los scrapers restantes
-                        current_idx = scraper_modules_and_names.index((module, name))
-                        remaining_scrapers_after_stop = len(scraper_modules_and_names) - (current_idx + 1)
-                        for _ in range(remaining_scrapers_after_stop):
-                            advance_to_next_stage()
-                        break  # Salir del bucle de scrapers
+                # El watcher se detiene aunque un scraper lance una excepción: si no, seguiría parseando
+                # 'data/' y escribiendo el manifiesto de la caché en paralelo con el resto del pipeline
+                try:
+                    for module, name in scraper_modules_and_names:
+                        if self.stop_current_task_event.is_set():
+                            self.update_status(
+                                f"Fase de Scraping detenida por usuario antes de {name}. Se saltarán los scrapers restantes.")
+                            # Actualizar progreso para los scrapers no ejecutados
+                            remaining_scrapers = len(scraper_modules_and_names) - scraper_modules_and_names.index(
+                                (module, name))
+                            for _ in range(remaining_scrapers):
+                                advance_to_next_stage()
+                            break  # Salir del bucle de scrapers
+
+                        self.update_status(f"Ejecutando scraper: {name} (puede ser detenido)...")
+                        module.run_scraper(query, self.stop_current_task_event, self.update_status, chrome_profile, name)
+                        advance_to_next_stage()
+
+                        if self.stop_current_task_event.is_set():  # Si este scraper fue el que se detuvo
+                            self.update_status(f"Scraper {name} detenido por usuario. Se saltarán los scrapers restantes.")
+                            # Actualizar progreso para los scrapers restantes
+                            current_idx = scraper_modules_and_names.index((module, name))
+                            remaining_scrapers_after_stop = len(scraper_modules_and_names) - (current_idx + 1)
+                            for _ in range(remaining_scrapers_after_stop):
+                                advance_to_next_stage()
+                            break  # Salir del bucle de scrapers
+                finally:
+                    watcher_stop_event.set()
+                    watcher_thread.join()
 
                 if self.stop_current_task_event.is_set():
                     self.update_status("Fase de Scraping interrumpida. Continuando con el pipeline...")
@@ -208,7 +221,8 @@ class App:
                 self.update_status("Saltando Parsing debido a detención previa."); advance_to_next_stage();
             else:
                 self.update_status("--- Iniciando Fase de Parsing ---")
-                Parser.run_parser(self.update_status, self.project_root_dir)
+                Parser.run_parser(self.update_status, self.project_root_dir, parallel=True, incremental=True,
+                                  write_db=True)
                 advance_to_next_stage()
                 self.update_status("--- Parsing Completado ---")
 
@@ -217,7 +231,7 @@ class App:
                 self.update_status("Saltando Normalización debido a detención previa."); advance_to_next_stage();
             else:
                 self.update_status("--- Iniciando Normalización de Datos ---")
-                dataNormalizer.run_data_normalizer(self.update_status, self.project_root_dir)
+                dataNormalizer.run_data_normalizer(self.update_status, self.project_root_dir, parallel=True)
                 advance_to_next_stage()
                 self.update_status("--- Normalización de Datos Completada ---")
 
@@ -257,7 +271,7 @@ class App:
                 self.update_status("Iniciando Análisis de Similitud de Abstracts (puede ser detenido)...")
                 self.stop_task_button.config(state="normal")  # Habilitar botón para esta tarea
                 similitud.run_similarity_analysis(self.update_status, self.project_root_dir,
-                                                           self.stop_current_task_event)
+                                                           self.stop_current_task_event, parallel=True)
                 self.stop_task_button.config(state="disabled")  # Deshabilitar después de que termine o se detenga
                 advance_to_next_stage()
                 if self.stop_current_task_event.is_set():
@@ -0,0 +1,57 @@
+import os
+import re
+from bibtexparser.bparser import BibTexParser
+
+# Una entrada BibTeX empieza en una línea del tipo "@article{", "@string(", etc.
+_ENTRY_HEADER_RE = re.compile(r'^\s*@\s*\w+\s*[{(]')
+
+
+def _iter_entry_chunks_internal(bibtex_file):
+    # Agrupa las líneas del archivo en bloques, uno por cada entrada/@string/@comment.
+    # Solo se guarda en memoria el bloque actual, nunca el archivo completo.
+    chunk_lines = []
+    for line in bibtex_file:
+        if _ENTRY_HEADER_RE.match(line) and chunk_lines:
+            yield ''.join(chunk_lines)
+            chunk_lines = []
+        chunk_lines.append(line)
+    if chunk_lines:
+        yield ''.join(chunk_lines)
+
+
+def iter_bib_entries(bibtex_file_path, customization=None, status_callback=None, common_strings=True):
+    """Generador que lee un archivo BibTeX y devuelve una entrada (dict) cada vez.
+
+    Usa un único BibTexParser para todo el archivo, de forma que las macros @string
+    definidas al principio siguen disponibles para las entradas posteriores, pero la
+    lista de entradas del parser se vacía tras cada bloque: la memoria usada depende del
+    tamaño de una entrada y no del tamaño del archivo.
+    """
+    if not os.path.exists(bibtex_file_path):
+        if status_callback:
+            status_callback(f"BibReader: Archivo no encontrado: {bibtex_file_path}")
+        return
+
+    parser = BibTexParser(common_strings=common_strings)
+    parser.customization = customization
+    parser.expect_multiple_parse = True
+    bib_database = parser.bib_database
+
+    with open(bibtex_file_path, encoding='utf-8') as bibtex_file:
+        for chunk in _iter_entry_chunks_internal(bibtex_file):
+            try:
+                parser.parse(chunk, partial=True)
+            except Exception as e:
+                if status_callback:
+                    status_callback(
+                        f"BibReader: Entrada ignorada en {os.path.basename(bibtex_file_path)}: {str(e)}")
+                continue
+            finally:
+                # Los comentarios y preámbulos no se usan en el pipeline; se descartan para no acumularlos
+                bib_database.comments.clear()
+                bib_database.preambles.clear()
+
+            if bib_database.entries:
+                parsed_entries = bib_database.entries
+                bib_database.entries = []
+                yield from parsed_entries
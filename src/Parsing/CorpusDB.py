@@ -0,0 +1,132 @@
+import json
+import os
+import pathlib
+import sqlite3
+from src.Parsing import CorpusStore
+
+# Base de datos SQLite del corpus unificado: una fila por entrada, índices B-tree sobre los campos
+# de filtrado y un índice FTS5 (tabla de contenido externo) sobre título, abstract y keywords.
+# Las filas van en el orden de unificados.bib y el texto con la normalización 'unicode' del almacén
+# columnar, así que una consulta ve lo mismo que Stats al leer el BibTeX.
+DB_FILENAME = "corpus.sqlite"
+_DB_NORMALIZATION = 'unicode'
+
+_SCHEMA = """
+CREATE TABLE entries (
+    rowid INTEGER PRIMARY KEY,
+    entry_id TEXT,
+    entrytype TEXT,
+    title TEXT,
+    abstract TEXT,
+    keywords TEXT,
+    author TEXT,
+    year INTEGER,
+    year_text TEXT,
+    journal TEXT,
+    publisher TEXT,
+    doi TEXT,
+    source TEXT
+);
+CREATE INDEX idx_entries_year ON entries(year);
+CREATE INDEX idx_entries_entrytype ON entries(entrytype);
+CREATE INDEX idx_entries_journal ON entries(journal);
+CREATE INDEX idx_entries_source ON entries(source);
+CREATE INDEX idx_entries_entry_id ON entries(entry_id);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE entries_fts USING fts5(
+    title, abstract, keywords,
+    content='entries', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _year_to_int_internal(year):
+    year = str(year or '').strip()[:4]
+    return int(year) if year.isdigit() else None
+
+
+def write_corpus_db(entries, db_path, source_bib_path, sources=None, status_callback=None):
+    # entries (y sources): en el orden en que quedaron escritas en source_bib_path.
+    # Se construye en un archivo temporal y se reemplaza al final: quien consulte la base nunca ve una a medias
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(_SCHEMA)
+        customization = CorpusStore.NORMALIZATIONS[_DB_NORMALIZATION]
+        normalized_entries = (
+            customization({column: entry[column] for column in CorpusStore.DEFAULT_COLUMNS if column in entry})
+            for entry in entries)
+        connection.executemany(
+            "INSERT INTO entries (rowid, entry_id, entrytype, title, abstract, keywords, author, year, year_text, "
+            "journal, publisher, doi, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((idx + 1, entry.get('ID'), entry.get('ENTRYTYPE'), entry.get('title'), entry.get('abstract'),
+              entry.get('keywords'), entry.get('author'), _year_to_int_internal(entry.get('year')),
+              entry.get('year'), entry.get('journal'), entry.get('publisher'), entry.get('doi'),
+              sources[idx] if sources is not None else None)
+             for idx, entry in enumerate(normalized_entries)))
+        connection.execute("INSERT INTO meta (key, value) VALUES ('source', ?)",
+                           (json.dumps(CorpusStore.source_signature(source_bib_path)),))
+
+        try:
+            connection.executescript(_FTS_SCHEMA)
+            connection.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            # Algunas compilaciones de SQLite no traen FTS5: la base sigue siendo útil con los índices B-tree
+            if status_callback:
+                status_callback(f"CorpusDB: FTS5 no disponible ({e}); se omite el índice de texto completo.")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+
+
+def is_current(db_path, source_bib_path):
+    # True si la base existe y se escribió a partir del unificados.bib actual (mismo tamaño y mtime)
+    if not os.path.exists(db_path) or not os.path.exists(source_bib_path):
+        return False
+    try:
+        rows = query_corpus(db_path, "SELECT value FROM meta WHERE key = 'source'")
+    except sqlite3.Error:
+        return False
+    return bool(rows) and json.loads(rows[0]['value']) == CorpusStore.source_signature(source_bib_path)
+
+
+def query_corpus(db_path, sql, params=()):
+    """Ejecuta una consulta SQL de solo lectura sobre la base del corpus y devuelve filas sqlite3.Row.
+
+    Ejemplo: abstracts que mencionan programación por bloques después de 2020::
+
+        query_corpus(db_path,
+                     "SELECT e.entry_id, e.title, e.year FROM entries_fts f JOIN entries e ON e.rowid = f.rowid "
+                     "WHERE entries_fts MATCH ? AND e.year > ?",
+                     ('abstract:"block based programming"', 2020))
+    """
+    # as_uri() escapa espacios, '#', '?' y '%' de la ruta; un f"file:{db_path}" los rompería
+    connection = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        connection.row_factory = sqlite3.Row
+        return connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+
+
+def search_corpus(db_path, match_query, columns=('entry_id', 'title', 'year', 'source'), where=None, params=(),
+                  limit=None):
+    # Búsqueda de texto completo (sintaxis MATCH de FTS5) con filtros opcionales sobre la tabla entries,
+    # ordenada por relevancia (bm25)
+    sql = (f"SELECT {', '.join('e.' + column for column in columns)} FROM entries_fts "
+           f"JOIN entries e ON e.rowid = entries_fts.rowid WHERE entries_fts MATCH ?")
+    if where:
+        sql += f" AND ({where})"
+    sql += " ORDER BY bm25(entries_fts)"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return query_corpus(db_path, sql, (match_query,) + tuple(params))
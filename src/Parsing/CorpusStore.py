@@ -0,0 +1,166 @@
+import json
+import os
+import numpy as np
+from bibtexparser.customization import convert_to_unicode, homogenize_latex_encoding
+
+# Almacén columnar del corpus unificado: por cada columna, un blob UTF-8 (uint8), los offsets
+# de cada fila (int64, n+1) y una máscara de presencia. Las etapas posteriores cargan solo las
+# columnas que usan, con np.load en modo mmap, en lugar de volver a parsear unificados.bib.
+# Cada columna se guarda una vez por normalización (NORMALIZATIONS) y en el orden de unificados.bib, así
+# que leer el almacén o el BibTeX con la misma customization da exactamente el mismo texto.
+STORE_VERSION = 2
+META_FILENAME = "meta.json"
+DEFAULT_COLUMNS = ('ID', 'ENTRYTYPE', 'title', 'abstract', 'keywords', 'author', 'year', 'journal', 'publisher',
+                   'doi')
+# Filas por bloque al leer: se copian del mmap y se decodifican de a _DECODE_CHUNK_ROWS, no el blob entero
+_DECODE_CHUNK_ROWS = 4096
+
+
+def _latex_to_unicode_internal(record):
+    # LaTeX homogéneo y luego unicode (lo que usan similitud y dataNormalizer)
+    return convert_to_unicode(homogenize_latex_encoding(record))
+
+
+# Customizations de bibtexparser con las que las etapas leen unificados.bib. Todas tratan cada campo por
+# separado, así que se pueden aplicar solo a las columnas guardadas.
+NORMALIZATIONS = {
+    'latex': _latex_to_unicode_internal,
+    'unicode': convert_to_unicode,
+}
+
+
+def _column_paths_internal(store_dir, column, normalization):
+    return (os.path.join(store_dir, f"{column}.{normalization}.data.npy"),
+            os.path.join(store_dir, f"{column}.{normalization}.offsets.npy"),
+            os.path.join(store_dir, f"{column}.{normalization}.mask.npy"))
+
+
+def source_signature(source_path):
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_corpus_store(entries, store_dir, source_bib_path, columns=DEFAULT_COLUMNS):
+    # entries: en el orden en que quedaron escritas en source_bib_path
+    os.makedirs(store_dir, exist_ok=True)
+    meta_path = os.path.join(store_dir, META_FILENAME)
+    # Sin meta.json el almacén se considera inválido: se borra antes de reescribir las columnas
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    for normalization, customization in NORMALIZATIONS.items():
+        normalized_entries = [customization({column: entry[column] for column in columns if column in entry})
+                              for entry in entries]
+        for column in columns:
+            encoded_values = []
+            mask = np.zeros(len(normalized_entries), dtype=np.bool_)
+            for idx, entry in enumerate(normalized_entries):
+                value = entry.get(column)
+                if value is None:
+                    encoded_values.append(b'')
+                else:
+                    encoded_values.append(str(value).encode('utf-8'))
+                    mask[idx] = True
+            offsets = np.zeros(len(normalized_entries) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded_values], out=offsets[1:])
+            data = np.frombuffer(b''.join(encoded_values), dtype=np.uint8)
+
+            data_path, offsets_path, mask_path = _column_paths_internal(store_dir, column, normalization)
+            np.save(data_path, data)
+            np.save(offsets_path, offsets)
+            np.save(mask_path, mask)
+
+    meta = {
+        "version": STORE_VERSION,
+        "num_rows": len(entries),
+        "columns": list(columns),
+        "normalizations": list(NORMALIZATIONS),
+        "source": source_signature(source_bib_path),
+    }
+    with open(meta_path, 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file)
+
+
+def _load_meta_internal(store_dir, source_bib_path=None):
+    # Devuelve el meta.json si el almacén existe, es de esta versión y corresponde a unificados.bib actual
+    meta_path = os.path.join(store_dir, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != STORE_VERSION:
+        return None
+    if source_bib_path is not None:
+        if not os.path.exists(source_bib_path) or meta.get("source") != source_signature(source_bib_path):
+            return None
+    return meta
+
+
+def _open_columns_internal(store_dir, columns, source_bib_path, normalization):
+    # (num_rows, {columna: (data, offsets, mask)}) con data y offsets en mmap, o None si el almacén no sirve
+    meta = _load_meta_internal(store_dir, source_bib_path)
+    if (meta is None or normalization not in meta.get("normalizations", ())
+            or any(column not in meta["columns"] for column in columns)):
+        return None
+
+    opened = {}
+    for column in columns:
+        data_path, offsets_path, mask_path = _column_paths_internal(store_dir, column, normalization)
+        try:
+            opened[column] = (np.load(data_path, mmap_mode='r'), np.load(offsets_path, mmap_mode='r'),
+                              np.load(mask_path))
+        except (OSError, ValueError):
+            return None
+    return meta["num_rows"], opened
+
+
+def _decode_rows_internal(data, offsets, mask, start, end):
+    # Copia solo los bytes de las filas [start, end) desde el mmap y los decodifica fila a fila
+    row_offsets = offsets[start:end + 1].tolist()
+    base = row_offsets[0]
+    blob = data[base:row_offsets[-1]].tobytes()
+    return [blob[row_offsets[pos] - base:row_offsets[pos + 1] - base].decode('utf-8') if present else None
+            for pos, present in enumerate(mask[start:end].tolist())]
+
+
+def load_corpus_columns(store_dir, columns, source_bib_path=None, normalization='latex'):
+    """Carga las columnas pedidas como listas de str (None donde la entrada no tenía el campo).
+
+    normalization elige la variante guardada: el texto es el mismo que da leer el BibTeX con
+    NORMALIZATIONS[normalization]. Devuelve None si no hay almacén, si está desactualizado
+    respecto a source_bib_path o si le falta alguna columna: en ese caso la etapa debe volver
+    a leer el BibTeX.
+    """
+    opened = _open_columns_internal(store_dir, columns, source_bib_path, normalization)
+    if opened is None:
+        return None
+    num_rows, opened = opened
+
+    loaded = {column: [] for column in columns}
+    for start in range(0, num_rows, _DECODE_CHUNK_ROWS):
+        end = min(start + _DECODE_CHUNK_ROWS, num_rows)
+        for column in columns:
+            loaded[column].extend(_decode_rows_internal(*opened[column], start, end))
+    return loaded
+
+
+def iter_corpus_records(store_dir, columns, source_bib_path=None, normalization='latex'):
+    # Igual que load_corpus_columns pero entrega un dict por entrada (solo con los campos presentes),
+    # para poder sustituir directamente a iter_bib_entries. None si el almacén no sirve.
+    # Las filas se decodifican por bloques a medida que se consumen: nunca está la columna entera en memoria.
+    opened = _open_columns_internal(store_dir, columns, source_bib_path, normalization)
+    if opened is None:
+        return None
+    num_rows, opened = opened
+
+    def _records():
+        for start in range(0, num_rows, _DECODE_CHUNK_ROWS):
+            end = min(start + _DECODE_CHUNK_ROWS, num_rows)
+            chunk = {column: _decode_rows_internal(*opened[column], start, end) for column in columns}
+            for pos in range(end - start):
+                yield {column: chunk[column][pos] for column in columns if chunk[column][pos] is not None}
+
+    return _records()
@@ -0,0 +1,298 @@
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+import numpy as np
+
+_LATEX_COMMAND_RE = re.compile(r'\\[a-zA-Z]+\*?')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+# Números arábigos o romanos ("Part 2", "Part II", "Chapter 13")
+_NUMBER_RE = re.compile(r'\b(?:\d+|(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3}))\b')
+# Fe de erratas / retractaciones: registros propios aunque repitan el título del artículo original
+_NOTICE_PREFIX_RE = re.compile(r'^(?:correction|erratum|corrigendum|retraction|addendum)\b')
+
+# Primo de Mersenne 2^31 - 1: a * h + b cabe en uint64 sin desbordar
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+def normalize_title(title):
+    # Quita acentos, comandos LaTeX, llaves y puntuación para que el mismo título exportado
+    # por EBSCO y ScienceDirect quede igual ("{C}omputational thinking: ..." == "Computational Thinking ...")
+    if not title:
+        return ""
+    text = unicodedata.normalize('NFKD', str(title))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _LATEX_COMMAND_RE.sub(' ', text).lower().replace('{', '').replace('}', '')
+    text = text.replace('&amp;', ' ')
+    return _NON_ALNUM_RE.sub(' ', text).strip()
+
+
+def _title_numbers_internal(normalized_title):
+    return [number for number in _NUMBER_RE.findall(normalized_title) if number]
+
+
+def _same_title_kind_internal(normalized_title1, normalized_title2):
+    # Mismos números y ambos (o ninguno) avisos de corrección
+    return (_title_numbers_internal(normalized_title1) == _title_numbers_internal(normalized_title2)
+            and bool(_NOTICE_PREFIX_RE.match(normalized_title1)) == bool(_NOTICE_PREFIX_RE.match(normalized_title2)))
+
+
+def _title_shingles_internal(normalized_title, shingle_size):
+    if len(normalized_title) <= shingle_size:
+        return {normalized_title} if normalized_title else set()
+    return {normalized_title[i:i + shingle_size] for i in range(len(normalized_title) - shingle_size + 1)}
+
+
+def _jaccard_sets_internal(set1, set2):
+    if not set1 and not set2:
+        return 1.0
+    union_size = len(set1 | set2)
+    return len(set1 & set2) / float(union_size) if union_size else 0.0
+
+
+def _optimal_bands_internal(threshold, num_perm, false_positive_weight=0.3, false_negative_weight=0.7):
+    # Elige (bandas, filas) minimizando el área de falsos positivos/negativos de la curva S 1-(1-s^r)^b.
+    # Se pesa más el falso negativo: los candidatos se verifican después con Jaccard exacto.
+    def _integrate(func, a, b, steps=100):
+        width = (b - a) / steps
+        return sum(func(a + (k + 0.5) * width) for k in range(steps)) * width
+
+    best = (1, num_perm)
+    best_error = float('inf')
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            fp = _integrate(lambda s: 1 - (1 - s ** rows) ** bands, 0.0, threshold)
+            fn = _integrate(lambda s: (1 - s ** rows) ** bands, threshold, 1.0)
+            error = false_positive_weight * fp + false_negative_weight * fn
+            if error < best_error:
+                best_error = error
+                best = (bands, rows)
+    return best
+
+
+class MinHashLSH:
+    """Índice LSH de firmas MinHash sobre shingles de caracteres de títulos normalizados.
+
+    Las parejas candidatas salen de compartir al menos un bucket de banda, así que el
+    coste es aproximadamente lineal en el número de títulos; solo esas parejas se
+    comparan con el Jaccard exacto de sus shingles.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, bands=None, rows=None, shingle_size=3, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        if bands is None or rows is None:
+            bands, rows = _optimal_bands_internal(threshold, num_perm)
+        if bands * rows > num_perm:
+            raise ValueError(f"bands * rows ({bands * rows}) no puede superar num_perm ({num_perm})")
+        self.bands = bands
+        self.rows = rows
+
+        rng = np.random.RandomState(seed)
+        self._perm_a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self._perm_b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+
+        self._shingles = []
+        self._titles = []
+        self._buckets = defaultdict(list)
+
+    def _signature_internal(self, shingles):
+        # crc32 es estable entre ejecuciones (hash() de Python cambia con PYTHONHASHSEED)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64,
+                             count=len(shingles)) % _MERSENNE_PRIME
+        permuted = (self._perm_a[:, None] * hashes[None, :] + self._perm_b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def add(self, title):
+        # Devuelve el índice asignado al título dentro del LSH
+        doc_idx = len(self._shingles)
+        normalized_title = normalize_title(title)
+        shingles = _title_shingles_internal(normalized_title, self.shingle_size)
+        self._shingles.append(shingles)
+        self._titles.append(normalized_title)
+        if not shingles:
+            return doc_idx
+        signature = self._signature_internal(shingles)
+        for band in range(self.bands):
+            band_key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            self._buckets[(band, band_key)].append(doc_idx)
+        return doc_idx
+
+    def candidate_pairs(self):
+        pairs = set()
+        for bucket in self._buckets.values():
+            if len(bucket) < 2:
+                continue
+            for pos, i in enumerate(bucket):
+                for j in bucket[pos + 1:]:
+                    pairs.add((i, j) if i < j else (j, i))
+        return pairs
+
+    def similar_pairs(self):
+        # Parejas (i, j, similitud) con i < j y Jaccard exacto >= threshold, ordenadas
+        result = []
+        for i, j in self.candidate_pairs():
+            # "Part 1" / "Part 2", "Chapter 13" / "Chapter 19" o "Correction to: X" / "X" son registros distintos
+            if not _same_title_kind_internal(self._titles[i], self._titles[j]):
+                continue
+            sim = _jaccard_sets_internal(self._shingles[i], self._shingles[j])
+            if sim >= self.threshold:
+                result.append((i, j, sim))
+        result.sort()
+        return result
+
+
+def _years_compatible_internal(entry1, entry2, max_year_gap):
+    # La misma publicación puede salir con un año de diferencia (online first vs. número impreso),
+    # pero títulos genéricos ("Computational thinking") de años distantes son trabajos distintos
+    year1 = str(entry1.get('year', '')).strip()[:4]
+    year2 = str(entry2.get('year', '')).strip()[:4]
+    if not (year1.isdigit() and year2.isdigit()):
+        return True
+    return abs(int(year1) - int(year2)) <= max_year_gap
+
+
+def near_duplicate_pairs(entries, threshold=0.9, num_perm=128, bands=None, rows=None, max_year_gap=1):
+    # Parejas (i, j, similitud) de títulos casi iguales, ya filtradas por año
+    lsh = MinHashLSH(threshold=threshold, num_perm=num_perm, bands=bands, rows=rows)
+    for entry in entries:
+        lsh.add(entry.get('title', ''))
+    return [(i, j, sim) for i, j, sim in lsh.similar_pairs()
+            if _years_compatible_internal(entries[i], entries[j], max_year_gap)]
+
+
+_DOI_PREFIX_RE = re.compile(r'^(?:https?://)?(?:dx\.)?doi\.org/|^doi:\s*', re.IGNORECASE)
+
+
+def normalize_doi(doi):
+    # ScienceDirect guarda el DOI como URL completa (https://doi.org/10.1016/...); EBSCO como 10.xxxx/...
+    if not doi:
+        return ""
+    doi = _DOI_PREFIX_RE.sub('', str(doi).strip()).strip().lower()
+    return doi if doi.startswith('10.') else ""
+
+
+def _first_author_year_key_internal(entry):
+    # Apellido normalizado del primer autor + año ("ozmutlu|2021")
+    authors = str(entry.get('author', '')).strip()
+    year = str(entry.get('year', '')).strip()[:4]
+    if not authors or not year.isdigit():
+        return ""
+    first_author = authors.split(' and ')[0].strip()
+    if ',' in first_author:
+        surname = first_author.split(',')[0]
+    else:
+        surname = first_author.split()[-1] if first_author.split() else ""
+    surname = normalize_title(surname)
+    return f"{surname}|{year}" if surname else ""
+
+
+def _titles_compatible_internal(title1, title2, min_similarity=0.7, shingle_size=3):
+    # Confirma una coincidencia de autor+año: el mismo autor publica varios trabajos el mismo año,
+    # así que además se exige que un título sea prefijo del otro (con/sin subtítulo) o muy parecido
+    if not title1 or not title2 or not _same_title_kind_internal(title1, title2):
+        return False
+    if title1.startswith(title2) or title2.startswith(title1):
+        return True
+    return _jaccard_sets_internal(_title_shingles_internal(title1, shingle_size),
+                                  _title_shingles_internal(title2, shingle_size)) >= min_similarity
+
+
+class UnionFind:
+    # La raíz de cada conjunto es siempre su índice más pequeño: la primera aparición queda como canónica
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, idx):
+        root = idx
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[idx] != root:  # Compresión de caminos
+            self.parent[idx], idx = root, self.parent[idx]
+        return root
+
+    def union(self, idx1, idx2):
+        root1, root2 = self.find(idx1), self.find(idx2)
+        if root1 == root2:
+            return False
+        if root2 < root1:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        return True
+
+
+# (motivo, función de clave, exigir años compatibles). El DOI identifica la publicación por sí solo;
+# el título exacto sigue la misma regla de años que los títulos casi iguales.
+_IDENTITY_KEYS = (
+    ('doi', lambda entry: normalize_doi(entry.get('doi', '')), False),
+    ('titulo', lambda entry: normalize_title(entry.get('title', '')), True),
+)
+
+
+def deduplicate_entries(entries, near_duplicate_threshold=0.9, max_year_gap=1):
+    """Agrupa registros que son la misma publicación.
+
+    Cada clave de identidad (DOI normalizado y título normalizado) va a su propio dict
+    clave -> primer índice; dos registros que comparten cualquier clave se unen en el
+    union-find (el título, solo si los años están a max_year_gap o menos). La clave primer autor + año agrupa en un dict clave -> índices y solo une
+    títulos compatibles dentro de cada grupo (pocos registros por autor y año), así que
+    todo sigue siendo O(n) en búsquedas hash. Si near_duplicate_threshold no es None,
+    los representantes de cada grupo pasan además por el LSH de títulos casi iguales.
+
+    Devuelve (canonical_of, merges): canonical_of[i] es el índice canónico del registro i y
+    merges es una lista de (índice_canónico, índice_duplicado, motivo, similitud_título).
+    """
+    union_find = UnionFind(len(entries))
+    link_reasons = {}
+
+    def _link(idx1, idx2, reason, sim):
+        # union() cuelga la raíz mayor de la menor: el motivo se guarda en esa raíz, que es la que deja
+        # de ser canónica (idx1/idx2 pueden estar ya dentro de otros grupos)
+        root1, root2 = union_find.find(idx1), union_find.find(idx2)
+        if union_find.union(root1, root2):
+            link_reasons[max(root1, root2)] = (reason, sim)
+
+    for key_name, key_func, check_year in _IDENTITY_KEYS:
+        # clave -> representantes: uno solo, o con check_year uno por cada grupo de años incompatibles
+        indices_by_key = {}
+        for idx, entry in enumerate(entries):
+            key = key_func(entry)
+            if not key:
+                continue
+            representatives = indices_by_key.setdefault(key, [])
+            for previous_idx in representatives:
+                if not check_year or _years_compatible_internal(entries[previous_idx], entry, max_year_gap):
+                    _link(previous_idx, idx, key_name, 1.0 if key_name == 'titulo' else None)
+                    break
+            else:
+                representatives.append(idx)
+
+    indices_by_author_year = defaultdict(list)
+    normalized_titles = {}
+    for idx, entry in enumerate(entries):
+        key = _first_author_year_key_internal(entry)
+        if not key:
+            continue
+        normalized_titles[idx] = normalize_title(entry.get('title', ''))
+        for previous_idx in indices_by_author_year[key]:
+            if _titles_compatible_internal(normalized_titles[previous_idx], normalized_titles[idx]):
+                _link(previous_idx, idx, 'autor_año', None)
+                break
+        indices_by_author_year[key].append(idx)
+
+    if near_duplicate_threshold is not None:
+        root_indices = [idx for idx in range(len(entries)) if union_find.find(idx) == idx]
+        root_entries = [entries[idx] for idx in root_indices]
+        for i, j, sim in near_duplicate_pairs(root_entries, threshold=near_duplicate_threshold,
+                                              max_year_gap=max_year_gap):
+            _link(root_indices[i], root_indices[j], 'titulo_similar', sim)
+
+    canonical_of = [union_find.find(idx) for idx in range(len(entries))]
+    merges = []
+    for idx, root in enumerate(canonical_of):
+        if root != idx:
+            reason, sim = link_reasons.get(idx, ('transitivo', None))
+            merges.append((root, idx, reason, sim))
+    return canonical_of, merges
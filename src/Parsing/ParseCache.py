@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+
+# Cambiar esta versión invalida todas las cachés existentes (p. ej. si cambia la customización del Parser)
+CACHE_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+_ENTRIES_SUBDIR = "entries"
+
+
+def _empty_manifest_internal():
+    return {"version": CACHE_VERSION, "files": {}}
+
+
+def _entries_path_internal(cache_dir, content_hash):
+    return os.path.join(cache_dir, _ENTRIES_SUBDIR, f"{content_hash}.json")
+
+
+def _read_cached_entries_internal(cache_dir, content_hash):
+    entries_path = _entries_path_internal(cache_dir, content_hash)
+    if not os.path.exists(entries_path):
+        return None
+    try:
+        with open(entries_path, encoding='utf-8') as entries_file:
+            return json.load(entries_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic_internal(path, data):
+    # Se escribe en un temporal y luego se renombra para no dejar JSON a medias si el proceso se corta
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as tmp_file:
+        json.dump(data, tmp_file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def file_key(file_path, data_root_dir):
+    return os.path.relpath(file_path, data_root_dir).replace(os.sep, '/')
+
+
+def hash_file(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return _empty_manifest_internal()
+    try:
+        with open(manifest_path, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return _empty_manifest_internal()
+    if manifest.get("version") != CACHE_VERSION or not isinstance(manifest.get("files"), dict):
+        return _empty_manifest_internal()
+    return manifest
+
+
+def save_manifest(cache_dir, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_json_atomic_internal(os.path.join(cache_dir, MANIFEST_FILENAME), manifest)
+
+
+def lookup_cached_entries(manifest, cache_dir, file_path, key):
+    """Devuelve (entradas, registro) para file_path.
+
+    Si el tamaño y la fecha de modificación coinciden con el manifiesto no se vuelve a leer
+    el archivo. Si cambiaron, se calcula el hash del contenido: un archivo tocado pero con
+    el mismo contenido (o una copia de otro ya parseado) sigue aprovechando la caché.
+    Cuando hay que parsear de nuevo, entradas es None y registro trae el nuevo hash.
+    """
+    stat = os.stat(file_path)
+    record = manifest["files"].get(key)
+    if record and record.get("size") == stat.st_size and record.get("mtime_ns") == stat.st_mtime_ns:
+        entries = _read_cached_entries_internal(cache_dir, record["hash"])
+        if entries is not None:
+            return entries, record
+
+    new_record = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": hash_file(file_path)}
+    entries = _read_cached_entries_internal(cache_dir, new_record["hash"])
+    if entries is not None:
+        manifest["files"][key] = new_record
+    return entries, new_record
+
+
+def store_entries(manifest, cache_dir, key, record, entries):
+    os.makedirs(os.path.join(cache_dir, _ENTRIES_SUBDIR), exist_ok=True)
+    _write_json_atomic_internal(_entries_path_internal(cache_dir, record["hash"]), entries)
+    manifest["files"][key] = record
+
+
+def prune_manifest(manifest, cache_dir, present_keys):
+    # Quita del manifiesto los archivos que ya no están en data/ y borra las cachés huérfanas
+    present_keys = set(present_keys)
+    for key in [k for k in manifest["files"] if k not in present_keys]:
+        del manifest["files"][key]
+
+    entries_dir = os.path.join(cache_dir, _ENTRIES_SUBDIR)
+    if not os.path.isdir(entries_dir):
+        return
+    live_hashes = {record["hash"] for record in manifest["files"].values()}
+    for filename in os.listdir(entries_dir):
+        content_hash, ext = os.path.splitext(filename)
+        if ext == ".json" and content_hash not in live_hashes:
+            try:
+                os.remove(os.path.join(entries_dir, filename))
+            except OSError:
+                pass
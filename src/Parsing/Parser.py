@@ -1,22 +1,131 @@
 import bibtexparser
+import csv
+import multiprocessing
 import os
-from bibtexparser.bparser import BibTexParser
+import time
+from concurrent.futures import ProcessPoolExecutor
 from bibtexparser.customization import convert_to_unicode
+from src.Parsing import CorpusDB, CorpusStore, Dedup, ParseCache
+from src.Parsing.BibReader import iter_bib_entries
+
+# Los procesos de los pools se crean con 'spawn': la GUI llama desde un hilo de trabajo y hacer fork de un
+# proceso con varios hilos puede dejar al hijo bloqueado en un lock heredado
+_POOL_START_METHOD = 'spawn'
 
 
 def _load_bibtex_file_internal(file_path, status_callback):
     try:
-        with open(file_path, encoding='utf-8') as bibtex_file:
-            parser = BibTexParser()
-            parser.customization = convert_to_unicode
-            parser.ignore_errors = True  # Ignorar errores menores en archivos BibTeX
-            bib_database = bibtexparser.load(bibtex_file, parser=parser)
-            return bib_database.entries
+        # Lectura entrada a entrada: nunca se construye el BibDatabase completo del archivo
+        return list(iter_bib_entries(file_path, convert_to_unicode, status_callback))
     except Exception as e:
         status_callback(f"Parser: Error al cargar {file_path}: {str(e)}")
         return []
 
 
+def _load_bibtex_file_worker_internal(file_path):
+    # Se ejecuta en un proceso del pool: no recibe status_callback (no es serializable),
+    # así que devuelve el error como texto para que el proceso principal lo reporte.
+    start_time = time.perf_counter()
+    errors = []
+    entries = _load_bibtex_file_internal(file_path, errors.append)
+    elapsed = time.perf_counter() - start_time
+    return entries, elapsed, errors
+
+
+def _report_file_throughput_internal(file_path, num_entries, elapsed, status_callback):
+    size_kb = os.path.getsize(file_path) / 1024.0 if os.path.exists(file_path) else 0.0
+    if elapsed > 0:
+        status_callback(
+            f"Parser: {num_entries} entradas cargadas desde {os.path.basename(file_path)} en {elapsed:.2f}s "
+            f"({num_entries / elapsed:.1f} entradas/s, {size_kb / elapsed:.1f} KB/s).")
+    else:
+        status_callback(f"Parser: {num_entries} entradas cargadas desde {os.path.basename(file_path)}.")
+
+
+def _load_bibtex_files_parallel_internal(bibtex_files, status_callback, max_workers=None):
+    # executor.map conserva el orden de bibtex_files, así que la lista combinada es la misma
+    # que en modo secuencial y la deduplicación produce exactamente el mismo resultado.
+    entries_per_file = []
+    chunksize = max(1, len(bibtex_files) // ((max_workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context(_POOL_START_METHOD)) as executor:
+        results = executor.map(_load_bibtex_file_worker_internal, bibtex_files, chunksize=chunksize)
+        for file_path, (entries, elapsed, errors) in zip(bibtex_files, results):
+            for error_msg in errors:
+                status_callback(error_msg)
+            entries_per_file.append(entries)
+            _report_file_throughput_internal(file_path, len(entries), elapsed, status_callback)
+    return entries_per_file
+
+
+def _load_bibtex_files_internal(bibtex_files, status_callback, parallel=False, max_workers=None):
+    # Devuelve una lista de entradas por archivo, en el mismo orden que bibtex_files
+    if parallel and len(bibtex_files) > 1:
+        status_callback(
+            f"Parser: Cargando {len(bibtex_files)} archivos en paralelo ({max_workers or os.cpu_count()} procesos)...")
+        try:
+            return _load_bibtex_files_parallel_internal(bibtex_files, status_callback, max_workers)
+        except Exception as e:
+            # Si el pool no puede arrancar (p. ej. entorno sin soporte de procesos) se vuelve al modo secuencial
+            status_callback(f"Parser: Error en la carga paralela ({e}). Se continuará en modo secuencial.")
+
+    entries_per_file = []
+    for file_path in bibtex_files:
+        status_callback(f"Parser: Procesando: {os.path.basename(file_path)}")
+        file_start_time = time.perf_counter()
+        entries = _load_bibtex_file_internal(file_path, status_callback)
+        entries_per_file.append(entries)
+        _report_file_throughput_internal(file_path, len(entries), time.perf_counter() - file_start_time,
+                                         status_callback)
+    return entries_per_file
+
+
+def _load_bibtex_files_incremental_internal(bibtex_files, data_root_dir, cache_dir, status_callback,
+                                            parallel=False, max_workers=None):
+    # Solo se parsean los archivos nuevos o modificados; el resto se lee de la caché del manifiesto
+    manifest = ParseCache.load_manifest(cache_dir)
+    keys = [ParseCache.file_key(file_path, data_root_dir) for file_path in bibtex_files]
+    entries_per_file = [None] * len(bibtex_files)
+    pending_indices = []
+    pending_records = {}
+
+    for idx, (file_path, key) in enumerate(zip(bibtex_files, keys)):
+        try:
+            cached_entries, record = ParseCache.lookup_cached_entries(manifest, cache_dir, file_path, key)
+        except OSError as e:
+            status_callback(f"Parser: No se pudo consultar la caché para {os.path.basename(file_path)}: {e}")
+            cached_entries, record = None, None
+        if cached_entries is not None:
+            entries_per_file[idx] = cached_entries
+        else:
+            pending_indices.append(idx)
+            pending_records[idx] = record
+
+    status_callback(
+        f"Parser: Caché incremental: {len(bibtex_files) - len(pending_indices)} archivos sin cambios, "
+        f"{len(pending_indices)} nuevos o modificados.")
+
+    if pending_indices:
+        pending_files = [bibtex_files[idx] for idx in pending_indices]
+        parsed_per_file = _load_bibtex_files_internal(pending_files, status_callback, parallel, max_workers)
+        for idx, entries in zip(pending_indices, parsed_per_file):
+            entries_per_file[idx] = entries
+            record = pending_records[idx]
+            if record is None:
+                continue
+            try:
+                ParseCache.store_entries(manifest, cache_dir, keys[idx], record, entries)
+            except OSError as e:
+                status_callback(f"Parser: No se pudo guardar la caché de {os.path.basename(bibtex_files[idx])}: {e}")
+
+    ParseCache.prune_manifest(manifest, cache_dir, keys)
+    try:
+        ParseCache.save_manifest(cache_dir, manifest)
+    except OSError as e:
+        status_callback(f"Parser: No se pudo guardar el manifiesto de caché: {e}")
+    return entries_per_file
+
+
 def _find_bib_files_internal(data_root_dir, status_callback):
     bib_files = []
     status_callback(f"Parser: Buscando archivos .bib/.bibtex en: {os.path.abspath(data_root_dir)}")
@@ -37,6 +146,14 @@ def _find_bib_files_internal(data_root_dir, status_callback):
     return bib_files
 
 
+def _bib_write_order_internal(entries, order_entries_by):
+    # Orden en que BibTexWriter escribe las entradas (por ID, salvo que se configure otro)
+    if not order_entries_by:
+        return range(len(entries))
+    return sorted(range(len(entries)), key=lambda idx: bibtexparser.bibdatabase.BibDatabase.entry_sort_key(
+        entries[idx], order_entries_by))
+
+
 def _save_bib_internal(entries, filename, output_dir, status_callback):
     if not entries:
         status_callback(f"Parser: No hay entradas para guardar en {filename}")
@@ -46,19 +163,54 @@ def _save_bib_internal(entries, filename, output_dir, status_callback):
     file_path = os.path.join(output_dir, filename)
 
     try:
-        db = bibtexparser.bibdatabase.BibDatabase()
-        db.entries = entries
         writer = bibtexparser.bwriter.BibTexWriter()
         writer.indent = '  '  # Para mejor legibilidad
         writer.comma_first = False
-        with open(file_path, 'w', encoding='utf-8') as bibfile:
-            bibfile.write(writer.write(db))
+        # Escritura entrada a entrada en un archivo con buffer, en lugar de generar con writer.write(db)
+        # un único string con todo el archivo: cada entrada pasa por writer.write con una base de una sola
+        # entrada (API pública). Se respeta el orden por ID que aplica BibTexWriter.
+        single_entry_db = bibtexparser.bibdatabase.BibDatabase()
+        write_order = _bib_write_order_internal(entries, writer.order_entries_by)
+        with open(file_path, 'w', encoding='utf-8', buffering=1 << 20) as bibfile:
+            for position, idx in enumerate(write_order):
+                if position:
+                    bibfile.write(writer.entry_separator)
+                single_entry_db.entries = [entries[idx]]
+                bibfile.write(writer.write(single_entry_db))
         status_callback(f"Parser: Archivo guardado: {file_path} ({len(entries)} entradas)")
     except Exception as e:
         status_callback(f"Parser: Error al guardar {file_path}: {str(e)}")
 
 
-def run_parser(status_callback, project_root_dir):
+def _compact_duplicate_entries_internal(all_entries, canonical_of):
+    # Referencia mínima al registro canónico mediante el campo estándar crossref de BibTeX
+    return [{'ENTRYTYPE': entry.get('ENTRYTYPE', 'misc'), 'ID': entry.get('ID', ''),
+             'crossref': all_entries[canonical_of[idx]].get('ID', '')}
+            for idx, entry in enumerate(all_entries) if canonical_of[idx] != idx]
+
+
+def _write_duplicates_report_internal(merges, entries, output_dir, status_callback):
+    report_path = os.path.join(output_dir, 'duplicates_report.csv')
+    try:
+        with open(report_path, 'w', newline='', encoding='utf-8') as csvfile:
+            fieldnames = ["ID_Canonico", "Titulo_Canonico", "ID_Duplicado", "Titulo_Duplicado", "Motivo",
+                          "Sim_Titulo"]
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer.writeheader()
+            for canonical_idx, duplicate_idx, reason, sim in merges:
+                canonical_entry, duplicate_entry = entries[canonical_idx], entries[duplicate_idx]
+                writer.writerow({
+                    "ID_Canonico": canonical_entry.get('ID', ''), "Titulo_Canonico": canonical_entry.get('title', ''),
+                    "ID_Duplicado": duplicate_entry.get('ID', ''), "Titulo_Duplicado": duplicate_entry.get('title', ''),
+                    "Motivo": reason, "Sim_Titulo": round(sim, 4) if sim is not None else ''
+                })
+        status_callback(f"Parser: Reporte de duplicados guardado: {report_path} ({len(merges)} fusiones)")
+    except Exception as e:
+        status_callback(f"Parser: Error al guardar {report_path}: {str(e)}")
+
+
+def run_parser(status_callback, project_root_dir, parallel=False, max_workers=None, incremental=False,
+               near_duplicate_threshold=0.9, write_store=True, compact_duplicates=False, write_db=False):
     status_callback("Iniciando Parser...")
 
     data_dir = os.path.join(project_root_dir, "data")
@@ -73,38 +225,153 @@ def run_parser(status_callback, project_root_dir):
         status_callback("Parser completado (sin archivos).")
         return
 
-    all_entries = []
-    for file_path in bibtex_files:
-        status_callback(f"Parser: Procesando: {os.path.basename(file_path)}")
-        entries = _load_bibtex_file_internal(file_path, status_callback)
-        all_entries.extend(entries)
-        status_callback(f"Parser: {len(entries)} entradas cargadas desde {os.path.basename(file_path)}.")
+    load_start_time = time.perf_counter()
+    if incremental:
+        cache_dir = os.path.join(output_parsing_dir, "cache")
+        entries_per_file = _load_bibtex_files_incremental_internal(bibtex_files, data_dir, cache_dir,
+                                                                   status_callback, parallel, max_workers)
+    else:
+        entries_per_file = _load_bibtex_files_internal(bibtex_files, status_callback, parallel, max_workers)
+    all_entries = [entry for entries in entries_per_file for entry in entries]
+    # Fuente de cada entrada: la subcarpeta de data/ de la que viene ("Academic Search", "ScienceDirect", ...)
+    all_sources = [ParseCache.file_key(file_path, data_dir).split('/')[0]
+                   for file_path, entries in zip(bibtex_files, entries_per_file) for _ in entries]
 
-    status_callback(f"Parser: Total de registros cargados: {len(all_entries)}")
+    load_elapsed = time.perf_counter() - load_start_time
+    status_callback(f"Parser: Total de registros cargados: {len(all_entries)} en {load_elapsed:.2f}s")
     if not all_entries:
         status_callback("Parser: No se cargaron entradas. Verifique los archivos BibTeX.")
         status_callback("Parser completado (sin entradas).")
         return
 
-    seen_titles = set()
-    unique_entries = []
-    duplicate_entries = []
+    # Índice de identidad: DOI normalizado, título normalizado y primer autor + año en dicts hash,
+    # unidos con union-find (O(n)). Además, MinHash/LSH agrupa títulos casi iguales (puntuación,
+    # llaves LaTeX, subtítulos) sin comparar todas las parejas.
+    dedup_start_time = time.perf_counter()
+    canonical_of, merges = Dedup.deduplicate_entries(all_entries, near_duplicate_threshold=near_duplicate_threshold)
+    unique_entries = [entry for idx, entry in enumerate(all_entries) if canonical_of[idx] == idx]
+    duplicate_entries = [entry for idx, entry in enumerate(all_entries) if canonical_of[idx] != idx]
 
-    for entry in all_entries:
-        title = entry.get('title', '').strip().lower()
-        # Un ID único podría ser mejor si está disponible (ej. DOI)
-        # entry_id = entry.get('ID', title) # Usar ID si existe, sino título
-        if title and title in seen_titles:  # Solo considerar duplicados si hay título
-            duplicate_entries.append(entry)
-        else:
-            if title:  # Añadir a seen_titles solo si hay título
-                seen_titles.add(title)
-            unique_entries.append(entry)  # Añadir todas las entradas a unique_entries, incluso las sin título
+    reason_counts = {}
+    for _, _, reason, _ in merges:
+        reason_counts[reason] = reason_counts.get(reason, 0) + 1
+    status_callback(
+        f"Parser: Deduplicación en {time.perf_counter() - dedup_start_time:.2f}s. Fusiones por motivo: "
+        + (", ".join(f"{reason}={count}" for reason, count in sorted(reason_counts.items())) or "ninguna"))
+    _write_duplicates_report_internal(merges, all_entries, output_parsing_dir, status_callback)
 
     status_callback(f"Parser: Registros únicos (o sin título): {len(unique_entries)}")
-    status_callback(f"Parser: Registros duplicados (basado en título): {len(duplicate_entries)}")
+    status_callback(f"Parser: Registros duplicados (DOI, título o autor+año): {len(duplicate_entries)}")
 
     _save_bib_internal(unique_entries, 'unificados.bib', output_parsing_dir, status_callback)
-    _save_bib_internal(duplicate_entries, 'duplicados.bib', output_parsing_dir, status_callback)
+    if compact_duplicates:
+        _save_bib_internal(_compact_duplicate_entries_internal(all_entries, canonical_of), 'duplicados.bib',
+                           output_parsing_dir, status_callback)
+    else:
+        _save_bib_internal(duplicate_entries, 'duplicados.bib', output_parsing_dir, status_callback)
+
+    # Almacén columnar del corpus unificado: Normalizer, Similitud y Stats lo leen en vez de re-parsear el BibTeX
+    unified_bib_path = os.path.join(output_parsing_dir, 'unificados.bib')
+    # Mismo orden de filas que unificados.bib, para que almacén, base SQLite y BibTeX sean intercambiables
+    write_order = _bib_write_order_internal(unique_entries, bibtexparser.bwriter.BibTexWriter().order_entries_by)
+    if write_store and os.path.exists(unified_bib_path):
+        store_dir = os.path.join(output_parsing_dir, 'corpus_store')
+        try:
+            store_start_time = time.perf_counter()
+            CorpusStore.write_corpus_store([unique_entries[idx] for idx in write_order], store_dir, unified_bib_path)
+            status_callback(f"Parser: Almacén columnar guardado en {store_dir} "
+                            f"({time.perf_counter() - store_start_time:.2f}s)")
+        except Exception as e:
+            status_callback(f"Parser: Error al guardar el almacén columnar: {str(e)}")
+
+    # Base SQLite con índices FTS5 (título/abstract/keywords) y B-tree (año, tipo, journal, fuente)
+    if write_db and os.path.exists(unified_bib_path):
+        db_path = os.path.join(output_parsing_dir, CorpusDB.DB_FILENAME)
+        unique_sources = [source for idx, source in enumerate(all_sources) if canonical_of[idx] == idx]
+        try:
+            db_start_time = time.perf_counter()
+            CorpusDB.write_corpus_db([unique_entries[idx] for idx in write_order], db_path, unified_bib_path,
+                                     [unique_sources[idx] for idx in write_order], status_callback)
+            status_callback(f"Parser: Base de datos del corpus guardada en {db_path} "
+                            f"({time.perf_counter() - db_start_time:.2f}s)")
+        except Exception as e:
+            status_callback(f"Parser: Error al guardar la base de datos del corpus: {str(e)}")
+
+    status_callback("Parser completado.")
+
+
+def run_watcher(status_callback, project_root_dir, stop_event, poll_interval=2.0, settle_polls=2, max_workers=None):
+    # Modo "watch": mientras los scrapers descargan, revisa data/ cada poll_interval segundos y parsea
+    # en segundo plano cada archivo .bib/.bibtex terminado, guardándolo en la caché incremental.
+    # Al terminar el scraping, run_parser(incremental=True) encuentra casi todo ya parseado.
+    # Se usa sondeo (polling) en lugar de inotify para que funcione igual en Windows, Linux y macOS.
+    status_callback("Iniciando Parser en modo watch...")
+    data_dir = os.path.join(project_root_dir, "data")
+    cache_dir = os.path.join(project_root_dir, "output", "parsing", "cache")
+    manifest = ParseCache.load_manifest(cache_dir)
+
+    last_seen = {}  # file_path -> ((tamaño, mtime_ns), número de sondeos seguidos sin cambios)
+    handled = {}  # file_path -> (tamaño, mtime_ns) ya cacheado o enviado a parsear
+    pending = {}  # future -> (file_path, key, registro)
+    parsed_files = 0
+
+    def _collect_finished(wait_all=False):
+        nonlocal parsed_files
+        for future in list(pending):
+            if not (wait_all or future.done()):
+                continue
+            file_path, key, record = pending.pop(future)
+            try:
+                entries, elapsed, errors = future.result()
+            except Exception as e:
+                status_callback(f"Parser (watch): Error al parsear {os.path.basename(file_path)}: {e}")
+                handled.pop(file_path, None)  # Se reintentará en el siguiente sondeo
+                continue
+            for error_msg in errors:
+                status_callback(error_msg)
+            _report_file_throughput_internal(file_path, len(entries), elapsed, status_callback)
+            try:
+                ParseCache.store_entries(manifest, cache_dir, key, record, entries)
+                ParseCache.save_manifest(cache_dir, manifest)
+                parsed_files += 1
+            except OSError as e:
+                status_callback(f"Parser (watch): No se pudo guardar la caché de {os.path.basename(file_path)}: {e}")
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context(_POOL_START_METHOD)) as executor:
+        while True:
+            stopping = stop_event.is_set()
+            # _find_bib_files_internal ya ignora descargas parciales (.crdownload, .part, .tmp) por su extensión
+            for file_path in _find_bib_files_internal(data_dir, lambda message: None):
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if handled.get(file_path) == signature:
+                    continue
+                previous_signature, stable_polls = last_seen.get(file_path, (None, 0))
+                stable_polls = stable_polls + 1 if previous_signature == signature else 0
+                last_seen[file_path] = (signature, stable_polls)
+                # Un archivo se da por completo cuando su tamaño y fecha no cambian durante settle_polls sondeos
+                # (al detener el watch ya no se espera más: los scrapers terminaron)
+                if stat.st_size == 0 or (stable_polls < settle_polls and not stopping):
+                    continue
+
+                key = ParseCache.file_key(file_path, data_dir)
+                try:
+                    cached_entries, record = ParseCache.lookup_cached_entries(manifest, cache_dir, file_path, key)
+                except OSError:
+                    continue
+                handled[file_path] = signature
+                if cached_entries is not None:
+                    continue
+                status_callback(f"Parser (watch): Nuevo archivo completo: {os.path.basename(file_path)}")
+                pending[executor.submit(_load_bibtex_file_worker_internal, file_path)] = (file_path, key, record)
+
+            _collect_finished(wait_all=stopping)
+            if stopping:
+                break
+            stop_event.wait(poll_interval)
 
-    status_callback("Parser completado.")
\ No newline at end of file
+    status_callback(f"Parser (watch): Detenido. {parsed_files} archivos nuevos parseados y guardados en caché.")
@@ -1,38 +1,69 @@
-import bibtexparser
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 import os
+import sqlite3
+import sys
+from src.Parsing import CorpusDB, CorpusStore
+from src.Parsing.BibReader import iter_bib_entries
 
 plt.switch_backend('Agg')
 
+# Únicas columnas que usan los gráficos; el resto de campos (abstract, keywords...) no se carga
+_STATS_COLUMNS = ('author', 'ENTRYTYPE', 'year', 'journal', 'publisher')
+# Caracteres que quita str.strip(), para recortar el primer autor en SQL igual que en pandas
+_WHITESPACE = ''.join(chr(code) for code in range(sys.maxunicode + 1) if chr(code).isspace())
+# Primer autor en SQL: lo anterior al primer ' and ', sin espacios a los lados
+_PRIMER_AUTOR_SQL = ("trim(CASE WHEN instr(author, ' and ') > 0 THEN substr(author, 1, instr(author, ' and ') - 1) "
+                     "ELSE author END, ?)")
+_AÑO_MINIMO = 1980
+
 
 def _bib_to_dataframe_internal(bib_file, status_callback):
     if not os.path.exists(bib_file):
         status_callback(f"Stats: Error - No se encontró el archivo BibTeX unificado: {bib_file}")
         return pd.DataFrame()
     try:
-        with open(bib_file, encoding='utf-8') as bibtex_file:
-            parser = bibtexparser.bparser.BibTexParser()
-            parser.customization = bibtexparser.customization.convert_to_unicode
-            parser.ignore_errors = True
-            bib_database = bibtexparser.load(bibtex_file, parser=parser)
-            df = pd.DataFrame(bib_database.entries)
-            status_callback(f"Stats: Archivo {os.path.basename(bib_file)} cargado, {len(df)} registros.")
+        store_dir = os.path.join(os.path.dirname(bib_file), "corpus_store")
+        columns = CorpusStore.load_corpus_columns(store_dir, _STATS_COLUMNS, bib_file, 'unicode')
+        if columns is not None:
+            df = pd.DataFrame(columns)
+            status_callback(f"Stats: Almacén columnar cargado, {len(df)} registros.")
             return df
+        records = (
+            {column: entry[column] for column in _STATS_COLUMNS if column in entry}
+            for entry in iter_bib_entries(bib_file, CorpusStore.NORMALIZATIONS['unicode'], status_callback)
+        )
+        df = pd.DataFrame.from_records(records)
+        status_callback(f"Stats: Archivo {os.path.basename(bib_file)} cargado, {len(df)} registros.")
+        return df
     except Exception as e:
         status_callback(f"Stats: Error al cargar {bib_file}: {str(e)}")
         return pd.DataFrame()
 
 
+def _db_top_valores_internal(db_path, columna, expresion=None, params=(), top_n=15):
+    # Top N contado en SQL. Los empates se ordenan por primera aparición (MIN(rowid)), como value_counts
+    # sobre el DataFrame en el orden de unificados.bib.
+    filas = CorpusDB.query_corpus(
+        db_path,
+        f"SELECT {expresion or columna} AS valor, COUNT(*) AS cantidad FROM entries WHERE {columna} IS NOT NULL "
+        f"GROUP BY valor ORDER BY cantidad DESC, MIN(rowid) LIMIT ?",
+        tuple(params) + (top_n,))
+    return pd.Series([fila['cantidad'] for fila in filas], index=[fila['valor'] for fila in filas], dtype='int64')
+
+
 def _graficar_top_columna_internal(df, columna, titulo, nombre_archivo_salida, status_callback, top_n=15):
     if columna not in df.columns or df[columna].isnull().all():
         status_callback(f"Stats: La columna '{columna}' no existe o está vacía. No se generará el gráfico '{titulo}'.")
         return
+    # Limpiar valores NaN antes de contar y tomar el top N
+    top_valores = df[columna].dropna().value_counts().nlargest(top_n)
+    _graficar_top_valores_internal(top_valores, columna, titulo, nombre_archivo_salida, status_callback)
+
 
+def _graficar_top_valores_internal(top_valores, columna, titulo, nombre_archivo_salida, status_callback):
     try:
-        # Limpiar valores NaN antes de contar y tomar el top N
-        top_valores = df[columna].dropna().value_counts().nlargest(top_n)
         if top_valores.empty:
             status_callback(f"Stats: No hay datos suficientes en la columna '{columna}' para el gráfico '{titulo}'.")
             return
@@ -61,6 +92,55 @@ def _graficar_top_columna_internal(df, columna, titulo, nombre_archivo_salida, s
         status_callback(traceback.format_exc())
 
 
+def _graficar_tipo_año_internal(df_tipo_año, output_visual_dir, status_callback):
+    # df_tipo_año: filas (ENTRYTYPE, year int) ya filtradas a años de 4 dígitos entre 1980 y el año actual
+    if df_tipo_año.empty:
+        status_callback(
+            "Stats: No hay datos de año/tipo válidos después del filtrado para el gráfico de publicaciones.")
+        return
+    orden_anios = sorted(df_tipo_año['year'].unique())
+    plt.figure(figsize=(14, 7))
+    sns.countplot(data=df_tipo_año, x='year', hue='ENTRYTYPE', order=orden_anios, palette="viridis")
+    plt.title("Número de publicaciones por año y tipo", fontsize=14)
+    plt.xlabel("Año", fontsize=12)
+    plt.ylabel("Cantidad", fontsize=12)
+    plt.xticks(rotation=45, ha="right", fontsize=10)
+    plt.yticks(fontsize=10)
+    plt.legend(title="Tipo", fontsize=10)
+    plt.tight_layout()
+    plt.savefig(os.path.join(output_visual_dir, 'stats_publicaciones_por_año_tipo.png'), dpi=150)
+    plt.close()
+    status_callback(f"Stats: Gráfico guardado: stats_publicaciones_por_año_tipo.png")
+
+
+def _run_stats_db_internal(db_path, output_visual_dir, status_callback):
+    # Mismos gráficos que con el DataFrame, pero el conteo, el top N y el filtro de años los hace SQLite
+    # (índices sobre year, entrytype y journal) y solo vuelven a Python los agregados.
+    status_callback(f"Stats: Consultando la base del corpus {db_path}.")
+    _graficar_top_valores_internal(
+        _db_top_valores_internal(db_path, 'author', _PRIMER_AUTOR_SQL, (_WHITESPACE,)),
+        'primer_autor', 'Top 15 Autores (Primer Autor)',
+        os.path.join(output_visual_dir, 'stats_top_primeros_autores.png'), status_callback)
+
+    filas = CorpusDB.query_corpus(
+        db_path,
+        "SELECT entrytype, year FROM entries WHERE entrytype IS NOT NULL "
+        "AND year_text GLOB '[0-9][0-9][0-9][0-9]' AND year BETWEEN ? AND ? ORDER BY rowid",
+        (_AÑO_MINIMO, pd.Timestamp.now().year))
+    df_tipo_año = pd.DataFrame({'ENTRYTYPE': [fila['entrytype'] for fila in filas],
+                                'year': [fila['year'] for fila in filas]})
+    _graficar_tipo_año_internal(df_tipo_año, output_visual_dir, status_callback)
+
+    _graficar_top_valores_internal(_db_top_valores_internal(db_path, 'entrytype'), 'ENTRYTYPE',
+                                   'Distribución por Tipo de Producto',
+                                   os.path.join(output_visual_dir, 'stats_tipo_producto.png'), status_callback)
+    _graficar_top_valores_internal(_db_top_valores_internal(db_path, 'journal'), 'journal', 'Top 15 Journals',
+                                   os.path.join(output_visual_dir, 'stats_top_journals.png'), status_callback)
+    _graficar_top_valores_internal(_db_top_valores_internal(db_path, 'publisher'), 'publisher', 'Top 15 Publishers',
+                                   os.path.join(output_visual_dir, 'stats_top_publishers.png'), status_callback)
+    status_callback("Stats completado.")
+
+
 def run_stats(status_callback, project_root_dir):
     status_callback("Iniciando Generador de Estadísticas...")
 
@@ -68,6 +148,15 @@ def run_stats(status_callback, project_root_dir):
     output_visual_dir = os.path.join(project_root_dir, "output", "visual")
     os.makedirs(output_visual_dir, exist_ok=True)
 
+    # Si el Parser escribió la base SQLite y corresponde al unificados.bib actual, se consulta ella
+    db_path = os.path.join(project_root_dir, "output", "parsing", CorpusDB.DB_FILENAME)
+    if CorpusDB.is_current(db_path, bib_file_input):
+        try:
+            _run_stats_db_internal(db_path, output_visual_dir, status_callback)
+            return
+        except sqlite3.Error as e:
+            status_callback(f"Stats: Error consultando {db_path} ({e}); se usa unificados.bib.")
+
     df = _bib_to_dataframe_internal(bib_file_input, status_callback)
 
     if df.empty:
@@ -95,25 +184,8 @@ def run_stats(status_callback, project_root_dir):
 
             # Filtrar años dentro de un rango razonable si es necesario (ej. 1980-año actual)
             current_year = pd.Timestamp.now().year
-            df_tipo_año = df_tipo_año[(df_tipo_año['year'] >= 1980) & (df_tipo_año['year'] <= current_year)]
-
-            if not df_tipo_año.empty:
-                orden_anios = sorted(df_tipo_año['year'].unique())
-                plt.figure(figsize=(14, 7))
-                sns.countplot(data=df_tipo_año, x='year', hue='ENTRYTYPE', order=orden_anios, palette="viridis")
-                plt.title("Número de publicaciones por año y tipo", fontsize=14)
-                plt.xlabel("Año", fontsize=12)
-                plt.ylabel("Cantidad", fontsize=12)
-                plt.xticks(rotation=45, ha="right", fontsize=10)
-                plt.yticks(fontsize=10)
-                plt.legend(title="Tipo", fontsize=10)
-                plt.tight_layout()
-                plt.savefig(os.path.join(output_visual_dir, 'stats_publicaciones_por_año_tipo.png'), dpi=150)
-                plt.close()
-                status_callback(f"Stats: Gráfico guardado: stats_publicaciones_por_año_tipo.png")
-            else:
-                status_callback(
-                    "Stats: No hay datos de año/tipo válidos después del filtrado para el gráfico de publicaciones.")
+            df_tipo_año = df_tipo_año[(df_tipo_año['year'] >= _AÑO_MINIMO) & (df_tipo_año['year'] <= current_year)]
+            _graficar_tipo_año_internal(df_tipo_año, output_visual_dir, status_callback)
         else:
             status_callback("Stats: No hay datos de año/tipo para el gráfico de publicaciones.")
 
@@ -130,4 +202,4 @@ def run_stats(status_callback, project_root_dir):
         _graficar_top_columna_internal(df, 'publisher', 'Top 15 Publishers',
                                        os.path.join(output_visual_dir, 'stats_top_publishers.png'), status_callback)
 
-    status_callback("Stats completado.")
\ No newline at end of file
+    status_callback("Stats completado.")
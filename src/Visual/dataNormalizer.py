@@ -1,11 +1,17 @@
 import csv
+import multiprocessing
 import os
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import homogenize_latex_encoding, convert_to_unicode
-from collections import Counter
-from itertools import combinations
 import re
+from bisect import bisect_right
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, combinations, islice
+import numpy as np
+from src.Parsing import CorpusStore
+from src.Parsing.BibReader import iter_bib_entries
+from src.Visual import incidenceMatrix, termIndex, trendCube
+from src.Visual.termMatcher import TermMatcher
 
 # STOP_WORDS se mantiene igual que en tu script original
 
@@ -77,110 +83,354 @@ def _load_variables_and_categories_internal(variables_csv_path, status_callback)
     return search_map, category_map, sorted_search_terms
 
 
-def _process_bibtex_data_internal(bibtex_file_path, search_map, category_map, sorted_search_terms, status_callback):
+# Entradas por bloque de trabajo: cada bloque se procesa entero en un mismo proceso
+_CHUNK_SIZE = 500
+
+# Campos en los que se buscan las variables; el código de campo del índice invertido es la posición en la tupla
+INDEXED_FIELDS = ('title', 'abstract', 'keywords')
+# Separador entre campos en el texto combinado de cada entrada: ninguna clave lo contiene, así que ninguna
+# coincidencia cruza de un campo a otro, y al no ser carácter de palabra los límites se comportan como
+# el inicio/fin de cada campo por separado
+_FIELD_SEPARATOR = '\n'
+
+# Ámbitos de co-ocurrencia: toda la entrada, la misma oración o una ventana de k tokens
+COOCCURRENCE_SCOPES = ('document', 'sentence', 'window')
+_DEFAULT_WINDOW_SIZE = 10
+_SENTENCE_END_RE = re.compile(r'[.!?]+(?=\s|$)')
+_TOKEN_RE = re.compile(r'\w+')
+
+# Los procesos del pool se crean con 'spawn': la GUI llama desde un hilo de trabajo y hacer fork de un
+# proceso con varios hilos puede dejar al hijo bloqueado en un lock heredado
+_POOL_START_METHOD = 'spawn'
+# Bloques en vuelo por proceso: acota los bloques leídos y los resultados pendientes en memoria
+_CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# Configuración del proceso trabajador (se recibe una sola vez en el initializer del pool):
+# (autómata, tamaño de ventana, códigos de los campos buscados)
+_worker_args = None
+
+
+def _init_extraction_worker_internal(matcher, window_size, field_codes):
+    global _worker_args
+    _worker_args = (matcher, window_size, field_codes)
+
+
+def _iter_chunks_internal(records, chunk_size, fields):
+    chunk = []
+    for entry in records:
+        chunk.append((entry.get('ID', ''), tuple(entry.get(field, '') for field in fields), entry.get('year')))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _scoped_pairs_internal(text, occurrences, window_size, num_variables, field_starts):
+    # Pares de variables (codificados a * V + b, con a < b) que comparten oración o ventana de tokens,
+    # calculados a partir de los offsets de las coincidencias: el autómata no vuelve a recorrer el texto.
+    # El comienzo de cada campo cierra la oración anterior y ninguna ventana abarca dos campos.
+    occurrences.sort()
+    sentence_ends = sorted([match.end() for match in _SENTENCE_END_RE.finditer(text)] + field_starts[1:])
+    token_starts = [match.start() for match in _TOKEN_RE.finditer(text)]
+    field_gap = len(text) + window_size + 1
+    sentences = {}
+    token_positions = []
+    for start, canonical_idx in occurrences:
+        sentences.setdefault(bisect_right(sentence_ends, start), set()).add(canonical_idx)
+        field_pos = bisect_right(field_starts, start) - 1
+        token_positions.append(bisect_right(token_starts, start) - 1 + field_pos * field_gap)
+
+    sentence_pairs = set()
+    for sentence_variables in sentences.values():
+        for source, target in combinations(sorted(sentence_variables), 2):
+            sentence_pairs.add(source * num_variables + target)
+
+    window_pairs = set()
+    for i, (_, source) in enumerate(occurrences):
+        for j in range(i + 1, len(occurrences)):
+            if token_positions[j] - token_positions[i] > window_size:
+                break
+            target = occurrences[j][1]
+            if source != target:
+                window_pairs.add(min(source, target) * num_variables + max(source, target))
+    return sentence_pairs, window_pairs
+
+
+def _extract_chunk_internal(matcher, chunk, window_size, field_codes):
+    # Filas CSR parciales de un bloque de entradas (índices ordenados de las variables de cada entrada)
+    # y, de la misma pasada, las apariciones posicionales y los pares por oración y por ventana
+    num_variables = len(matcher.canonical_names)
+    entry_ids = []
+    row_lengths = np.zeros(len(chunk), dtype=np.int32)
+    indices = []
+    post_rows, post_variables, post_fields, post_offsets = [], [], [], []
+    sentence_pairs, window_pairs = [], []
+    row_years = np.zeros(len(chunk), dtype=np.int32)
+    for row, (entry_id, field_texts_raw, year) in enumerate(chunk):
+        entry_ids.append(entry_id)
+        row_years[row] = trendCube.parse_year(year)
+        field_texts = [_normalize_text_internal(text_raw) if text_raw else "" for text_raw in field_texts_raw]
+        if not any(field_texts):  # Solo buscar si la entrada tiene algún campo con texto
+            continue
+        # Los campos se unen en un solo texto: una sola pasada del autómata encuentra todas las apariciones
+        # y el offset de cada una indica a qué campo pertenece
+        combined_text = _FIELD_SEPARATOR.join(field_texts)
+        field_starts = []
+        position = 0
+        for text in field_texts:
+            field_starts.append(position)
+            position += len(text) + len(_FIELD_SEPARATOR)
+        occurrences = []
+        for start, _, key_idx in matcher.iter_matches(combined_text):
+            canonical_idx = matcher.key_canonical[key_idx]
+            field_pos = bisect_right(field_starts, start) - 1
+            occurrences.append((start, canonical_idx))
+            post_rows.append(row)
+            post_variables.append(canonical_idx)
+            post_fields.append(field_codes[field_pos])
+            post_offsets.append(start - field_starts[field_pos])
+        found_indices = sorted({canonical_idx for _, canonical_idx in occurrences})
+        row_lengths[row] = len(found_indices)
+        indices.extend(found_indices)
+        if len(found_indices) >= 2:
+            entry_sentence_pairs, entry_window_pairs = _scoped_pairs_internal(combined_text, occurrences,
+                                                                              window_size, num_variables,
+                                                                              field_starts)
+            sentence_pairs.extend(entry_sentence_pairs)
+            window_pairs.extend(entry_window_pairs)
+    return {"entry_ids": entry_ids, "row_lengths": row_lengths, "indices": np.asarray(indices, dtype=np.int32),
+            "row_years": row_years,
+            "post_rows": np.asarray(post_rows, dtype=np.int32),
+            "post_variables": np.asarray(post_variables, dtype=np.int32),
+            "post_fields": np.asarray(post_fields, dtype=np.int8),
+            "post_offsets": np.asarray(post_offsets, dtype=np.int32),
+            "sentence_pairs": np.asarray(sentence_pairs, dtype=np.int64),
+            "window_pairs": np.asarray(window_pairs, dtype=np.int64)}
+
+
+def _extract_chunk_worker_internal(chunk):
+    return _extract_chunk_internal(_worker_args[0], chunk, _worker_args[1], _worker_args[2])
+
+
+def _concat_key_internal(partials, key, dtype):
+    if not partials:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate([partial[key] for partial in partials]).astype(dtype, copy=False)
+
+
+def _pair_counts_internal(pair_codes, num_variables):
+    # Cada entrada aporta cada par una sola vez: el peso es el número de entradas, como en el ámbito documento
+    codes, weights = np.unique(pair_codes, return_counts=True)
+    return codes // num_variables, codes % num_variables, weights
+
+
+def _concat_partials_internal(partials, matcher):
+    # Los bloques se concatenan en el orden de las entradas: el resultado no depende del modo (serie/paralelo)
+    num_variables = len(matcher.canonical_names)
+    entry_ids = [entry_id for partial in partials for entry_id in partial["entry_ids"]]
+    indptr, indices = incidenceMatrix.build_csr(_concat_key_internal(partials, "row_lengths", np.int32),
+                                                _concat_key_internal(partials, "indices", np.int32))
+
+    # Las filas de cada bloque son locales: se desplazan por el número de entradas de los bloques anteriores
+    row_starts = np.cumsum([0] + [len(partial["entry_ids"]) for partial in partials[:-1]])
+    for partial, row_start in zip(partials, row_starts):
+        partial["post_rows"] = partial["post_rows"] + row_start
+    postings = termIndex.build_postings(_concat_key_internal(partials, "post_variables", np.int32),
+                                        _concat_key_internal(partials, "post_rows", np.int32),
+                                        _concat_key_internal(partials, "post_fields", np.int8),
+                                        _concat_key_internal(partials, "post_offsets", np.int32),
+                                        num_variables)
+    scoped_pairs = {
+        scope: _pair_counts_internal(_concat_key_internal(partials, f"{scope}_pairs", np.int64), num_variables)
+        for scope in ('sentence', 'window')
+    }
+    return {"indptr": indptr, "indices": indices, "entry_ids": entry_ids, "variables": matcher.canonical_names,
+            "row_years": _concat_key_internal(partials, "row_years", np.int32),
+            "postings": postings, "scoped_pairs": scoped_pairs}
+
+
+def _iter_extract_chunks_parallel_internal(chunks, matcher, window_size, field_codes, status_callback,
+                                           max_workers=None):
+    # Genera (bloque, parcial) en el orden de los bloques. Los bloques se envían al pool a medida que se leen,
+    # con un número acotado en vuelo, así que el corpus se sigue leyendo en streaming. Si el pool falla
+    # (BrokenProcessPool, OSError), los bloques en vuelo y los que faltan se procesan en este proceso; los
+    # errores al leer el corpus no se tratan como fallo del pool y se propagan al llamador.
+    max_workers = max_workers or os.cpu_count() or 1
+    in_flight_limit = _CHUNKS_IN_FLIGHT_PER_WORKER * max_workers
+    chunks = iter(chunks)
+    # Un bloque entra en chunks_in_flight antes de enviarse, así que un fallo al enviarlo no lo pierde
+    chunks_in_flight, futures = deque(), deque()
+    executor = None
+    pool_error = None
+    try:
+        try:
+            executor = ProcessPoolExecutor(max_workers=max_workers,
+                                           mp_context=multiprocessing.get_context(_POOL_START_METHOD),
+                                           initializer=_init_extraction_worker_internal,
+                                           initargs=(matcher, window_size, field_codes))
+        except (BrokenProcessPool, OSError) as e:
+            pool_error = e
+        source_done = False
+        while pool_error is None and (futures or not source_done):
+            if not source_done and len(futures) < in_flight_limit:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    source_done = True
+                    continue
+                chunks_in_flight.append(chunk)
+                try:
+                    futures.append(executor.submit(_extract_chunk_worker_internal, chunk))
+                except (BrokenProcessPool, OSError) as e:
+                    pool_error = e
+                continue
+            try:
+                partial = futures[0].result()
+            except (BrokenProcessPool, OSError) as e:
+                pool_error = e
+                continue
+            futures.popleft()
+            yield chunks_in_flight.popleft(), partial
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=pool_error is None, cancel_futures=True)
+    if pool_error is not None:
+        status_callback(f"DataNormalizer: Error en la extracción paralela ({pool_error}). "
+                        f"Se continuará en modo secuencial.")
+        for chunk in chunks_in_flight:
+            yield chunk, _extract_chunk_internal(matcher, chunk, window_size, field_codes)
+        for chunk in chunks:
+            yield chunk, _extract_chunk_internal(matcher, chunk, window_size, field_codes)
+
+
+def _process_bibtex_data_internal(bibtex_file_path, search_map, category_map, matcher, status_callback,
+                                  parallel=False, max_workers=None, chunk_size=_CHUNK_SIZE,
+                                  window_size=_DEFAULT_WINDOW_SIZE, fields=INDEXED_FIELDS):
+    # Devuelve la matriz de incidencia documento × variable (dict CSR) o None si no hay nada que analizar
     if not search_map or not category_map:
         status_callback(
             "DataNormalizer: Warning - El mapa de búsqueda o categorías está vacío. No se encontrarán términos.")
-        return Counter(), {}, Counter()
-
-    term_counts = Counter()
-    term_categories = {}
-    cooccurrence_counts = Counter()
+        return None
 
     if not os.path.exists(bibtex_file_path):
         status_callback(f"DataNormalizer: Error - Archivo BibTeX unificado no encontrado: {bibtex_file_path}")
-        return term_counts, term_categories, cooccurrence_counts
-
+        return None
+
+    # Si el Parser dejó el almacén columnar al día se leen solo las columnas necesarias;
+    # si no, las entradas se leen de una en una (streaming) desde el BibTeX
+    store_dir = os.path.join(os.path.dirname(bibtex_file_path), "corpus_store")
+    records = CorpusStore.iter_corpus_records(store_dir, ['ID', 'year'] + list(fields), bibtex_file_path)
+    if records is not None:
+        status_callback("DataNormalizer: Usando el almacén columnar del corpus (sin re-parsear BibTeX).")
+    else:
+        records = iter_bib_entries(bibtex_file_path, CorpusStore.NORMALIZATIONS['latex'], status_callback)
+    status_callback(f"DataNormalizer: Procesando entradas BibTeX de {os.path.basename(bibtex_file_path)}...")
+    processed_entries = 0
     try:
-        with open(bibtex_file_path, 'r', encoding='utf-8') as bibfile:
-            bibtex_string = bibfile.read()
-            parser = BibTexParser()
-            parser.customization = lambda record: convert_to_unicode(homogenize_latex_encoding(record))
-            parser.ignore_errors = True
-            bib_database = bibtexparser.loads(bibtex_string, parser)
+        field_codes = tuple(INDEXED_FIELDS.index(field) for field in fields)
+        chunks = _iter_chunks_internal(records, chunk_size, fields)
+        extracted = None
+        if parallel:
+            # Solo se leen por adelantado los dos primeros bloques, para no arrancar el pool con uno solo
+            first_chunks = list(islice(chunks, 2))
+            chunks = chain(first_chunks, chunks)
+            if len(first_chunks) > 1:
+                status_callback(f"DataNormalizer: Extrayendo términos en paralelo "
+                                f"({max_workers or os.cpu_count()} procesos)...")
+                extracted = _iter_extract_chunks_parallel_internal(chunks, matcher, window_size, field_codes,
+                                                                   status_callback, max_workers)
+        if extracted is None:
+            extracted = ((chunk, _extract_chunk_internal(matcher, chunk, window_size, field_codes))
+                         for chunk in chunks)
+
+        partials = []
+        for chunk, partial in extracted:
+            partials.append(partial)
+            processed_entries += len(chunk)
+            # En modo streaming no se conoce el total de antemano; se informa el avance acumulado.
+            status_callback(f"DataNormalizer: {processed_entries} entradas BibTeX procesadas...")
+
+        incidence = _concat_partials_internal(partials, matcher)
     except Exception as e:
         status_callback(f"DataNormalizer: Error procesando BibTeX {bibtex_file_path}: {e}")
-        return Counter(), {}, Counter()
+        return None
 
-    if not hasattr(bib_database, 'entries') or not bib_database.entries:
+    if processed_entries == 0:
         status_callback(f"DataNormalizer: Warning - No se encontraron entradas en {bibtex_file_path}.")
-        return Counter(), {}, Counter()
+        return None
 
-    total_entries_to_process = len(bib_database.entries)  # Guardar el total para usarlo en los mensajes
-    status_callback(f"DataNormalizer: Procesando {total_entries_to_process} entradas BibTeX...")
-    processed_entries = 0
-    for entry in bib_database.entries:
-        abstract_text_raw = entry.get('abstract', '')
-        if not abstract_text_raw:
-            # Si quieres contar las entradas sin abstract como "procesadas" para el conteo, hazlo aquí.
-            # Si no, el 'continue' se las salta y processed_entries no se incrementa para ellas.
-            # Para que el conteo sea consistente con el total anunciado, deberíamos incrementar processed_entries
-            # o filtrar estas entradas antes y anunciar un total diferente.
-            # Por ahora, asumamos que "procesar" significa iterar sobre ellas, tengan o no abstract.
-            pass  # No hacer nada especial si no hay abstract, se contará en processed_entries
-
-        abstract_lower = _normalize_text_internal(
-            abstract_text_raw if abstract_text_raw else "")  # Asegurar que no sea None
-        abstract_to_search_in = abstract_lower
-        current_entry_found_canonical_terms = set()
-
-        if abstract_text_raw:  # Solo buscar si hay abstract
-            for search_key in sorted_search_terms:
-                pattern = r'\b' + re.escape(search_key) + r'\b'
-                if re.search(pattern, abstract_to_search_in):
-                    canonical_name = search_map[search_key]
-                    current_entry_found_canonical_terms.add(canonical_name)
-
-        for canonical_name in current_entry_found_canonical_terms:
-            term_counts[canonical_name] += 1
-            if canonical_name not in term_categories:
-                term_categories[canonical_name] = category_map.get(canonical_name, "Sin Categoría")
-
-        if len(current_entry_found_canonical_terms) >= 2:
-            for pair in combinations(sorted(list(current_entry_found_canonical_terms)), 2):
-                cooccurrence_counts[pair] += 1
-
-        processed_entries += 1  # Incrementar después de procesar la entrada
-
-        # No imprimir el mensaje si es la última entrada Y es un múltiplo de 100,
-        # para evitar duplicar con el mensaje final que añadiremos.
-        if processed_entries % 100 == 0 and processed_entries != total_entries_to_process:
-            status_callback(
-                f"DataNormalizer: {processed_entries}/{total_entries_to_process} entradas BibTeX procesadas...")
-
-    # --- LÍNEA AÑADIDA ---
     # Mensaje final después del bucle para confirmar el total de entradas iteradas.
     status_callback(
-        f"DataNormalizer: {processed_entries}/{total_entries_to_process} entradas BibTeX iteradas (Fin del procesamiento de entradas).")
-    # --------------------
+        f"DataNormalizer: {processed_entries}/{processed_entries} entradas BibTeX iteradas (Fin del procesamiento de entradas).")
+    return incidence
+
 
+def _counts_from_incidence_internal(incidence, category_map):
+    # Frecuencias de nodo = sumas por columna; pesos de arista = triángulo superior de XᵀX
+    variables = incidence["variables"]
+    frequencies = incidenceMatrix.column_sums(incidence["indices"], len(variables))
+    term_counts = Counter({variables[idx]: int(freq) for idx, freq in enumerate(frequencies) if freq > 0})
+    term_categories = {canonical_name: category_map.get(canonical_name, "Sin Categoría")
+                       for canonical_name in term_counts}
+
+    cooccurrence_counts = Counter()
+    for source, target, weight in zip(*incidenceMatrix.cooccurrence_pairs(incidence["indptr"], incidence["indices"],
+                                                                          len(variables))):
+        cooccurrence_counts[(variables[source], variables[target])] = int(weight)
     return term_counts, term_categories, cooccurrence_counts
 
 
-def _write_nodes_csv_internal(term_counts, term_categories, output_csv_path, status_callback):
+def _field_columns_internal(incidence, fields, field_weights=None):
+    # Columnas extra del CSV de nodos: número de entradas en que cada variable aparece en cada campo y,
+    # si se dan pesos por campo, la frecuencia ponderada (suma de los pesos de los campos en que aparece)
+    variables = incidence["variables"]
+    var_ptr, rows, field_codes, _ = incidence["postings"]
+    posting_variables = np.repeat(np.arange(len(variables)), np.diff(var_ptr))
+    num_rows = len(incidence["entry_ids"])
+    codes = np.unique((field_codes.astype(np.int64) * num_rows + rows) * len(variables) + posting_variables)
+    per_field = np.bincount((codes // (num_rows * len(variables))) * len(variables) + codes % len(variables),
+                            minlength=len(INDEXED_FIELDS) * len(variables)).reshape(len(INDEXED_FIELDS), -1)
+
+    extra_columns = {}
+    for field in fields:
+        field_counts = per_field[INDEXED_FIELDS.index(field)]
+        extra_columns[f"Freq_{field}"] = {variables[idx]: int(count) for idx, count in enumerate(field_counts)}
+    if field_weights:
+        weighted = sum(float(field_weights.get(field, 1.0)) * per_field[INDEXED_FIELDS.index(field)]
+                       for field in fields)
+        extra_columns["Weighted_Frequency"] = {variables[idx]: round(float(value), 4)
+                                               for idx, value in enumerate(weighted)}
+    return extra_columns
+
+
+def _write_nodes_csv_internal(term_counts, term_categories, output_csv_path, status_callback, extra_columns=None):
+    extra_columns = extra_columns or {}
     os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
     if not term_counts:  # term_counts es un Counter, puede estar vacío pero no ser None
         status_callback("DataNormalizer: No se encontraron términos categorizados para escribir en CSV de nodos.")
         # Crear archivo vacío con cabeceras
         with open(output_csv_path, mode='w', encoding='utf-8', newline='') as csvfile:
-            fieldnames = ['Id', 'Label', 'Frequency', 'Category']
+            fieldnames = ['Id', 'Label', 'Frequency', 'Category'] + list(extra_columns)
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
         status_callback(f"DataNormalizer: Archivo de nodos vacío creado en {output_csv_path}")
         return
     try:
         with open(output_csv_path, mode='w', encoding='utf-8', newline='') as csvfile:
-            fieldnames = ['Id', 'Label', 'Frequency', 'Category']
+            fieldnames = ['Id', 'Label', 'Frequency', 'Category'] + list(extra_columns)
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
             for canonical_name, freq in term_counts.items():
                 category = term_categories.get(canonical_name, "Error - No Category Found")
-                writer.writerow({
+                row = {
                     'Id': canonical_name,
                     'Label': canonical_name,
                     'Frequency': freq,
                     'Category': category
-                })
+                }
+                for column, values in extra_columns.items():
+                    row[column] = values.get(canonical_name, 0)
+                writer.writerow(row)
         status_callback(f"DataNormalizer: Datos de nodos (frases/acrónimos) escritos en {output_csv_path}")
     except Exception as e:
         status_callback(f"DataNormalizer: Error escribiendo CSV de nodos: {e}")
@@ -214,8 +464,24 @@ def _write_edges_csv_internal(cooccurrence_counts, output_csv_path, status_callb
         status_callback(f"DataNormalizer: Error escribiendo CSV de ejes: {e}")
 
 
-def run_data_normalizer(status_callback, project_root_dir):
+def run_data_normalizer(status_callback, project_root_dir, parallel=False, max_workers=None,
+                        cooccurrence_scope='document', window_size=_DEFAULT_WINDOW_SIZE, fields=INDEXED_FIELDS,
+                        field_weights=None):
+    # cooccurrence_scope decide qué pesos van a keyword_edges.csv; los de oración y ventana se escriben
+    # además siempre en keyword_edges_sentence.csv y keyword_edges_window.csv.
+    # fields: campos donde se buscan las variables (en una sola pasada por entrada); field_weights,
+    # p. ej. {'title': 2.0, 'abstract': 1.0, 'keywords': 1.5}, añade la columna Weighted_Frequency.
     status_callback("Iniciando DataNormalizer...")
+    if cooccurrence_scope not in COOCCURRENCE_SCOPES:
+        status_callback(f"DataNormalizer: Ámbito de co-ocurrencia '{cooccurrence_scope}' no válido "
+                        f"(opciones: {', '.join(COOCCURRENCE_SCOPES)}). Se usará 'document'.")
+        cooccurrence_scope = 'document'
+    invalid_fields = [field for field in fields if field not in INDEXED_FIELDS]
+    if invalid_fields or not fields:
+        status_callback(f"DataNormalizer: Campos no válidos {invalid_fields} (opciones: {', '.join(INDEXED_FIELDS)}). "
+                        f"Se usarán todos.")
+        fields = INDEXED_FIELDS
+    fields = tuple(fields)
 
     variables_file = os.path.join(project_root_dir, "variables.csv")  # EN LA RAÍZ DEL PROYECTO
     bibtex_file_input = os.path.join(project_root_dir, "output", "parsing", "unificados.bib")
@@ -224,22 +490,76 @@ def run_data_normalizer(status_callback, project_root_dir):
     os.makedirs(output_dn_dir, exist_ok=True)
     nodes_output_file = os.path.join(output_dn_dir, "keyword_nodes.csv")
     edges_output_file = os.path.join(output_dn_dir, "keyword_edges.csv")
+    scoped_edges_output_files = {scope: os.path.join(output_dn_dir, f"keyword_edges_{scope}.csv")
+                                 for scope in ('sentence', 'window')}
+    incidence_output_file = os.path.join(output_dn_dir, incidenceMatrix.INCIDENCE_FILENAME)
+    term_index_output_file = os.path.join(output_dn_dir, termIndex.TERM_INDEX_FILENAME)
+    trend_cube_output_file = os.path.join(output_dn_dir, trendCube.TREND_CUBE_FILENAME)
 
     search_map, category_map, sorted_search_keys = _load_variables_and_categories_internal(variables_file,
                                                                                            status_callback)
+    # El autómata se construye una sola vez y se reutiliza para todas las entradas
+    matcher = TermMatcher(search_map) if search_map else None
 
+    incidence = None
     if search_map is None:  # Error ya reportado en _load_variables_and_categories_internal
         status_callback("DataNormalizer: Error crítico al cargar variables. Se generarán archivos vacíos.")
-        counts, categories, cooccurrences = Counter(), {}, Counter()  # Asegurar que son Counters vacíos
     else:
-        counts, categories, cooccurrences = _process_bibtex_data_internal(
-            bibtex_file_input, search_map, category_map, sorted_search_keys, status_callback
+        incidence = _process_bibtex_data_internal(
+            bibtex_file_input, search_map, category_map, matcher, status_callback, parallel, max_workers,
+            window_size=window_size, fields=fields
         )
 
+    scoped_cooccurrences = {scope: Counter() for scope in scoped_edges_output_files}
+    if incidence is None:
+        counts, categories, cooccurrences = Counter(), {}, Counter()  # Asegurar que son Counters vacíos
+        field_columns = {f"Freq_{field}": {} for field in fields}
+        if field_weights:
+            field_columns["Weighted_Frequency"] = {}
+        # Una matriz o un índice de una ejecución anterior ya no corresponden a los CSV que se van a escribir
+        for stale_file in (incidence_output_file, term_index_output_file, trend_cube_output_file):
+            if os.path.exists(stale_file):
+                os.remove(stale_file)
+    else:
+        counts, categories, cooccurrences = _counts_from_incidence_internal(incidence, category_map)
+        field_columns = _field_columns_internal(incidence, fields, field_weights)
+        variables = incidence["variables"]
+        for scope, (sources, targets, weights) in incidence["scoped_pairs"].items():
+            for source, target, weight in zip(sources, targets, weights):
+                scoped_cooccurrences[scope][(variables[source], variables[target])] = int(weight)
+        try:
+            incidenceMatrix.save_incidence_matrix(incidence_output_file, incidence["indptr"], incidence["indices"],
+                                                  incidence["entry_ids"], incidence["variables"])
+            status_callback(f"DataNormalizer: Matriz de incidencia documento × variable guardada en "
+                            f"{incidence_output_file}")
+        except Exception as e:
+            status_callback(f"DataNormalizer: Error guardando la matriz de incidencia: {e}")
+        try:
+            termIndex.save_term_index(term_index_output_file, *incidence["postings"], incidence["entry_ids"],
+                                      incidence["variables"], INDEXED_FIELDS)
+            status_callback(f"DataNormalizer: Índice invertido posicional guardado en {term_index_output_file}")
+        except Exception as e:
+            status_callback(f"DataNormalizer: Error guardando el índice invertido: {e}")
+        try:
+            cube = trendCube.build_trend_cube(incidence["indptr"], incidence["indices"], incidence["row_years"],
+                                              len(variables))
+            trendCube.save_trend_cube(trend_cube_output_file, cube, variables)
+            status_callback(f"DataNormalizer: Cubo variable × año ({len(cube['years'])} años) guardado en "
+                            f"{trend_cube_output_file}")
+        except Exception as e:
+            status_callback(f"DataNormalizer: Error guardando el cubo variable × año: {e}")
+
     status_callback(f"DataNormalizer: Procesadas {len(counts)} frases/acrónimos únicos encontrados.")
     status_callback(f"DataNormalizer: Encontradas {len(cooccurrences)} co-ocurrencias únicas.")
+    status_callback(f"DataNormalizer: Co-ocurrencias por oración: {len(scoped_cooccurrences['sentence'])}; "
+                    f"por ventana de {window_size} tokens: {len(scoped_cooccurrences['window'])}.")
 
-    _write_nodes_csv_internal(counts, categories, nodes_output_file, status_callback)
+    _write_nodes_csv_internal(counts, categories, nodes_output_file, status_callback, field_columns)
+    if cooccurrence_scope != 'document':
+        status_callback(f"DataNormalizer: keyword_edges.csv usará co-ocurrencias por ámbito '{cooccurrence_scope}'.")
+        cooccurrences = scoped_cooccurrences[cooccurrence_scope]
     _write_edges_csv_internal(cooccurrences, edges_output_file, status_callback)
+    for scope, scoped_output_file in scoped_edges_output_files.items():
+        _write_edges_csv_internal(scoped_cooccurrences[scope], scoped_output_file, status_callback)
 
     status_callback("DataNormalizer completado.")
\ No newline at end of file
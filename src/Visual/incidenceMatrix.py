@@ -0,0 +1,90 @@
+import numpy as np
+
+# Matriz de incidencia documento × variable en formato CSR (solo NumPy): la fila i son los índices
+# de las variables encontradas en la entrada i. Todas sus celdas valen 1, así que no se guarda 'data'.
+INCIDENCE_FILENAME = "incidence_matrix.npz"
+
+# Códigos de pares de variables (int64) que se generan a la vez al contar co-ocurrencias
+_MAX_PAIR_CODES = 1 << 22
+
+
+def build_csr(row_lengths, indices):
+    indptr = np.zeros(len(row_lengths) + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=indptr[1:])
+    return indptr, np.asarray(indices, dtype=np.int32)
+
+
+def column_sums(indices, num_cols):
+    # Frecuencia documental de cada variable
+    return np.bincount(indices, minlength=num_cols).astype(np.int64)
+
+
+def _sorted_rows_internal(indptr, indices, num_cols):
+    # Misma matriz con los índices de cada fila ordenados y sin repetir (una variable cuenta una vez por fila)
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+    codes = np.unique(rows * num_cols + indices)
+    return build_csr(np.bincount(codes // num_cols, minlength=len(indptr) - 1), codes % num_cols)
+
+
+def _row_pairs_internal(indptr, row_start, row_end):
+    # Posiciones (p, q), p < q, de cada par de valores de una misma fila de [row_start, row_end): cada valor
+    # se empareja con los que le siguen en su fila
+    lengths = np.diff(indptr[row_start:row_end + 1])
+    positions = np.arange(indptr[row_start], indptr[row_end])
+    followers = np.repeat(indptr[row_start + 1:row_end + 1], lengths) - positions - 1
+    first = np.repeat(positions, followers)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(followers) - followers, followers)
+    return first, second
+
+
+def cooccurrence_counts(indptr, indices, num_cols, row_keys=None):
+    """Co-ocurrencias dispersas: (códigos, número de filas) de los pares de variables a < b que comparten fila.
+
+    código = a * num_cols + b; con row_keys (entero >= 0 por fila) se suma key * num_cols², así una sola
+    pasada cuenta los pares por grupo de filas (p. ej. por año). Nunca se forma una matriz
+    num_cols × num_cols: los pares se codifican por bloques de filas y se cuentan con np.unique, así que
+    la memoria depende de los pares presentes. Los códigos salen ordenados.
+    """
+    indptr, indices = _sorted_rows_internal(indptr, indices, num_cols)
+    lengths = np.diff(indptr)
+    pair_ends = np.cumsum(lengths * (lengths - 1) // 2)
+    codes, counts = [], []
+    row_start = 0
+    while row_start < len(lengths):
+        # Bloque de filas con un número acotado de pares (al menos una fila)
+        done = pair_ends[row_start - 1] if row_start else 0
+        row_end = max(row_start + 1, int(np.searchsorted(pair_ends, done + _MAX_PAIR_CODES, side='right')))
+        first, second = _row_pairs_internal(indptr, row_start, row_end)
+        block_codes = indices[first].astype(np.int64) * num_cols + indices[second]
+        if row_keys is not None:
+            rows = np.repeat(np.arange(row_start, row_end), lengths[row_start:row_end])
+            block_codes += np.asarray(row_keys, dtype=np.int64)[rows[first - indptr[row_start]]] * num_cols * num_cols
+        block_codes, block_counts = np.unique(block_codes, return_counts=True)
+        codes.append(block_codes)
+        counts.append(block_counts)
+        row_start = row_end
+    if len(codes) <= 1:
+        return (codes[0], counts[0].astype(np.int64)) if codes else (np.zeros(0, dtype=np.int64),
+                                                                      np.zeros(0, dtype=np.int64))
+    codes, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+    return codes, np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+
+
+def cooccurrence_pairs(indptr, indices, num_cols):
+    """Pares (a, b) con a < b y el número de filas que los contienen a la vez (triángulo superior de XᵀX).
+
+    Solo aparecen los pares con peso > 0, ordenados por (a, b): cada arista no dirigida una sola vez.
+    """
+    codes, counts = cooccurrence_counts(indptr, indices, num_cols)
+    return codes // num_cols, codes % num_cols, counts
+
+
+def save_incidence_matrix(path, indptr, indices, entry_ids, variables):
+    np.savez_compressed(path, indptr=indptr, indices=indices,
+                        entry_ids=np.asarray(entry_ids, dtype=str), variables=np.asarray(variables, dtype=str))
+
+
+def load_incidence_matrix(path):
+    """Devuelve un dict con indptr, indices, entry_ids y variables (sin re-escanear el texto)."""
+    with np.load(path) as data:
+        return {key: data[key] for key in ('indptr', 'indices', 'entry_ids', 'variables')}
@@ -0,0 +1,74 @@
+import csv
+import numpy as np
+
+# Escritura en streaming de pares de similitud: los pares se acumulan solo como índices enteros de
+# documento (arrays NumPy) y se vuelcan por lotes al CSV y, opcionalmente, a un archivo de texto con el
+# formato del reporte. ID y título se resuelven al escribir con una única tabla de documentos, así que
+# la memoria no crece con el número de pares y lo ya volcado queda en disco aunque se detenga el análisis.
+_BATCH_PAIRS = 10000
+
+
+class PairSink:
+    """CSV de pares (ID_1, Titulo_1[, Rango], ID_2, Titulo_2, <sim_column>) escrito por lotes.
+
+    entry_ids y titles son la tabla de documentos indexada por fila. Si se pasa report_file, cada par se
+    escribe también como "  - <report_label> Sim: 'título 1' ≈ 'título 2' (sim: x.xxx)". Con append=True
+    se continúa un CSV existente (sin repetir la cabecera).
+    """
+
+    def __init__(self, csv_path, sim_column, entry_ids, titles, report_file=None, report_label=None,
+                 with_rank=False, batch_size=_BATCH_PAIRS, append=False):
+        self.entry_ids = entry_ids
+        self.titles = titles
+        self.report_file = report_file
+        self.report_label = report_label
+        self.with_rank = with_rank
+        self.batch_size = batch_size
+        self.count = 0
+        self._buffer = []
+        self._buffered = 0
+        self._csv_file = open(csv_path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._csv_file)
+        if not append:
+            header = ["ID_1", "Titulo_1"] + (["Rango"] if with_rank else []) + ["ID_2", "Titulo_2", sim_column]
+            self._writer.writerow(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def add(self, pair_i, pair_j, sims, ranks=None):
+        if not len(pair_i):
+            return
+        self._buffer.append((np.asarray(pair_i), np.asarray(pair_j), np.asarray(sims),
+                             np.asarray(ranks) if ranks is not None else None))
+        self._buffered += len(pair_i)
+        self.count += len(pair_i)
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        rows, lines = [], []
+        for pair_i, pair_j, sims, ranks in self._buffer:
+            for pos, (i, j, sim) in enumerate(zip(pair_i.tolist(), pair_j.tolist(), sims.tolist())):
+                rank = [int(ranks[pos])] if self.with_rank else []
+                rows.append([self.entry_ids[i], self.titles[i]] + rank +
+                            [self.entry_ids[j], self.titles[j], round(sim, 4)])
+                if self.report_file is not None:
+                    lines.append(f"  - {self.report_label} Sim: '{self.titles[i]}' ≈ '{self.titles[j]}' "
+                                 f"(sim: {sim:.3f})\n")
+        self._writer.writerows(rows)
+        self._csv_file.flush()
+        if self.report_file is not None:
+            self.report_file.writelines(lines)
+            self.report_file.flush()
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        if self._csv_file.closed:
+            return
+        self.flush()
+        self._csv_file.close()
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import numpy as np
+from src.Parsing import CorpusStore
+
+# Punto de control del análisis de similitud, en output/similarity_analysis:
+#  - similarity_checkpoint.json: unificados.bib de origen (tamaño y mtime), opciones del análisis, siguiente
+#    fila por comparar, tamaño de bloque, pares encontrados y tamaño en bytes de cada salida parcial.
+#  - similarity_checkpoint_vocabulary.npz: vocabulario (términos por ID) e IDF, escritos una sola vez.
+#  - similarity_checkpoint_topk.npz: vecinos top-k acumulados, si se piden.
+# Una ejecución posterior sobre el mismo unificados.bib y con las mismas opciones recorta las salidas
+# parciales al tamaño guardado y continúa desde la siguiente fila.
+#
+# Instantánea de la última ejecución completa (similarity_snapshot*), para el modo incremental: huella de
+# cada documento en el orden de filas, vocabulario e IDF congelados, pares encontrados, tamaño de cada
+# salida y vecinos top-k. Una ejecución incremental reconstruye los vectores anteriores con ese vocabulario
+# e IDF (idénticos a los de entonces) y solo compara los documentos nuevos con todos.
+CHECKPOINT_VERSION = 1
+CHECKPOINT_META_FILENAME = "similarity_checkpoint.json"
+CHECKPOINT_VOCABULARY_FILENAME = "similarity_checkpoint_vocabulary.npz"
+CHECKPOINT_NEIGHBOURS_FILENAME = "similarity_checkpoint_topk.npz"
+SNAPSHOT_META_FILENAME = "similarity_snapshot.json"
+SNAPSHOT_VOCABULARY_FILENAME = "similarity_snapshot_vocabulary.npz"
+SNAPSHOT_NEIGHBOURS_FILENAME = "similarity_snapshot_topk.npz"
+
+
+def _paths_internal(checkpoint_dir):
+    return (os.path.join(checkpoint_dir, CHECKPOINT_META_FILENAME),
+            os.path.join(checkpoint_dir, CHECKPOINT_VOCABULARY_FILENAME),
+            os.path.join(checkpoint_dir, CHECKPOINT_NEIGHBOURS_FILENAME))
+
+
+def _snapshot_paths_internal(snapshot_dir):
+    return (os.path.join(snapshot_dir, SNAPSHOT_META_FILENAME),
+            os.path.join(snapshot_dir, SNAPSHOT_VOCABULARY_FILENAME),
+            os.path.join(snapshot_dir, SNAPSHOT_NEIGHBOURS_FILENAME))
+
+
+def _remove_files_internal(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _write_json_internal(path, content):
+    # Se escribe a un temporal y se renombra: nunca queda un archivo a medias
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as json_file:
+        json.dump(content, json_file)
+    os.replace(temp_path, path)
+
+
+def _save_vocabulary_internal(vocabulary_path, vocabulary, idf):
+    terms = np.empty(len(vocabulary), dtype=object)
+    for term, term_id in vocabulary.items():
+        terms[term_id] = term
+    temp_path = vocabulary_path + ".tmp.npz"
+    np.savez_compressed(temp_path, terms=terms.astype(str), idf=idf)
+    os.replace(temp_path, vocabulary_path)
+
+
+def _save_neighbours_internal(neighbours_path, neighbours):
+    if neighbours is None:
+        _remove_files_internal([neighbours_path])
+        return
+    temp_path = neighbours_path + ".tmp.npz"
+    np.savez(temp_path, ids=neighbours.ids, sims=neighbours.sims)
+    os.replace(temp_path, neighbours_path)
+
+
+def _load_arrays_internal(state, vocabulary_path, neighbours_path):
+    # Añade 'vocabulary' (término -> ID), 'idf' y, si existen, 'neighbours_ids' y 'neighbours_sims'
+    with np.load(vocabulary_path) as data:
+        state["vocabulary"] = {str(term): term_id for term_id, term in enumerate(data["terms"])}
+        state["idf"] = data["idf"]
+    if os.path.exists(neighbours_path):
+        with np.load(neighbours_path) as data:
+            state["neighbours_ids"] = data["ids"]
+            state["neighbours_sims"] = data["sims"]
+    return state
+
+
+def _outputs_available_internal(output_dir, output_sizes):
+    for name, size in output_sizes.items():
+        path = os.path.join(output_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) < size:
+            return False
+    return True
+
+
+def truncate_outputs(output_dir, state):
+    # Descarta lo escrito después del punto de control o de la instantánea (p. ej. lotes volcados antes
+    # de una caída)
+    for name, size in state["output_sizes"].items():
+        os.truncate(os.path.join(output_dir, name), size)
+
+
+def clear_checkpoint(checkpoint_dir):
+    _remove_files_internal(_paths_internal(checkpoint_dir))
+
+
+def save_vocabulary(checkpoint_dir, vocabulary, idf):
+    _, vocabulary_path, _ = _paths_internal(checkpoint_dir)
+    _save_vocabulary_internal(vocabulary_path, vocabulary, idf)
+
+
+def save_progress(checkpoint_dir, source_bib_path, options, next_row, block_rows, counts, output_paths,
+                  neighbours=None):
+    """Guarda el progreso tras un bloque completado; output_paths ya deben estar volcados a disco."""
+    meta_path, _, neighbours_path = _paths_internal(checkpoint_dir)
+    _save_neighbours_internal(neighbours_path, neighbours)
+    _write_json_internal(meta_path, {
+        "version": CHECKPOINT_VERSION,
+        "source": CorpusStore.source_signature(source_bib_path),
+        "options": options,
+        "next_row": int(next_row),
+        "block_rows": int(block_rows),
+        "counts": {name: int(count) for name, count in counts.items()},
+        "output_sizes": {os.path.basename(path): os.path.getsize(path) for path in output_paths},
+    })
+
+
+def load_checkpoint(checkpoint_dir, source_bib_path, options):
+    """Devuelve el punto de control si corresponde al unificados.bib actual y a las mismas opciones, o None.
+
+    El dict incluye el meta.json más 'vocabulary' (término -> ID), 'idf' y, si existen, 'neighbours_ids'
+    y 'neighbours_sims'.
+    """
+    meta_path, vocabulary_path, neighbours_path = _paths_internal(checkpoint_dir)
+    if not os.path.exists(meta_path) or not os.path.exists(vocabulary_path) or not os.path.exists(source_bib_path):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as meta_file:
+            checkpoint = json.load(meta_file)
+        if (checkpoint.get("version") != CHECKPOINT_VERSION
+                or checkpoint.get("source") != CorpusStore.source_signature(source_bib_path)
+                or checkpoint.get("options") != options):
+            return None
+        if not _outputs_available_internal(checkpoint_dir, checkpoint["output_sizes"]):
+            return None
+        return _load_arrays_internal(checkpoint, vocabulary_path, neighbours_path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def document_digest(entry_id, title, abstract):
+    # Huella de un documento: si cambia su ID, título o abstract cuenta como otro documento
+    digest = hashlib.sha256()
+    for field in (entry_id, title, abstract):
+        digest.update(field.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def clear_snapshot(snapshot_dir):
+    _remove_files_internal(_snapshot_paths_internal(snapshot_dir))
+
+
+def save_snapshot(snapshot_dir, options, digests, vocabulary, idf, counts, output_paths, neighbours=None):
+    """Guarda la instantánea de una ejecución completa; digests va en el orden de filas de la matriz."""
+    meta_path, vocabulary_path, neighbours_path = _snapshot_paths_internal(snapshot_dir)
+    _save_vocabulary_internal(vocabulary_path, vocabulary, idf)
+    _save_neighbours_internal(neighbours_path, neighbours)
+    _write_json_internal(meta_path, {
+        "version": CHECKPOINT_VERSION,
+        "options": options,
+        "digests": list(digests),
+        "counts": {name: int(count) for name, count in counts.items()},
+        "output_sizes": {os.path.basename(path): os.path.getsize(path) for path in output_paths},
+    })
+
+
+def load_snapshot(snapshot_dir, options):
+    """Devuelve la instantánea si se hizo con las mismas opciones y sus salidas siguen en disco, o None.
+
+    El dict incluye el meta.json más 'vocabulary', 'idf' y, si existen, 'neighbours_ids' y 'neighbours_sims'.
+    """
+    meta_path, vocabulary_path, neighbours_path = _snapshot_paths_internal(snapshot_dir)
+    if not os.path.exists(meta_path) or not os.path.exists(vocabulary_path):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as meta_file:
+            snapshot = json.load(meta_file)
+        if snapshot.get("version") != CHECKPOINT_VERSION or snapshot.get("options") != options:
+            return None
+        if not _outputs_available_internal(snapshot_dir, snapshot["output_sizes"]):
+            return None
+        return _load_arrays_internal(snapshot, vocabulary_path, neighbours_path)
+    except (OSError, ValueError, KeyError):
+        return None
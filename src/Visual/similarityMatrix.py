@@ -0,0 +1,652 @@
+import math
+import numpy as np
+
+# Motor vectorizado de similitud entre abstracts: cada documento se tokeniza una sola vez a IDs
+# enteros, los vectores TF-IDF se guardan como una matriz CSR (indptr, indices, data) normalizada
+# en L2 y los cosenos se calculan por bloques de filas con productos de matrices (BLAS).
+
+# Tamaño máximo (en celdas) de cada bloque denso documento × término
+_MAX_BLOCK_CELLS = 1 << 23
+# Margen del filtro en float32: los pares que lo pasan se vuelven a puntuar en float64
+_SCREENING_MARGIN = 1e-4
+# Primo de Mersenne 2^31 - 1 (mismo esquema de hash que Dedup.MinHashLSH): a * id + b cabe en uint64
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+# Tamaño máximo (en celdas) de la matriz de hashes permutados al calcular firmas MinHash
+_MAX_HASH_CELLS = 1 << 22
+# Holgura de las cotas de AllPairs frente a los errores de redondeo (las cotas nunca deben descartar un par válido)
+_BOUND_SLACK = 1e-6
+# Desviaciones típicas de la estimación MinHash por debajo del umbral con las que se descarta un candidato
+_ESTIMATE_SIGMAS = 4.0
+# Cota de la tasa esperada de candidatos LSH (fracción de todas las parejas) al elegir bandas/filas
+_LSH_MAX_CANDIDATE_RATE = 0.1
+# Probabilidad mínima de que un par justo en el umbral Jaccard salga como candidato
+_LSH_RECALL_TARGET = 0.95
+# Permutaciones máximas a las que puede subir lsh_parameters para alcanzar _LSH_RECALL_TARGET
+_LSH_MAX_NUM_PERM = 1024
+# Parejas al azar con las que se estima la distribución de Jaccard de fondo del corpus
+_LSH_BACKGROUND_PAIRS = 20000
+
+
+def encode_documents(token_lists, vocabulary=None):
+    """Convierte listas de tokens en una matriz CSR de conteos por documento.
+
+    Devuelve (vocabulary, indptr, indices, counts, doc_lengths): vocabulary es un dict término -> ID
+    (se amplía si se pasa uno existente), indices está ordenado dentro de cada fila y doc_lengths es
+    el número total de tokens de cada documento (denominador del TF).
+    """
+    vocabulary = {} if vocabulary is None else vocabulary
+    indptr = np.zeros(len(token_lists) + 1, dtype=np.int64)
+    indices_parts, counts_parts = [], []
+    doc_lengths = np.zeros(len(token_lists), dtype=np.int64)
+    for doc_idx, tokens in enumerate(token_lists):
+        term_ids = np.fromiter((vocabulary.setdefault(token, len(vocabulary)) for token in tokens),
+                               dtype=np.int64, count=len(tokens))
+        unique_ids, counts = np.unique(term_ids, return_counts=True)
+        indices_parts.append(unique_ids)
+        counts_parts.append(counts)
+        indptr[doc_idx + 1] = indptr[doc_idx] + len(unique_ids)
+        doc_lengths[doc_idx] = len(tokens)
+    indices = np.concatenate(indices_parts).astype(np.int32) if indices_parts else np.zeros(0, dtype=np.int32)
+    counts = np.concatenate(counts_parts).astype(np.int64) if counts_parts else np.zeros(0, dtype=np.int64)
+    return vocabulary, indptr, indices, counts, doc_lengths
+
+
+def document_frequencies(indices, num_terms):
+    return np.bincount(indices, minlength=num_terms)
+
+
+def compute_idf(document_freqs, num_docs):
+    # idf = log(N / df); los términos que no aparecen quedan en 0
+    idf = np.zeros(len(document_freqs), dtype=np.float64)
+    present = document_freqs > 0
+    idf[present] = np.log(num_docs / document_freqs[present].astype(np.float64))
+    return idf
+
+
+def idf_drift(reference_idf, current_idf):
+    # Cambio relativo ||idf_actual - idf_ref|| / ||idf_ref|| sobre los términos de reference_idf
+    norm = np.linalg.norm(reference_idf)
+    if norm == 0:
+        return 0.0
+    return float(np.linalg.norm(current_idf[:len(reference_idf)] - reference_idf) / norm)
+
+
+def tfidf_weights(indptr, indices, counts, doc_lengths, idf):
+    """Pesos TF-IDF (tf = conteo / tokens del documento) normalizados en L2 por fila."""
+    row_of = np.repeat(np.arange(len(doc_lengths)), np.diff(indptr))
+    lengths = doc_lengths[row_of].astype(np.float64)
+    weights = np.divide(counts, lengths, out=np.zeros(len(counts), dtype=np.float64), where=lengths > 0)
+    weights *= idf[indices]
+    norms = np.sqrt(np.bincount(row_of, weights=weights * weights, minlength=len(doc_lengths)))
+    row_norms = norms[row_of]
+    return np.divide(weights, row_norms, out=np.zeros_like(weights), where=row_norms > 0)
+
+
+def _shared_columns_internal(indices, num_terms):
+    # Solo los términos presentes en dos o más documentos pueden aportar a un producto entre documentos
+    document_freqs = document_frequencies(indices, num_terms)
+    shared = document_freqs > 1
+    column_map = np.full(num_terms, -1, dtype=np.int64)
+    column_map[shared] = np.arange(int(shared.sum()))
+    return column_map, int(shared.sum())
+
+
+def _dense_block_internal(indptr, indices, values, column_map, num_columns, row_start, row_end):
+    block = np.zeros((row_end - row_start, max(1, num_columns)), dtype=np.float32)
+    lo, hi = indptr[row_start], indptr[row_end]
+    columns = column_map[indices[lo:hi]]
+    rows = np.repeat(np.arange(row_end - row_start), np.diff(indptr[row_start:row_end + 1]))
+    keep = columns >= 0
+    block[rows[keep], columns[keep]] = values[lo:hi][keep]
+    return block
+
+
+def exact_dot(indptr, indices, data, row1, row2):
+    # Producto escalar exacto (float64) entre dos filas CSR con índices ordenados
+    span1 = slice(indptr[row1], indptr[row1 + 1])
+    span2 = slice(indptr[row2], indptr[row2 + 1])
+    _, pos1, pos2 = np.intersect1d(indices[span1], indices[span2], assume_unique=True, return_indices=True)
+    return float(np.dot(data[span1][pos1], data[span2][pos2]))
+
+
+def block_size(num_terms):
+    return int(max(64, min(1024, _MAX_BLOCK_CELLS // max(1, num_terms))))
+
+
+def row_blocks(num_docs, block_rows):
+    return [(row_start, min(num_docs, row_start + block_rows)) for row_start in range(0, num_docs, block_rows)]
+
+
+class PairwiseBlocks:
+    """Pares (i, j), i < j, por encima de los umbrales de coseno TF-IDF y de Jaccard, por bloques de filas.
+
+    Cualquiera de los dos umbrales puede ser None para omitir esa métrica.
+
+    Cada bloque de filas se multiplica por los bloques de columnas j >= i en float32, usando solo los
+    términos compartidos: con los pesos TF-IDF se obtienen los cosenos y con la matriz binaria el tamaño
+    de la intersección de los conjuntos de tokens, de modo que ambas métricas salen de la misma pasada.
+    Los cosenos que superan threshold - margen se puntúan de nuevo en float64; la intersección es entera
+    y exacta, así que el Jaccard coincide con la comparación par a par de conjuntos.
+    """
+
+    def __init__(self, indptr, indices, data, num_terms, cosine_threshold, jaccard_threshold=None, block_rows=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.cosine_threshold = cosine_threshold
+        self.jaccard_threshold = jaccard_threshold
+        self.num_docs = len(indptr) - 1
+        self.set_sizes = np.diff(indptr)
+        self._ones = np.ones(len(indices), dtype=np.float32)
+        self.column_map, self.num_columns = _shared_columns_internal(indices, num_terms)
+        self.block_rows = block_rows or block_size(self.num_columns)
+        self.blocks = row_blocks(self.num_docs, self.block_rows)
+
+    def _dense_internal(self, values, row_start, row_end):
+        return _dense_block_internal(self.indptr, self.indices, values, self.column_map, self.num_columns,
+                                     row_start, row_end)
+
+    def _jaccard_block_internal(self, rows_binary, cols_binary, row_start, col_start):
+        intersections = (rows_binary @ cols_binary.T).astype(np.float64)
+        row_sizes = self.set_sizes[row_start:row_start + rows_binary.shape[0]]
+        col_sizes = self.set_sizes[col_start:col_start + cols_binary.shape[0]]
+        unions = row_sizes[:, None] + col_sizes[None, :] - intersections
+        # Dos conjuntos vacíos se consideran idénticos (Jaccard 1.0)
+        jaccard = np.divide(intersections, unions, out=np.ones_like(intersections), where=unions > 0)
+        return jaccard
+
+    def block_pairs(self, row_start, row_end, should_stop=None, neighbours=None):
+        """Devuelve {'tfidf': (i, j, sim), 'jaccard': (i, j, sim)} del bloque [row_start, row_end), ordenados.
+
+        should_stop se consulta antes de cada bloque de columnas; si devuelve True, el resultado es None.
+        Si se pasa neighbours (TopKNeighbours), los cosenos del bloque también lo actualizan en ambos sentidos.
+        """
+        use_cosine = self.cosine_threshold is not None or neighbours is not None
+        rows_tfidf = self._dense_internal(self.data, row_start, row_end) if use_cosine else None
+        rows_binary = self._dense_internal(self._ones, row_start, row_end) if self.jaccard_threshold is not None \
+            else None
+        found = {"tfidf": ([], [], []), "jaccard": ([], [], [])}
+        # El primer bloque de columnas es el propio bloque de filas (que puede ser más corto que block_rows)
+        col_blocks = [(row_start, row_end)] + [(row_end + col_start, row_end + col_end) for col_start, col_end
+                                               in row_blocks(self.num_docs - row_end, self.block_rows)]
+        for col_start, col_end in col_blocks:
+            if should_stop and should_stop():
+                return None
+            diagonal = col_start == row_start
+            if rows_tfidf is not None:
+                cols_tfidf = rows_tfidf if diagonal else self._dense_internal(self.data, col_start, col_end)
+                scores = rows_tfidf @ cols_tfidf.T
+                if self.cosine_threshold is not None:
+                    local_i, local_j = np.nonzero(scores >= self.cosine_threshold - _SCREENING_MARGIN)
+                    self._collect_internal(found["tfidf"], local_i + row_start, local_j + col_start, None)
+                if neighbours is not None:
+                    rows, cols = np.arange(row_start, row_end), np.arange(col_start, col_end)
+                    neighbours.update(rows, cols, scores)
+                    if not diagonal:
+                        neighbours.update(cols, rows, scores.T)
+
+            if rows_binary is not None:
+                cols_binary = rows_binary if diagonal else self._dense_internal(self._ones, col_start, col_end)
+                jaccard = self._jaccard_block_internal(rows_binary, cols_binary, row_start, col_start)
+                local_i, local_j = np.nonzero(jaccard >= self.jaccard_threshold)
+                self._collect_internal(found["jaccard"], local_i + row_start, local_j + col_start,
+                                       jaccard[local_i, local_j])
+
+        pair_i, pair_j, _ = (np.concatenate(part) if part else np.zeros(0) for part in found["tfidf"])
+        pair_i, pair_j = pair_i.astype(np.int64), pair_j.astype(np.int64)
+        sims = np.array([exact_dot(self.indptr, self.indices, self.data, i, j) for i, j in zip(pair_i, pair_j)],
+                        dtype=np.float64)
+        keep = sims >= (self.cosine_threshold if self.cosine_threshold is not None else np.inf)
+        result = {"tfidf": self._sorted_internal(pair_i[keep], pair_j[keep], sims[keep])}
+
+        pair_i, pair_j, sims = (np.concatenate(part) if part else np.zeros(0) for part in found["jaccard"])
+        result["jaccard"] = self._sorted_internal(pair_i.astype(np.int64), pair_j.astype(np.int64), sims)
+        return result
+
+    @staticmethod
+    def _collect_internal(target, pair_i, pair_j, sims):
+        upper = pair_j > pair_i
+        target[0].append(pair_i[upper])
+        target[1].append(pair_j[upper])
+        target[2].append(sims[upper] if sims is not None else np.zeros(int(upper.sum())))
+
+    @staticmethod
+    def _sorted_internal(pair_i, pair_j, sims):
+        order = np.lexsort((pair_j, pair_i))
+        return pair_i[order], pair_j[order], sims[order]
+
+
+def _segment_cumsum_internal(values, indptr, row_of):
+    # Suma acumulada de values reiniciada al principio de cada fila CSR
+    totals = np.cumsum(values)
+    row_base = np.concatenate(([0.0], totals))[indptr[:-1]]
+    return totals - row_base[row_of]
+
+
+class TopKNeighbours:
+    """Los k documentos más similares a cada documento, en arrays acotados n × k (memoria O(n·k)).
+
+    Cada actualización junta los k actuales de las filas con las nuevas puntuaciones y se queda con las
+    k mayores (argpartition): un heap acotado por fila, vectorizado. Las puntuaciones se comparan en
+    float32 y pairs() devuelve los cosenos vueltos a calcular con exact_dot.
+    """
+
+    def __init__(self, num_docs, k):
+        self.k = max(0, min(k, num_docs - 1))
+        self.sims = np.full((num_docs, self.k), -np.inf, dtype=np.float32)
+        self.ids = np.full((num_docs, self.k), -1, dtype=np.int64)
+
+    def load(self, ids, sims, row_offset=0):
+        # Restaura vecinos guardados; con row_offset, los de documentos que ahora empiezan en esa fila
+        k = min(self.k, ids.shape[1])
+        self.ids[row_offset:row_offset + len(ids), :k] = np.where(ids[:, :k] >= 0, ids[:, :k] + row_offset, -1)
+        self.sims[row_offset:row_offset + len(ids), :k] = sims[:, :k]
+
+    def merge(self, rows, ids, sims):
+        # ids / sims: candidatos (len(rows) × m) para cada fila de rows
+        if not self.k or not len(rows):
+            return
+        merged_ids = np.hstack((self.ids[rows], ids))
+        merged_sims = np.hstack((self.sims[rows], sims))
+        keep = np.argpartition(-merged_sims, self.k - 1, axis=1)[:, :self.k]
+        self.ids[rows] = np.take_along_axis(merged_ids, keep, axis=1)
+        self.sims[rows] = np.take_along_axis(merged_sims, keep, axis=1)
+
+    def update(self, rows, cols, scores):
+        # Un documento no es vecino de sí mismo
+        scores = np.where(rows[:, None] == cols[None, :], -np.inf, scores)
+        self.merge(rows, np.broadcast_to(cols, scores.shape), scores)
+
+    def pairs(self, indptr, indices, data):
+        """Devuelve (i, j, sim, rango) con sim > 0, ordenados por i y por similitud decreciente."""
+        pair_i = np.repeat(np.arange(len(self.ids)), self.k)
+        pair_j = self.ids.ravel()
+        valid = (pair_j >= 0) & (self.sims.ravel() > 0)
+        pair_i, pair_j = pair_i[valid], pair_j[valid]
+        sims = np.array([exact_dot(indptr, indices, data, i, j) for i, j in zip(pair_i, pair_j)], dtype=np.float64)
+        order = np.lexsort((pair_j, -sims, pair_i))
+        pair_i, pair_j, sims = pair_i[order], pair_j[order], sims[order]
+        starts = np.searchsorted(pair_i, pair_i, side='left')
+        return pair_i, pair_j, sims, np.arange(len(pair_i)) - starts + 1
+
+
+class AllPairsCosine:
+    """Búsqueda exacta de todos los pares con coseno >= threshold (familia AllPairs / L2AP).
+
+    Los términos se ordenan por frecuencia documental decreciente. De cada vector solo se indexa el sufijo:
+    el prefijo de términos frecuentes cuya cota min(sum x_t * max_t, ||x_prefijo||) no alcanza el umbral
+    queda fuera. Si dos vectores llegan al umbral comparten al menos un término en el sufijo de ambos, así
+    que los candidatos salen de recorrer las listas invertidas de los sufijos. Su producto parcial más la
+    cota de lo que falta (min de la cota del prefijo y ||x_prefijo|| * ||y hasta el mismo rango||, tomando
+    como x el vector con el prefijo más largo) descarta los que no pueden llegar, y los que quedan se
+    puntúan con exact_dot, igual que en PairwiseBlocks.
+    """
+
+    def __init__(self, indptr, indices, data, num_terms, threshold):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.threshold = threshold
+        self.num_docs = len(indptr) - 1
+        row_of = np.repeat(np.arange(self.num_docs), np.diff(indptr))
+
+        # Rango de cada término: 0 = el más frecuente
+        document_freqs = document_frequencies(indices, num_terms)
+        term_rank = np.empty(num_terms, dtype=np.int64)
+        term_rank[np.lexsort((np.arange(num_terms), -document_freqs))] = np.arange(num_terms)
+        max_weight = np.zeros(num_terms, dtype=np.float64)
+        np.maximum.at(max_weight, indices, data)
+
+        # Entradas de cada fila en orden de rango y cotas acumuladas del prefijo
+        order = np.lexsort((term_rank[indices], row_of))
+        ranks, weights = term_rank[indices[order]], data[order]
+        dot_bound = _segment_cumsum_internal(weights * max_weight[indices[order]], indptr, row_of)
+        norm_bound = np.sqrt(_segment_cumsum_internal(weights * weights, indptr, row_of))
+        bounds = np.minimum(dot_bound, norm_bound)
+        # El prefijo termina en la primera entrada que alcanza el umbral (la cota es creciente en cada fila)
+        position = np.arange(len(order)) - indptr[row_of]
+        prefix_length = np.diff(indptr).copy()
+        reaching = bounds >= threshold - _BOUND_SLACK
+        np.minimum.at(prefix_length, row_of[reaching], position[reaching])
+        in_prefix = position < prefix_length[row_of]
+
+        # Cota del prefijo y rango donde empieza el sufijo (num_terms si toda la fila es prefijo)
+        self.prefix_bound = np.zeros(self.num_docs, dtype=np.float64)
+        np.maximum.at(self.prefix_bound, row_of[in_prefix], bounds[in_prefix])
+        self.suffix_start = np.full(self.num_docs, num_terms, dtype=np.int64)
+        np.minimum.at(self.suffix_start, row_of[~in_prefix], ranks[~in_prefix])
+        # Norma acumulada por (fila, rango) para la cota ||x_prefijo|| * ||y_(rango < inicio del sufijo de x)||
+        self.num_terms = num_terms
+        self._rank_keys = row_of.astype(np.int64) * num_terms + ranks
+        self._squares_before = np.concatenate(([0.0], _segment_cumsum_internal(weights * weights, indptr, row_of)))
+
+        # Listas invertidas de los sufijos, ordenadas por (término, fila)
+        indexed = ~in_prefix & (weights > 0)
+        suffix_terms, suffix_rows, suffix_weights = indices[order][indexed], row_of[indexed], weights[indexed]
+        self._entry_ptr = np.zeros(self.num_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(suffix_rows, minlength=self.num_docs), out=self._entry_ptr[1:])
+        self._entry_terms, self._entry_weights = suffix_terms, suffix_weights
+        self.num_indexed = len(suffix_terms)
+        posting_order = np.lexsort((suffix_rows, suffix_terms))
+        self._posting_keys = suffix_terms[posting_order].astype(np.int64) * self.num_docs + suffix_rows[posting_order]
+        self._posting_rows = suffix_rows[posting_order]
+        self._posting_weights = suffix_weights[posting_order]
+        self._posting_end = np.cumsum(np.bincount(suffix_terms, minlength=num_terms))
+
+    def _postings_walk_internal(self, row_start, row_end):
+        # Para cada entrada de sufijo de las filas del bloque, tramo de su lista invertida con filas posteriores
+        lo, hi = self._entry_ptr[row_start], self._entry_ptr[row_end]
+        rows = np.repeat(np.arange(row_start, row_end), np.diff(self._entry_ptr[row_start:row_end + 1]))
+        terms = self._entry_terms[lo:hi]
+        starts = np.searchsorted(self._posting_keys, terms.astype(np.int64) * self.num_docs + rows, side='right')
+        return rows, self._entry_weights[lo:hi], starts, self._posting_end[terms] - starts
+
+    def _partial_scores_internal(self, rows, weights, starts, counts):
+        # Producto parcial sobre los sufijos, acumulado por par (i, j) y ordenado por (i, j)
+        total = int(counts.sum())
+        positions = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts) + np.arange(total)
+        codes = np.repeat(rows.astype(np.int64), counts) * self.num_docs + self._posting_rows[positions]
+        codes, inverse = np.unique(codes, return_inverse=True)
+        partial = np.bincount(inverse, weights=np.repeat(weights, counts) * self._posting_weights[positions],
+                              minlength=len(codes))
+        return codes // self.num_docs, codes % self.num_docs, partial
+
+    def _norm_before_internal(self, rows, rank):
+        # ||fila restringida a los términos de rango < rank||
+        position = np.searchsorted(self._rank_keys, rows * self.num_terms + rank)
+        squares = np.where(position > self.indptr[rows], self._squares_before[position], 0.0)
+        return np.sqrt(np.maximum(squares, 0.0))
+
+    def _prefix_bound_internal(self, pair_i, pair_j):
+        # Lo que falta del producto está en los términos de rango menor que el sufijo más tardío de los dos
+        longer = np.where(self.suffix_start[pair_i] >= self.suffix_start[pair_j], pair_i, pair_j)
+        other = np.where(longer == pair_i, pair_j, pair_i)
+        cut = self.suffix_start[longer]
+        pair_bound = self._norm_before_internal(longer, cut) * self._norm_before_internal(other, cut)
+        return np.minimum(self.prefix_bound[longer], pair_bound)
+
+    def block_pairs(self, row_start, row_end, should_stop=None):
+        """Devuelve (i, j, sim) de los pares con i en [row_start, row_end), j > i y coseno >= threshold.
+
+        should_stop se consulta antes de cada grupo de filas; si devuelve True, el resultado es None.
+        """
+        rows, weights, starts, counts = self._postings_walk_internal(row_start, row_end)
+        # Las filas se agrupan para acotar el número de entradas de listas invertidas recorridas a la vez
+        row_bounds = self._entry_ptr[row_start:row_end + 1] - self._entry_ptr[row_start]
+        walked = np.concatenate(([0], np.cumsum(counts)))[row_bounds]
+        found = ([], [], [])
+        group = 0
+        while group < row_end - row_start:
+            if should_stop and should_stop():
+                return None
+            next_group = max(group + 1, int(np.searchsorted(walked, walked[group] + _MAX_BLOCK_CELLS, side='right')) - 1)
+            next_group = min(next_group, row_end - row_start)
+            span = slice(row_bounds[group], row_bounds[next_group])
+            pair_i, pair_j, partial = self._partial_scores_internal(rows[span], weights[span], starts[span],
+                                                                    counts[span])
+            keep = partial + self._prefix_bound_internal(pair_i, pair_j) >= self.threshold - _BOUND_SLACK
+            pair_i, pair_j = pair_i[keep], pair_j[keep]
+            sims = np.array([exact_dot(self.indptr, self.indices, self.data, i, j) for i, j in zip(pair_i, pair_j)],
+                            dtype=np.float64)
+            keep = sims >= self.threshold
+            found[0].append(pair_i[keep])
+            found[1].append(pair_j[keep])
+            found[2].append(sims[keep])
+            group = next_group
+        pair_i, pair_j, sims = (np.concatenate(part) if part else np.zeros(0) for part in found)
+        return pair_i.astype(np.int64), pair_j.astype(np.int64), sims
+
+
+def minhash_signatures(indptr, indices, num_perm=128, seed=1):
+    """Firmas MinHash (documentos × num_perm, uint64) de los conjuntos de IDs de cada fila CSR.
+
+    Las filas vacías quedan con todas las posiciones en el primo, así que comparten todos los buckets
+    entre sí (Jaccard 1.0, como en el modo exacto) y ninguno con las demás.
+    """
+    rng = np.random.RandomState(seed)
+    perm_a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+    perm_b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+    num_docs = len(indptr) - 1
+    signatures = np.full((num_docs, num_perm), _MERSENNE_PRIME, dtype=np.uint64)
+    non_empty = np.flatnonzero(np.diff(indptr) > 0)
+    row_ends = indptr[non_empty + 1]
+    max_values = max(1, _MAX_HASH_CELLS // num_perm)
+    start = 0
+    while start < len(non_empty):
+        # Grupo de filas cuyos valores caben en el límite de celdas (al menos una fila)
+        end = max(start + 1, int(np.searchsorted(row_ends, indptr[non_empty[start]] + max_values, side='right')))
+        rows = non_empty[start:end]
+        lo, hi = indptr[rows[0]], indptr[rows[-1] + 1]
+        hashes = indices[lo:hi].astype(np.uint64)
+        # Permutaciones × valores: el mínimo por fila recorre memoria contigua (reduceat en axis=1)
+        permuted = (perm_a[:, None] * hashes[None, :] + perm_b[:, None]) % _MERSENNE_PRIME
+        signatures[rows] = np.minimum.reduceat(permuted, indptr[rows] - lo, axis=1).T
+        start = end
+    return signatures
+
+
+def _jaccard_batch_internal(indptr, indices, sizes, pair_i, pair_j, num_terms):
+    # Jaccard exacto de varios pares a la vez: los IDs de cada lado se codifican como par * num_terms + ID,
+    # que ya queda ordenado (índices ordenados por fila), y la intersección se cuenta con searchsorted
+    keys = []
+    for rows in (pair_i, pair_j):
+        lengths = sizes[rows]
+        offsets = np.repeat(indptr[rows] - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        pair_ids = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+        keys.append(pair_ids * num_terms + indices[offsets + np.arange(int(lengths.sum()))])
+    keys_i, keys_j = keys
+    positions = np.minimum(np.searchsorted(keys_i, keys_j), max(0, len(keys_i) - 1))
+    shared = keys_j[keys_i[positions] == keys_j] if len(keys_i) else keys_j[:0]
+    intersections = np.bincount(shared // num_terms, minlength=len(pair_i)).astype(np.float64)
+    unions = sizes[pair_i] + sizes[pair_j] - intersections
+    return np.divide(intersections, unions, out=np.ones_like(intersections), where=unions > 0)
+
+
+def lsh_parameters(threshold, num_perm, background_sims, max_candidate_rate=_LSH_MAX_CANDIDATE_RATE,
+                   recall_target=_LSH_RECALL_TARGET, max_num_perm=_LSH_MAX_NUM_PERM):
+    """Elige (bandas, filas, num_perm) con un modelo de coste, con bandas * filas <= num_perm.
+
+    Un par con Jaccard s es candidato con probabilidad 1-(1-s^filas)^bandas: la tasa esperada de
+    candidatos es la media de esa curva S sobre background_sims (Jaccard de parejas al azar) y el recall
+    en el umbral es su valor en s = threshold. Gana la configuración más barata con recall >= recall_target
+    y tasa <= max_candidate_rate; si no cabe en num_perm se sube num_perm (hasta max_num_perm) y, si aun así
+    ninguna cumple la cota de tasa, se relaja la cota. Solo si ninguna llega a recall_target se devuelve la
+    de mayor recall en el umbral.
+    """
+    background_sims = np.asarray(background_sims, dtype=np.float64)
+    max_num_perm = max(num_perm, max_num_perm)
+    options = []
+    for rows in range(1, max_num_perm + 1):
+        hit_per_band = threshold ** rows
+        if hit_per_band >= 1.0:
+            bands = 1
+        elif hit_per_band <= 0.0 or recall_target >= 1.0:
+            continue
+        else:
+            # Con filas fijas, recall y tasa crecen con las bandas: basta con el mínimo que llega al objetivo
+            min_bands = math.log1p(-recall_target) / math.log1p(-hit_per_band)
+            if min_bands * rows > max_num_perm:
+                continue
+            bands = max(1, math.ceil(min_bands))
+        rate = float(np.mean(1 - (1 - background_sims ** rows) ** bands)) if len(background_sims) else 0.0
+        options.append((rate, bands * rows, bands, rows))
+    for allowed_perm, allowed_rate in ((num_perm, max_candidate_rate), (max_num_perm, max_candidate_rate),
+                                       (max_num_perm, 1.0)):
+        eligible = [option for option in options if option[1] <= allowed_perm and option[0] <= allowed_rate]
+        if eligible:
+            _, used_perm, bands, rows = min(eligible)
+            return bands, rows, max(num_perm, used_perm)
+    rows = max(range(1, num_perm + 1), key=lambda rows: 1 - (1 - threshold ** rows) ** (num_perm // rows))
+    return num_perm // rows, rows, num_perm
+
+
+class JaccardLSH:
+    """Pares con Jaccard >= threshold por MinHash + LSH, sin comparar todas las parejas.
+
+    Cada banda de rows posiciones de la firma se agrupa por valor; dos documentos son candidatos si
+    coinciden en al menos una banda y solo esos candidatos se verifican con el Jaccard exacto de sus
+    conjuntos de tokens. Si no se indican, bands/rows salen de lsh_parameters con la distribución de
+    Jaccard de _LSH_BACKGROUND_PAIRS parejas al azar del propio corpus (num_perm puede subir para llegar
+    a recall_target); las permutaciones que no entran en las bandas afinan el prefiltro por estimación.
+    """
+
+    def __init__(self, indptr, indices, threshold, num_perm=384, bands=None, rows=None, seed=1,
+                 max_candidate_rate=_LSH_MAX_CANDIDATE_RATE, recall_target=_LSH_RECALL_TARGET):
+        if bands is not None and rows is not None and bands * rows > num_perm:
+            raise ValueError(f"bands * rows ({bands * rows}) no puede superar num_perm ({num_perm})")
+        self.indptr = indptr
+        self.indices = indices
+        self.threshold = threshold
+        self.num_docs = len(indptr) - 1
+        self.num_terms = int(indices.max()) + 1 if len(indices) else 1
+        self.sizes = np.diff(indptr)
+        if bands is None or rows is None:
+            bands, rows, num_perm = lsh_parameters(threshold, num_perm, self._background_sims_internal(seed),
+                                                   max_candidate_rate, recall_target)
+        self.bands = bands
+        self.rows = rows
+        self.num_perm = num_perm
+        # Los valores de la firma son < 2^31: en uint32 ocupan y cuestan la mitad al compararlos
+        self.signatures = minhash_signatures(indptr, indices, num_perm, seed).astype(np.uint32)
+        # Los rellena verified_pairs: pares distintos que fueron candidatos y parejas posibles
+        self.num_candidates = 0
+        self.num_possible_pairs = 0
+
+    def _background_sims_internal(self, seed):
+        # Jaccard exacto de parejas al azar (i != j), la distribución de fondo del modelo de coste
+        if self.num_docs < 2:
+            return np.zeros(0)
+        rng = np.random.RandomState(seed)
+        pair_i = rng.randint(0, self.num_docs, _LSH_BACKGROUND_PAIRS)
+        pair_j = rng.randint(0, self.num_docs - 1, _LSH_BACKGROUND_PAIRS)
+        pair_j += pair_j >= pair_i
+        return _jaccard_batch_internal(self.indptr, self.indices, self.sizes, pair_i, pair_j, self.num_terms)
+
+    @property
+    def candidate_fraction(self):
+        """Fracción de las parejas posibles que hubo que verificar (1.0 equivale al modo exacto)."""
+        return self.num_candidates / self.num_possible_pairs if self.num_possible_pairs else 0.0
+
+    def _band_buckets_internal(self, band):
+        # Bucket de cada documento en esta banda (mismo bucket = mismas rows posiciones de la firma)
+        band_values = np.ascontiguousarray(self.signatures[:, band * self.rows:(band + 1) * self.rows])
+        keys = band_values.view(np.dtype((np.void, band_values.dtype.itemsize * self.rows))).ravel()
+        _, bucket_of = np.unique(keys, return_inverse=True)
+        return bucket_of.ravel().astype(np.int32)
+
+    def _band_candidates_internal(self, bucket_of, row_limit):
+        # Pares (i, j), i < j, del mismo bucket con i < row_limit: cada miembro de un bucket se empareja con
+        # los que le siguen (sin un bucle por bucket ni triu_indices)
+        order = np.argsort(bucket_of, kind='stable')
+        bucket_ends = np.cumsum(np.bincount(bucket_of))
+        followers = bucket_ends[bucket_of[order]] - np.arange(self.num_docs) - 1
+        followers[order >= row_limit] = 0
+        first = np.repeat(np.arange(self.num_docs), followers)
+        second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(followers) - followers, followers)
+        return order[first], order[second]
+
+    def _screen_internal(self, earlier_buckets, pair_i, pair_j):
+        # Descarta los pares que ya compartieron bucket en una banda anterior (earlier_buckets: documentos ×
+        # bandas ya recorridas; se contaron y verificaron allí), cuenta los nuevos y aplica el prefiltro:
+        # si min(|A|, |B|) / max(|A|, |B|) < threshold el Jaccard tampoco llega, y si la estimación MinHash
+        # queda más de _ESTIMATE_SIGMAS desviaciones típicas por debajo del umbral el par casi con
+        # seguridad es un falso positivo de las bandas
+        num_perm = self.signatures.shape[1]
+        min_matches = num_perm * (self.threshold
+                                  - _ESTIMATE_SIGMAS * np.sqrt(self.threshold * (1 - self.threshold) / num_perm))
+        kept_i, kept_j = [], []
+        step = max(1, _MAX_HASH_CELLS // num_perm)
+        for start in range(0, len(pair_i), step):
+            chunk_i, chunk_j = pair_i[start:start + step], pair_j[start:start + step]
+            new = ~(earlier_buckets[chunk_i] == earlier_buckets[chunk_j]).any(axis=1)
+            chunk_i, chunk_j = chunk_i[new], chunk_j[new]
+            self.num_candidates += len(chunk_i)
+            size_i, size_j = self.sizes[chunk_i], self.sizes[chunk_j]
+            keep = np.minimum(size_i, size_j) >= self.threshold * np.maximum(size_i, size_j)
+            chunk_i, chunk_j = chunk_i[keep], chunk_j[keep]
+            keep = np.count_nonzero(self.signatures[chunk_i] == self.signatures[chunk_j], axis=1) >= min_matches
+            kept_i.append(chunk_i[keep])
+            kept_j.append(chunk_j[keep])
+        if not kept_i:
+            return pair_i[:0], pair_j[:0]
+        return np.concatenate(kept_i), np.concatenate(kept_j)
+
+    def _verify_internal(self, pair_i, pair_j):
+        sims = np.zeros(len(pair_i), dtype=np.float64)
+        # Grupos de candidatos con un número acotado de IDs concatenados (al menos un par)
+        pair_ends = np.cumsum(self.sizes[pair_i] + self.sizes[pair_j])
+        start = 0
+        while start < len(pair_i):
+            end = max(start + 1, int(np.searchsorted(pair_ends, pair_ends[start] + _MAX_HASH_CELLS, side='right')))
+            sims[start:end] = _jaccard_batch_internal(self.indptr, self.indices, self.sizes,
+                                                      pair_i[start:end], pair_j[start:end], self.num_terms)
+            start = end
+        keep = sims >= self.threshold
+        return pair_i[keep], pair_j[keep], sims[keep]
+
+    def verified_pairs(self, row_limit=None, should_stop=None):
+        """Devuelve (i, j, sim) con Jaccard exacto >= threshold, ordenados por (i, j).
+
+        Los candidatos se generan, deduplican y verifican banda a banda, así que solo se guardan los de
+        una banda y los pares ya verificados. Con row_limit solo cuentan los pares con i < row_limit.
+        should_stop se consulta antes de cada banda; si devuelve True, el resultado es None.
+        """
+        row_limit = self.num_docs if row_limit is None else min(row_limit, self.num_docs)
+        self.num_candidates = 0
+        self.num_possible_pairs = row_limit * (self.num_docs - 1) - row_limit * (row_limit - 1) // 2
+        band_buckets = np.zeros((self.num_docs, self.bands), dtype=np.int32)
+        found = ([], [], [])
+        for band in range(self.bands):
+            if should_stop and should_stop():
+                return None
+            band_buckets[:, band] = self._band_buckets_internal(band)
+            pair_i, pair_j = self._screen_internal(band_buckets[:, :band],
+                                                   *self._band_candidates_internal(band_buckets[:, band], row_limit))
+            for part, values in zip(found, self._verify_internal(pair_i, pair_j)):
+                part.append(values)
+        pair_i, pair_j, sims = (np.concatenate(part) for part in found)
+        order = np.lexsort((pair_j, pair_i))
+        return pair_i[order].astype(np.int64), pair_j[order].astype(np.int64), sims[order]
+
+
+def exact_jaccard_pairs_for_rows(indptr, indices, num_terms, sample_rows, threshold, block_rows=None):
+    """Pares (i, j), i < j, con Jaccard exacto >= threshold en los que participa alguna fila de sample_rows."""
+    column_map, num_columns = _shared_columns_internal(indices, num_terms)
+    sizes = np.diff(indptr)
+    sample_rows = np.asarray(sample_rows, dtype=np.int64)
+    sample_binary = np.zeros((len(sample_rows), max(1, num_columns)), dtype=np.float32)
+    for pos, row in enumerate(sample_rows):
+        columns = column_map[indices[indptr[row]:indptr[row + 1]]]
+        sample_binary[pos, columns[columns >= 0]] = 1.0
+    ones = np.ones(len(indices), dtype=np.float32)
+    codes = []
+    for col_start, col_end in row_blocks(len(sizes), block_rows or block_size(num_columns)):
+        cols_binary = _dense_block_internal(indptr, indices, ones, column_map, num_columns, col_start, col_end)
+        intersections = (sample_binary @ cols_binary.T).astype(np.float64)
+        unions = sizes[sample_rows][:, None] + sizes[col_start:col_end][None, :] - intersections
+        jaccard = np.divide(intersections, unions, out=np.ones_like(intersections), where=unions > 0)
+        local_i, local_j = np.nonzero(jaccard >= threshold)
+        rows_i, rows_j = sample_rows[local_i], local_j + col_start
+        distinct = rows_i != rows_j
+        low, high = np.minimum(rows_i, rows_j)[distinct], np.maximum(rows_i, rows_j)[distinct]
+        codes.append(low * len(sizes) + high)
+    codes = np.unique(np.concatenate(codes)) if codes else np.zeros(0, dtype=np.int64)
+    return codes // len(sizes), codes % len(sizes)
+
+
+def estimate_lsh_recall(indptr, indices, num_terms, found_i, found_j, threshold, sample_size, seed=0):
+    """Recall de los pares encontrados por LSH frente al modo exacto, sobre una muestra de filas.
+
+    Devuelve (recall, pares encontrados, pares exactos, tamaño de la muestra); recall es None si la
+    muestra no tiene ningún par por encima del umbral.
+    """
+    num_docs = len(indptr) - 1
+    sample_rows = np.sort(np.random.RandomState(seed).choice(num_docs, min(sample_size, num_docs), replace=False))
+    exact_i, exact_j = exact_jaccard_pairs_for_rows(indptr, indices, num_terms, sample_rows, threshold)
+    in_sample = np.zeros(num_docs, dtype=np.bool_)
+    in_sample[sample_rows] = True
+    found_i, found_j = np.asarray(found_i, dtype=np.int64), np.asarray(found_j, dtype=np.int64)
+    touched = in_sample[found_i] | in_sample[found_j]
+    found = int(np.isin(exact_i * num_docs + exact_j, found_i[touched] * num_docs + found_j[touched]).sum())
+    expected = len(exact_i)
+    return (found / expected if expected else None), found, expected, len(sample_rows)
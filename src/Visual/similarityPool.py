@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+from src.Visual import similarityMatrix
+
+# Comparación en paralelo: la matriz TF-IDF (CSR) se copia una sola vez a multiprocessing.shared_memory,
+# cada proceso del pool la adjunta sin copiarla y reconstruye su motor de comparación, y los bloques de
+# filas se reparten como tareas. Los resultados vuelven en el orden de los bloques.
+# Los procesos se crean con 'spawn' y no con fork: la GUI llama desde un hilo de trabajo y hacer fork de un
+# proceso con varios hilos (Tk incluido) puede dejar el hijo bloqueado en un lock heredado.
+_POOL_START_METHOD = 'spawn'
+
+# Bloques en vuelo por proceso: acota la memoria de resultados pendientes de escribir
+_BLOCKS_IN_FLIGHT_PER_WORKER = 2
+# Cada cuánto (segundos) se revisa stop_event mientras se espera un bloque
+_STOP_POLL_SECONDS = 0.2
+
+# Estado del proceso trabajador (se crea una sola vez en el initializer del pool):
+# (segmentos de memoria compartida, PairwiseBlocks, AllPairsCosine o None, k de los vecinos o None,
+#  evento de parada)
+_worker_state = None
+
+
+class SharedArrays:
+    """Arrays NumPy copiados a segmentos de memoria compartida; specs describe cómo adjuntarlos."""
+
+    def __init__(self, **arrays):
+        self._segments = []
+        self.specs = {}
+        try:
+            for name, array in arrays.items():
+                segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                self._segments.append(segment)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+                self.specs[name] = (segment.name, array.shape, array.dtype.str)
+        except BaseException:
+            # Sin esto, un fallo a mitad (p. ej. /dev/shm lleno) dejaría los segmentos anteriores sin liberar
+            self.close()
+            raise
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+
+def attach_shared_arrays(specs):
+    # Devuelve (segmentos, arrays); los segmentos deben seguir vivos mientras se usen los arrays
+    segments, arrays = [], {}
+    for name, (segment_name, shape, dtype) in specs.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        segments.append(segment)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+    return segments, arrays
+
+
+def _init_comparison_worker_internal(specs, num_terms, cosine_threshold, jaccard_threshold, cosine_method,
+                                     block_rows, top_k, stop_flag):
+    global _worker_state
+    segments, arrays = attach_shared_arrays(specs)
+    use_all_pairs = cosine_method == 'allpairs'
+    blocks = similarityMatrix.PairwiseBlocks(arrays["indptr"], arrays["indices"], arrays["data"], num_terms,
+                                             None if use_all_pairs else cosine_threshold, jaccard_threshold,
+                                             block_rows)
+    all_pairs = similarityMatrix.AllPairsCosine(arrays["indptr"], arrays["indices"], arrays["data"], num_terms,
+                                                cosine_threshold) if use_all_pairs else None
+    _worker_state = (segments, blocks, all_pairs, top_k, stop_flag)
+
+
+def _compare_block_worker_internal(block):
+    _, blocks, all_pairs, top_k, stop_flag = _worker_state
+    if stop_flag.is_set():
+        return None
+    row_start, row_end = block
+    # Vecinos parciales del bloque: solo tocan las filas >= row_start, el proceso principal los combina
+    neighbours = similarityMatrix.TopKNeighbours(blocks.num_docs, top_k) if top_k else None
+    pairs = blocks.block_pairs(row_start, row_end, stop_flag.is_set, neighbours)
+    if pairs is not None and neighbours is not None:
+        pairs["topk"] = (np.arange(row_start, blocks.num_docs), neighbours.ids[row_start:],
+                         neighbours.sims[row_start:])
+    if pairs is not None and all_pairs is not None:
+        pairs["tfidf"] = all_pairs.block_pairs(row_start, row_end, stop_flag.is_set)
+        if pairs["tfidf"] is None:
+            return None
+    return pairs
+
+
+def iter_block_pairs_parallel(indptr, indices, data, num_terms, blocks, block_rows, cosine_threshold,
+                              jaccard_threshold=None, cosine_method='blocks', stop_event=None, max_workers=None,
+                              top_k=None):
+    """Genera (bloque, pares) en el orden de blocks, comparando los bloques en un pool de procesos.
+
+    pares tiene la forma de PairwiseBlocks.block_pairs; con top_k incluye además 'topk': (filas, ids, sims),
+    los vecinos parciales del bloque para TopKNeighbours.merge. Si stop_event se activa, las tareas pendientes se
+    cancelan, los procesos abandonan el bloque en curso en el siguiente bloque de columnas y el generador
+    termina sin más resultados.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    context = multiprocessing.get_context(_POOL_START_METHOD)
+    stop_flag = context.Event()
+    shared = None
+    executor = None
+    try:
+        # Dentro del try: si el pool no arranca, los segmentos ya creados se liberan igual
+        shared = SharedArrays(indptr=indptr, indices=indices, data=data)
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                       initializer=_init_comparison_worker_internal,
+                                       initargs=(shared.specs, num_terms, cosine_threshold, jaccard_threshold,
+                                                 cosine_method, block_rows, top_k, stop_flag))
+        in_flight_limit = _BLOCKS_IN_FLIGHT_PER_WORKER * max_workers
+        pending_blocks = deque(blocks)
+        in_flight = deque()
+        while pending_blocks or in_flight:
+            while pending_blocks and len(in_flight) < in_flight_limit:
+                block = pending_blocks.popleft()
+                in_flight.append((block, executor.submit(_compare_block_worker_internal, block)))
+            block, future = in_flight[0]
+            while not wait([future], timeout=_STOP_POLL_SECONDS).done:
+                if stop_event and stop_event.is_set():
+                    break
+            if stop_event and stop_event.is_set():
+                return
+            in_flight.popleft()
+            pairs = future.result()
+            if pairs is None:
+                return
+            yield block, pairs
+    finally:
+        stop_flag.set()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if shared is not None:
+            shared.close()
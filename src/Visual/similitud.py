@@ -1,10 +1,16 @@
-import csv
-import math
+import shutil
 import string
 import os
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.customization import convert_to_unicode, homogenize_latex_encoding
+import time
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from src.Parsing import CorpusStore
+from src.Parsing.BibReader import iter_bib_entries
+from src.Visual import pairSink, similarityCheckpoint, similarityMatrix, similarityPool
+
+# Cada cuánto (segundos) se guarda el punto de control durante la comparación, además de al detenerse
+_SEGUNDOS_PUNTO_CONTROL = 30
+
 
 def _limpiar_texto_internal(texto, status_callback):
     if not isinstance(texto, str):
@@ -18,161 +24,119 @@ def _limpiar_texto_internal(texto, status_callback):
         return []
 
 
-def _calcular_tf_internal(texto, status_callback):
-    tf = {}
-    palabras = _limpiar_texto_internal(texto, status_callback)
-    if not palabras:
-        return tf
-    for palabra in palabras:
-        tf[palabra] = tf.get(palabra, 0) + 1
-    total_palabras = len(palabras)
-    if total_palabras == 0:
-        return tf
-    for palabra in tf:
-        tf[palabra] /= total_palabras
-    return tf
-
-
-def _calcular_idf_internal(documentos_texto, status_callback, stop_event=None):  # Añadido stop_event
-    N = len(documentos_texto)
-    if N == 0:
-        status_callback("SimilarityAnalyzer: No hay documentos para calcular IDF.")
-        return {}
-    idf = {}
-    for idx, texto in enumerate(documentos_texto):
-        if stop_event and stop_event.is_set():
-            status_callback("SimilarityAnalyzer: Cálculo de IDF detenido.")
-            return idf  # Retornar lo calculado hasta ahora
-        if idx % 500 == 0 and idx > 0:
-            status_callback(f"SimilarityAnalyzer: (IDF) Procesando documento {idx + 1}/{N}...")
-        palabras_unicas_doc = set(_limpiar_texto_internal(texto, status_callback))
-        for palabra in palabras_unicas_doc:
-            idf[palabra] = idf.get(palabra, 0) + 1
-
-    palabras_a_eliminar_idf = []
-    for palabra, num_documentos_con_palabra in idf.items():
-        if num_documentos_con_palabra <= 0:
-            palabras_a_eliminar_idf.append(palabra)
-            continue
-        try:
-            idf[palabra] = math.log(N / float(num_documentos_con_palabra))
-        except ValueError:
-            idf[palabra] = 0.0
-
-    for palabra_a_eliminar in palabras_a_eliminar_idf:
-        if palabra_a_eliminar in idf: del idf[palabra_a_eliminar]
-    return idf
-
-
-def _calcular_tfidf_internal(documentos_texto, status_callback, stop_event=None):  # Añadido stop_event
+def _vectorizar_tfidf_internal(documentos_texto, status_callback, stop_event=None, vocabulary=None, idf=None):
+    # Cada abstract se tokeniza una sola vez a IDs enteros; los vectores TF-IDF (tf = conteo / tokens,
+    # idf = log(N / df)) quedan en una matriz CSR normalizada en L2. None si se detiene.
+    # vocabulary / idf: los de un punto de control o de la ejecución anterior (modo incremental), para
+    # reconstruir exactamente los mismos vectores; los términos nuevos reciben el IDF del corpus actual, que
+    # queda además en 'current_idf' para medir la deriva.
     if not documentos_texto:
         status_callback("SimilarityAnalyzer: No hay documentos para calcular TF-IDF.")
-        return []
-    status_callback("SimilarityAnalyzer: Calculando IDF para todos los documentos (puede ser detenido)...")
-    idf_map = _calcular_idf_internal(documentos_texto, status_callback, stop_event)  # Pasar stop_event
-
-    if stop_event and stop_event.is_set():
-        status_callback("SimilarityAnalyzer: Cálculo de TF-IDF detenido durante IDF.")
-        return []
-
-    status_callback("SimilarityAnalyzer: IDF calculado.")
-
-    vectores_tfidf_list = []
+        return None
     total_docs = len(documentos_texto)
+    tokens_por_documento = []
     for idx, texto in enumerate(documentos_texto):
         if stop_event and stop_event.is_set():
-            status_callback(f"SimilarityAnalyzer: Cálculo de TF-IDF detenido en vector {idx + 1}/{total_docs}.")
-            break
-        if idx % 100 == 0 or idx == total_docs - 1:
-            status_callback(f"SimilarityAnalyzer: Calculando TF-IDF - Vector {idx + 1}/{total_docs}")
-        tf_vector = _calcular_tf_internal(texto, status_callback)
-        tfidf_vector_actual = {}
-        for palabra, tf_score in tf_vector.items():
-            tfidf_vector_actual[palabra] = tf_score * idf_map.get(palabra, 0.0)
-        vectores_tfidf_list.append(tfidf_vector_actual)
-
-    if not (stop_event and stop_event.is_set()):
-        status_callback("SimilarityAnalyzer: Todos los vectores TF-IDF calculados.")
-    return vectores_tfidf_list
-
-
-def _coseno_internal(v1, v2):
-    if not isinstance(v1, dict) or not isinstance(v2, dict):
-        return 0.0
-    if len(v1) > len(v2):
-        v1, v2 = v2, v1
-    dot_product = 0.0
-    for k, v1_val in v1.items():
-        dot_product += v1_val * v2.get(k, 0.0)
-    mag1_sq = sum(v ** 2 for v in v1.values())
-    mag2_sq = sum(v ** 2 for v in v2.values())
-    if mag1_sq == 0 or mag2_sq == 0:
-        return 0.0
-    magnitude = math.sqrt(mag1_sq) * math.sqrt(mag2_sq)
-    if magnitude == 0:
-        return 0.0
-    return dot_product / magnitude
-
-
-def _jaccard_internal(s1, s2, status_callback):
-    set1 = set(_limpiar_texto_internal(s1, status_callback))
-    set2 = set(_limpiar_texto_internal(s2, status_callback))
-    if not set1 and not set2:
-        return 1.0
-    interseccion = set1.intersection(set2)
-    union = set1.union(set2)
-    if not union:
-        return 0.0
-    return len(interseccion) / float(len(union))
-
-
-# --- Función principal para llamar desde gui_controller ---
-# MODIFICADO para aceptar stop_event
-def run_similarity_analysis(status_callback, project_root_dir, stop_event=None):  # AÑADIDO stop_event
-    status_callback("Iniciando Análisis de Similitud de Abstracts...")
-
-    bibtex_file_input = os.path.join(project_root_dir, "output", "parsing", "unificados.bib")  #
-
-    output_similarity_dir = os.path.join(project_root_dir, "output", "similarity_analysis")
-    os.makedirs(output_similarity_dir, exist_ok=True)
-
-    report_txt_path = os.path.join(output_similarity_dir, "similarity_full_report.txt")
-    tfidf_csv_path = os.path.join(output_similarity_dir, "similarity_tfidf_pairs.csv")
-    jaccard_csv_path = os.path.join(output_similarity_dir, "similarity_jaccard_pairs.csv")
+            status_callback(f"SimilarityAnalyzer: Tokenización detenida en el documento {idx + 1}/{total_docs}.")
+            return None
+        if idx % 1000 == 0 and idx > 0:
+            status_callback(f"SimilarityAnalyzer: Tokenizando documento {idx + 1}/{total_docs}...")
+        tokens_por_documento.append(_limpiar_texto_internal(texto, status_callback))
+
+    vocabulary, indptr, indices, counts, doc_lengths = similarityMatrix.encode_documents(tokens_por_documento,
+                                                                                         vocabulary)
+    current_idf = similarityMatrix.compute_idf(similarityMatrix.document_frequencies(indices, len(vocabulary)),
+                                               total_docs)
+    if idf is None:
+        idf = current_idf
+    elif len(idf) < len(vocabulary):
+        idf = np.concatenate((idf, current_idf[len(idf):]))
+    data = similarityMatrix.tfidf_weights(indptr, indices, counts, doc_lengths, idf)
+    status_callback(f"SimilarityAnalyzer: Matriz TF-IDF calculada ({total_docs} documentos, "
+                    f"{len(vocabulary)} términos, {len(indices)} valores no nulos).")
+    return {"vocabulary": vocabulary, "idf": idf, "current_idf": current_idf, "indptr": indptr, "indices": indices,
+            "data": data}
+
+
+def _orden_incremental_internal(huellas_previas, huellas):
+    # Orden de filas del modo incremental: primero los abstracts nuevos (en el orden del corpus) y después
+    # los de la ejecución anterior en su orden de filas previo, así las filas [0, nuevos) son lo único que
+    # hay que comparar. None si alguno de los anteriores cambió o ya no está.
+    posiciones = {}
+    for idx, huella in enumerate(huellas):
+        posiciones.setdefault(huella, []).append(idx)
+    anteriores = []
+    for huella in huellas_previas:
+        candidatas = posiciones.get(huella)
+        if not candidatas:
+            return None
+        anteriores.append(candidatas.pop(0))
+    usados = set(anteriores)
+    return [idx for idx in range(len(huellas)) if idx not in usados] + anteriores
+
+
+def _iter_pares_bloques_internal(bloques, bloques_pendientes, all_pairs, stop_event=None, vecinos=None):
+    # Compara los bloques de filas uno a uno en este hilo: cada bloque con todos los vectores posteriores
+    # en un producto de matrices. stop_event se revisa también dentro de cada bloque.
+    detener = stop_event.is_set if stop_event else None
+    for fila_inicio, fila_fin in bloques_pendientes:
+        pares_bloque = bloques.block_pairs(fila_inicio, fila_fin, detener, vecinos)
+        if pares_bloque is not None and all_pairs is not None:
+            pares_bloque["tfidf"] = all_pairs.block_pairs(fila_inicio, fila_fin, detener)
+        if pares_bloque is None or pares_bloque["tfidf"] is None:
+            return
+        yield (fila_inicio, fila_fin), pares_bloque
 
-    if not os.path.exists(bibtex_file_input):
-        status_callback(f"SimilarityAnalyzer: Error - Archivo BibTeX unificado no encontrado en {bibtex_file_input}")
-        status_callback("SimilarityAnalyzer completado (con error).")
-        return
 
-    # Chequeo inicial de stop_event
-    if stop_event and stop_event.is_set():
-        status_callback("SimilarityAnalyzer: Detenido por el usuario antes de cargar datos.")
+def _iter_pares_paralelo_internal(matriz_tfidf, bloques, bloques_pendientes, umbral_tfidf, umbral_jaccard,
+                                  cosine_method, stop_event, max_workers, top_k, vecinos, status_callback):
+    # Compara los bloques en el pool de similarityPool. Si no se puede crear la memoria compartida o el pool,
+    # o un proceso muere, los bloques que faltan se comparan en serie; los ya entregados (y quizá ya escritos
+    # o guardados en el punto de control) no se repiten porque el pool los entrega en orden.
+    entregados = 0
+    try:
+        for bloque, pares_bloque in similarityPool.iter_block_pairs_parallel(
+                matriz_tfidf["indptr"], matriz_tfidf["indices"], matriz_tfidf["data"],
+                len(matriz_tfidf["vocabulary"]), bloques_pendientes, bloques.block_rows, umbral_tfidf,
+                umbral_jaccard, cosine_method, stop_event, max_workers, top_k):
+            entregados += 1
+            yield bloque, pares_bloque
         return
-
+    except (BrokenProcessPool, OSError) as e:
+        status_callback(f"SimilarityAnalyzer: Warning - Falló la comparación en paralelo ({e}). "
+                        f"Se continúa en serie desde el bloque {entregados + 1} de {len(bloques_pendientes)}.")
+    all_pairs = None
+    if cosine_method == 'allpairs':
+        all_pairs = similarityMatrix.AllPairsCosine(matriz_tfidf["indptr"], matriz_tfidf["indices"],
+                                                    matriz_tfidf["data"], len(matriz_tfidf["vocabulary"]),
+                                                    umbral_tfidf)
+    yield from _iter_pares_bloques_internal(bloques, bloques_pendientes[entregados:], all_pairs, stop_event,
+                                            vecinos)
+
+
+def _cargar_abstracts_internal(bibtex_file_input, stop_event, status_callback):
+    # (abstracts, títulos, IDs) de las entradas con abstract. Solo se necesitan esos tres campos: se toman del
+    # almacén columnar si está al día, si no, lectura en streaming del BibTeX. None (ya reportado) si no hay
+    # entradas o falla la lectura.
     abstracts_list = []
     titulos_list = []
     entry_ids_list = []
 
     status_callback(f"SimilarityAnalyzer: Leyendo datos desde {os.path.basename(bibtex_file_input)}...")
     try:
-        with open(bibtex_file_input, 'r', encoding='utf-8') as bibfile:
-            parser = BibTexParser(common_strings=True)
-            parser.customization = lambda record: convert_to_unicode(homogenize_latex_encoding(record))
-            parser.ignore_errors = True
-            bib_database = bibtexparser.load(bibfile, parser=parser)  #
-
-        if not bib_database.entries:
-            status_callback("SimilarityAnalyzer: No se encontraron entradas en el archivo BibTeX.")
-            status_callback("SimilarityAnalyzer completado (sin datos).")
-            return
-
-        total_bib_entries = len(bib_database.entries)
-        for idx, entry in enumerate(bib_database.entries):
+        store_dir = os.path.join(os.path.dirname(bibtex_file_input), "corpus_store")
+        records = CorpusStore.iter_corpus_records(store_dir, ['ID', 'title', 'abstract'], bibtex_file_input)
+        if records is not None:
+            status_callback("SimilarityAnalyzer: Usando el almacén columnar del corpus (sin re-parsear BibTeX).")
+        else:
+            records = iter_bib_entries(bibtex_file_input, CorpusStore.NORMALIZATIONS['latex'], status_callback)
+        total_bib_entries = 0
+        for idx, entry in enumerate(records):
+            total_bib_entries += 1
             # Chequeo de stop_event dentro del bucle de carga (menos frecuente)
             if stop_event and stop_event.is_set() and idx > 0 and idx % 200 == 0:
                 status_callback(
-                    f"SimilarityAnalyzer: Carga de datos detenida en la entrada {idx + 1}/{total_bib_entries}.")
+                    f"SimilarityAnalyzer: Carga de datos detenida en la entrada {idx + 1}.")
                 break  # Salir del bucle de carga
             abstract_text = entry.get('abstract')
             title_text = entry.get('title', '').strip()
@@ -182,6 +146,11 @@ def run_similarity_analysis(status_callback, project_root_dir, stop_event=None):
                 abstracts_list.append(abstract_text)
                 titulos_list.append(title_text)
                 entry_ids_list.append(entry_id)
+
+        if total_bib_entries == 0:
+            status_callback("SimilarityAnalyzer: No se encontraron entradas en el archivo BibTeX.")
+            status_callback("SimilarityAnalyzer completado (sin datos).")
+            return None
         status_callback(f"SimilarityAnalyzer: {len(abstracts_list)} abstracts válidos cargados para análisis.")
 
     except Exception as e:
@@ -189,7 +158,238 @@ def run_similarity_analysis(status_callback, project_root_dir, stop_event=None):
         import traceback
         status_callback(traceback.format_exc())
         status_callback("SimilarityAnalyzer completado (con error).")
+        return None
+    return abstracts_list, titulos_list, entry_ids_list
+
+
+def _preparar_incremental_internal(output_similarity_dir, opciones_analisis, huellas_corpus, status_callback):
+    # Modo incremental: (instantánea de la última ejecución completa, orden de filas con los abstracts nuevos
+    # primero), o (None, None) si no hay una compatible o algún abstract anterior cambió o ya no está
+    snapshot = similarityCheckpoint.load_snapshot(output_similarity_dir, opciones_analisis)
+    if snapshot is None:
+        status_callback("SimilarityAnalyzer: Modo incremental sin una ejecución anterior compatible; "
+                        "se comparan todos los abstracts.")
+        return None, None
+    orden_filas = _orden_incremental_internal(snapshot["digests"], huellas_corpus)
+    if orden_filas is None:
+        status_callback("SimilarityAnalyzer: Modo incremental: hay abstracts de la ejecución anterior que "
+                        "cambiaron o se eliminaron; se comparan todos los abstracts.")
+        return None, None
+    return snapshot, orden_filas
+
+
+def _cargar_punto_control_internal(output_similarity_dir, bibtex_file_input, opciones):
+    # Punto de control con el mismo unificados.bib y las mismas opciones. Sobre una base incremental, la
+    # ejecución interrumpida pudo ser una reconstrucción completa por deriva del IDF (base_docs=0).
+    # Devuelve (checkpoint o None, opciones con las que se cargó).
+    checkpoint = similarityCheckpoint.load_checkpoint(output_similarity_dir, bibtex_file_input, opciones)
+    if checkpoint is None and opciones["base_docs"]:
+        opciones_completas = dict(opciones, base_docs=0)
+        checkpoint = similarityCheckpoint.load_checkpoint(output_similarity_dir, bibtex_file_input,
+                                                          opciones_completas)
+        if checkpoint is not None:
+            return checkpoint, opciones_completas
+    return checkpoint, opciones
+
+
+def _vectorizar_incremental_internal(abstracts_list, snapshot, idf_drift_tolerance, rebuild_on_drift, stop_event,
+                                     status_callback):
+    # Modo incremental: vectores con el vocabulario y el IDF de la ejecución anterior. El IDF de los términos
+    # anteriores queda congelado; la deriva mide cuánto se aleja del actual. Devuelve (matriz, reconstruir):
+    # reconstruir=True si la deriva supera la tolerancia y hay que recalcular todo con el IDF actual.
+    matriz_tfidf = _vectorizar_tfidf_internal(abstracts_list, status_callback, stop_event,
+                                              snapshot["vocabulary"], snapshot["idf"])
+    if matriz_tfidf is None:
+        return None, False
+    deriva = similarityMatrix.idf_drift(snapshot["idf"], matriz_tfidf["current_idf"])
+    status_callback(f"SimilarityAnalyzer: Deriva del IDF respecto a la ejecución anterior: {deriva:.4f} "
+                    f"(tolerancia: {idf_drift_tolerance}).")
+    if deriva > idf_drift_tolerance and rebuild_on_drift:
+        status_callback("SimilarityAnalyzer: La deriva supera la tolerancia; se recalculan todos los "
+                        "pares con el IDF actual.")
+        return None, True
+    if deriva > idf_drift_tolerance:
+        status_callback("SimilarityAnalyzer: Advertencia - la deriva supera la tolerancia; se mantiene "
+                        "el IDF congelado (rebuild_on_drift=False).")
+    return matriz_tfidf, False
+
+
+def _pares_jaccard_lsh_internal(matriz_tfidf, opciones, limite_filas, stop_event, status_callback):
+    # Modo LSH: los pares Jaccard se obtienen antes de la pasada por bloques y se reparten por fila inicial.
+    # En modo incremental solo los pares con algún abstract nuevo (la fila menor es la del nuevo).
+    lsh = similarityMatrix.JaccardLSH(matriz_tfidf["indptr"], matriz_tfidf["indices"], opciones["umbral_jaccard"],
+                                      opciones["lsh_num_perm"], opciones["lsh_bands"], opciones["lsh_rows"],
+                                      max_candidate_rate=opciones["lsh_max_candidate_rate"])
+    pares_lsh = lsh.verified_pairs(limite_filas, stop_event.is_set if stop_event else None)
+    if pares_lsh is None:
+        # La pasada por bloques tampoco arrancará: stop_event ya está activo
+        status_callback("SimilarityAnalyzer: Verificación LSH detenida por el usuario.")
+        return lsh, (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+    status_callback(
+        f"SimilarityAnalyzer: LSH ({lsh.bands} bandas × {lsh.rows} filas, {lsh.num_perm} "
+        f"permutaciones): {lsh.num_candidates} candidatos ({lsh.candidate_fraction:.2%} de las "
+        f"parejas), {len(pares_lsh[0])} pares Jaccard >= {opciones['umbral_jaccard']} verificados.")
+    return lsh, pares_lsh
+
+
+def _linea_recall_lsh_internal(matriz_tfidf, lsh, pares_lsh, umbral_jaccard, recall_sample_size):
+    # Recall del modo LSH frente al exacto sobre una muestra. Con una fracción de candidatos alta el LSH
+    # verifica casi tantas parejas como el modo exacto, así que el reporte incluye las dos cosas.
+    recall, encontrados, esperados, muestra = similarityMatrix.estimate_lsh_recall(
+        matriz_tfidf["indptr"], matriz_tfidf["indices"], len(matriz_tfidf["vocabulary"]),
+        pares_lsh[0], pares_lsh[1], umbral_jaccard, recall_sample_size)
+    recall_texto = f"{recall:.3f}" if recall is not None else "n/d"
+    return (f"Modo LSH ({lsh.bands} bandas × {lsh.rows} filas): recall estimado frente al modo "
+            f"exacto = {recall_texto} ({encontrados}/{esperados} pares de una muestra de "
+            f"{muestra} abstracts); candidatos verificados = {lsh.candidate_fraction:.2%} de "
+            f"las {lsh.num_possible_pairs} parejas")
+
+
+def _indice_allpairs_internal(matriz_tfidf, umbral_tfidf, status_callback):
+    # Modo allpairs en serie: índice invertido con poda por prefijo y cotas de norma
+    all_pairs = similarityMatrix.AllPairsCosine(matriz_tfidf["indptr"], matriz_tfidf["indices"],
+                                                matriz_tfidf["data"], len(matriz_tfidf["vocabulary"]), umbral_tfidf)
+    status_callback(
+        f"SimilarityAnalyzer: Índice AllPairs con {all_pairs.num_indexed} de "
+        f"{len(matriz_tfidf['indices'])} valores TF-IDF indexados (el resto queda en los prefijos).")
+    return all_pairs
+
+
+def _vecinos_topk_internal(num_vectores, top_k, checkpoint, snapshot, limite_filas, status_callback):
+    # Modo top-k: los k vecinos de cada abstract, partiendo de los del punto de control o de la ejecución
+    # anterior (modo incremental, donde los abstracts anteriores ocupan ahora las filas desde limite_filas)
+    vecinos = similarityMatrix.TopKNeighbours(num_vectores, top_k)
+    status_callback(f"SimilarityAnalyzer: Guardando los {vecinos.k} vecinos más similares de cada abstract.")
+    if checkpoint is not None and "neighbours_ids" in checkpoint:
+        vecinos.load(checkpoint["neighbours_ids"], checkpoint["neighbours_sims"])
+    elif snapshot is not None and "neighbours_ids" in snapshot:
+        vecinos.load(snapshot["neighbours_ids"], snapshot["neighbours_sims"], limite_filas)
+    return vecinos
+
+
+def _guardar_topk_internal(vecinos, matriz_tfidf, topk_csv_path, entry_ids_list, titulos_list, top_k,
+                           status_callback):
+    with pairSink.PairSink(topk_csv_path, "Sim_TFIDF", entry_ids_list, titulos_list, with_rank=True) as sink_topk:
+        sink_topk.add(*vecinos.pairs(matriz_tfidf["indptr"], matriz_tfidf["indices"], matriz_tfidf["data"]))
+    status_callback(f"SimilarityAnalyzer: {sink_topk.count} vecinos top-{top_k} guardados en: "
+                    f"{os.path.basename(topk_csv_path)}")
+
+
+def _iter_pares_modo_internal(matriz_tfidf, bloques, bloques_pendientes, opciones, lsh, parallel, max_workers,
+                              stop_event, vecinos, status_callback):
+    # Modos blocks / allpairs, en serie o en el pool de procesos: generador de (bloque, pares del bloque)
+    if parallel:
+        # La matriz va una sola vez a memoria compartida y los bloques se reparten entre procesos;
+        # los pares llegan en el orden de los bloques, así que el reporte no cambia
+        status_callback(f"SimilarityAnalyzer: Comparación en paralelo con "
+                        f"{max_workers or os.cpu_count()} procesos...")
+        return _iter_pares_paralelo_internal(
+            matriz_tfidf, bloques, bloques_pendientes, opciones["umbral_tfidf"],
+            opciones["umbral_jaccard"] if lsh is None else None, opciones["cosine_method"], stop_event, max_workers,
+            opciones["top_k"], vecinos, status_callback)
+    all_pairs = None
+    if opciones["cosine_method"] == 'allpairs':
+        all_pairs = _indice_allpairs_internal(matriz_tfidf, opciones["umbral_tfidf"], status_callback)
+    return _iter_pares_bloques_internal(bloques, bloques_pendientes, all_pairs, stop_event, vecinos)
+
+
+def _recorrer_bloques_internal(pares_por_bloque, total_bloques, bloques_hechos, num_vectores, fila_siguiente,
+                               pares_lsh, vecinos, sink_tfidf, sink_jaccard, guardar_punto_control, status_callback):
+    # Escribe los pares de cada bloque a medida que llegan y guarda el punto de control cada
+    # _SEGUNDOS_PUNTO_CONTROL segundos. Devuelve la fila siguiente a la última comparada.
+    ultimo_punto_control = time.monotonic()
+    for num_bloque, ((fila_inicio, fila_fin), pares_bloque) in enumerate(pares_por_bloque, bloques_hechos):
+        status_callback(
+            f"SimilarityAnalyzer: (TF-IDF + Jaccard) Bloque {num_bloque + 1}/{total_bloques} "
+            f"(vectores {fila_inicio + 1}-{fila_fin} de {num_vectores})...")
+        fila_siguiente = fila_fin
+        # Los bloques del pool traen sus vecinos parciales; los de la vía en serie ya los dejaron en vecinos
+        if "topk" in pares_bloque:
+            vecinos.merge(*pares_bloque["topk"])
+        if pares_lsh is not None:
+            desde, hasta = pares_lsh[0].searchsorted([fila_inicio, fila_fin])
+            pares_bloque["jaccard"] = tuple(parte[desde:hasta] for parte in pares_lsh)
+        sink_tfidf.add(*pares_bloque["tfidf"])
+        sink_jaccard.add(*pares_bloque["jaccard"])
+        if time.monotonic() - ultimo_punto_control >= _SEGUNDOS_PUNTO_CONTROL:
+            guardar_punto_control(fila_siguiente)
+            ultimo_punto_control = time.monotonic()
+    return fila_siguiente
+
+
+def _copiar_seccion_internal(report_file, parte_path, sink, conteo_previo, nombre, umbral, status_callback):
+    # Vuelca al reporte las líneas de la sección (archivo .part) y su total; devuelve el total de pares
+    sink.flush()
+    total = conteo_previo + sink.count
+    with open(parte_path, encoding='utf-8') as lineas:
+        shutil.copyfileobj(lineas, report_file)
+    report_file.write(
+        f"\nTotal pares encontrados con similitud {nombre} >= {umbral} (hasta detención si aplica): {total}\n")
+    status_callback(f"SimilarityAnalyzer: {total} pares {nombre} >= {umbral} (guardados en reporte).")
+    return total
+
+
+# --- Función principal para llamar desde gui_controller ---
+# MODIFICADO para aceptar stop_event
+def run_similarity_analysis(status_callback, project_root_dir, stop_event=None,  # AÑADIDO stop_event
+                            jaccard_method='exact', lsh_bands=None, lsh_rows=None, lsh_num_perm=384,
+                            lsh_max_candidate_rate=0.1, recall_sample_size=500, cosine_method='blocks', parallel=False,
+                            max_workers=None, top_k=None, resume=True, incremental=False, idf_drift_tolerance=0.05,
+                            rebuild_on_drift=True):
+    # jaccard_method='lsh': los pares Jaccard salen de candidatos MinHash + LSH verificados con Jaccard
+    # exacto (bandas/filas ajustables; por defecto las elige similarityMatrix.lsh_parameters con la fracción
+    # de candidatos acotada por lsh_max_candidate_rate) en vez de comparar todas las parejas; el reporte
+    # incluye esa fracción y el recall estimado frente al modo exacto sobre una muestra de
+    # recall_sample_size abstracts.
+    # cosine_method='allpairs': los pares TF-IDF salen de un índice invertido con poda por prefijo y
+    # cotas de norma (mismos pares que la comparación completa por bloques, sin puntuar los imposibles).
+    # parallel=True: los bloques de filas se comparan en un pool de max_workers procesos (ver similarityPool).
+    # top_k=k: además de los pares por umbral, guarda los k abstracts más similares (coseno TF-IDF) de cada
+    # abstract en similarity_tfidf_topk.csv, con memoria O(n·k) durante la pasada.
+    # resume=True: si una ejecución anterior se detuvo, continúa desde su punto de control (ver
+    # similarityCheckpoint) siempre que unificados.bib y las opciones no hayan cambiado.
+    # incremental=True: conserva vectores (vocabulario e IDF congelados) y pares de la última ejecución
+    # completa y solo compara los abstracts nuevos con todos, O(Δn·n) en vez de O(n²). Si la deriva relativa
+    # del IDF supera idf_drift_tolerance se recalcula todo (rebuild_on_drift=True) o solo se avisa.
+    # Cada modo vive en su propio _..._internal; aquí solo se eligen y se encadenan.
+    if jaccard_method not in ('exact', 'lsh'):
+        status_callback(f"SimilarityAnalyzer: Error - Método Jaccard desconocido '{jaccard_method}' "
+                        f"(opciones: exact, lsh).")
+        status_callback("SimilarityAnalyzer completado (con error).")
+        return
+    if cosine_method not in ('blocks', 'allpairs'):
+        status_callback(f"SimilarityAnalyzer: Error - Método de coseno desconocido '{cosine_method}' "
+                        f"(opciones: blocks, allpairs).")
+        status_callback("SimilarityAnalyzer completado (con error).")
         return
+    status_callback("Iniciando Análisis de Similitud de Abstracts...")
+
+    bibtex_file_input = os.path.join(project_root_dir, "output", "parsing", "unificados.bib")  #
+
+    output_similarity_dir = os.path.join(project_root_dir, "output", "similarity_analysis")
+    os.makedirs(output_similarity_dir, exist_ok=True)
+
+    report_txt_path = os.path.join(output_similarity_dir, "similarity_full_report.txt")
+    tfidf_csv_path = os.path.join(output_similarity_dir, "similarity_tfidf_pairs.csv")
+    jaccard_csv_path = os.path.join(output_similarity_dir, "similarity_jaccard_pairs.csv")
+    topk_csv_path = os.path.join(output_similarity_dir, "similarity_tfidf_topk.csv")
+    parte_tfidf_path = os.path.join(output_similarity_dir, "similarity_report_tfidf.part")
+    parte_jaccard_path = os.path.join(output_similarity_dir, "similarity_report_jaccard.part")
+
+    if not os.path.exists(bibtex_file_input):
+        status_callback(f"SimilarityAnalyzer: Error - Archivo BibTeX unificado no encontrado en {bibtex_file_input}")
+        status_callback("SimilarityAnalyzer completado (con error).")
+        return
+
+    # Chequeo inicial de stop_event
+    if stop_event and stop_event.is_set():
+        status_callback("SimilarityAnalyzer: Detenido por el usuario antes de cargar datos.")
+        return
+
+    documentos = _cargar_abstracts_internal(bibtex_file_input, stop_event, status_callback)
+    if documentos is None:
+        return
+    abstracts_list, titulos_list, entry_ids_list = documentos
 
     # Chequeo después de cargar datos y antes de cálculos pesados
     if stop_event and stop_event.is_set():
@@ -203,11 +403,85 @@ def run_similarity_analysis(status_callback, project_root_dir, stop_event=None):
         status_callback("SimilarityAnalyzer completado (datos insuficientes).")
         return
 
-    tfidf_pairs_data = []
-    jaccard_pairs_data = []
+    pares_similares_tfidf_count = 0
+    pares_similares_jaccard_count = 0
+    umbral_tfidf = 0.3
+    umbral_jaccard = 0.25
+    completado = False
+    vecinos = None
+
+    # Opciones que deben coincidir para reutilizar la ejecución anterior (modo incremental) o reanudar
+    opciones_analisis = {"umbral_tfidf": umbral_tfidf, "umbral_jaccard": umbral_jaccard,
+                         "jaccard_method": jaccard_method, "lsh_bands": lsh_bands, "lsh_rows": lsh_rows,
+                         "lsh_num_perm": lsh_num_perm, "lsh_max_candidate_rate": lsh_max_candidate_rate,
+                         "cosine_method": cosine_method, "top_k": top_k}
+    salidas_parciales = [tfidf_csv_path, jaccard_csv_path, parte_tfidf_path, parte_jaccard_path]
+    huellas_corpus = [similarityCheckpoint.document_digest(entry_id, titulo, abstract)
+                      for entry_id, titulo, abstract in zip(entry_ids_list, titulos_list, abstracts_list)]
+    documentos_corpus = (abstracts_list, titulos_list, entry_ids_list, huellas_corpus)
+    huellas_list = huellas_corpus
+    snapshot = None
+    if incremental:
+        snapshot, orden_filas = _preparar_incremental_internal(output_similarity_dir, opciones_analisis,
+                                                               huellas_corpus, status_callback)
+        if snapshot is not None:
+            # Las filas [0, nuevos) son los abstracts nuevos; el resto, los anteriores en su orden previo
+            abstracts_list, titulos_list, entry_ids_list, huellas_list = (
+                [lista[idx] for idx in orden_filas] for lista in documentos_corpus)
+    docs_previos = len(snapshot["digests"]) if snapshot is not None else 0
+
+    # Punto de control: solo se reanuda con el mismo unificados.bib y las mismas opciones de análisis
+    opciones = dict(opciones_analisis, num_docs=len(abstracts_list), base_docs=docs_previos)
+    checkpoint = None
+    if resume:
+        checkpoint, opciones = _cargar_punto_control_internal(output_similarity_dir, bibtex_file_input, opciones)
+        if checkpoint is not None and opciones["base_docs"] != docs_previos:
+            snapshot, docs_previos = None, 0
+            abstracts_list, titulos_list, entry_ids_list, huellas_list = documentos_corpus
+    reanudar = checkpoint is not None
+    if reanudar:
+        status_callback(f"SimilarityAnalyzer: Reanudando desde el punto de control (vector "
+                        f"{checkpoint['next_row'] + 1} de {len(abstracts_list)}).")
+    elif snapshot is not None:
+        status_callback(f"SimilarityAnalyzer: Modo incremental: {len(abstracts_list) - docs_previos} abstracts "
+                        f"nuevos se comparan con los {len(abstracts_list)} (la ejecución anterior tenía "
+                        f"{docs_previos}).")
+
+    if reanudar:
+        matriz_tfidf = _vectorizar_tfidf_internal(abstracts_list, status_callback, stop_event,
+                                                  checkpoint["vocabulary"], checkpoint["idf"])
+    elif snapshot is not None:
+        matriz_tfidf, reconstruir = _vectorizar_incremental_internal(abstracts_list, snapshot, idf_drift_tolerance,
+                                                                     rebuild_on_drift, stop_event, status_callback)
+        if reconstruir:
+            snapshot, docs_previos, opciones = None, 0, dict(opciones, base_docs=0)
+            abstracts_list, titulos_list, entry_ids_list, huellas_list = documentos_corpus
+            matriz_tfidf = _vectorizar_tfidf_internal(abstracts_list, status_callback, stop_event)
+    else:
+        matriz_tfidf = _vectorizar_tfidf_internal(abstracts_list, status_callback, stop_event)
 
+    if reanudar:
+        similarityCheckpoint.truncate_outputs(output_similarity_dir, checkpoint)
+    else:
+        similarityCheckpoint.clear_checkpoint(output_similarity_dir)
+        if snapshot is not None:
+            similarityCheckpoint.truncate_outputs(output_similarity_dir, snapshot)
+        else:
+            # Las salidas se reescriben desde cero: la instantánea anterior deja de valer
+            similarityCheckpoint.clear_snapshot(output_similarity_dir)
+    modo_parcial = 'a' if reanudar or snapshot is not None else 'w'
+
+    # Los pares se escriben por lotes a medida que aparecen (índices enteros + tabla ID/título, ver pairSink):
+    # CSV y líneas del reporte quedan en disco aunque se detenga. Las líneas de cada sección van a un archivo
+    # .part (que también sirve para reanudar) y el reporte se arma al final copiándolas.
     # Escribir encabezado del reporte incluso si se detiene
-    with open(report_txt_path, 'w', encoding='utf-8') as report_file:
+    with open(report_txt_path, 'w', encoding='utf-8') as report_file, \
+            open(parte_tfidf_path, modo_parcial, encoding='utf-8') as parte_tfidf, \
+            open(parte_jaccard_path, modo_parcial, encoding='utf-8') as parte_jaccard, \
+            pairSink.PairSink(tfidf_csv_path, "Sim_TFIDF", entry_ids_list, titulos_list, parte_tfidf,
+                              "TF-IDF", append=modo_parcial == 'a') as sink_tfidf, \
+            pairSink.PairSink(jaccard_csv_path, "Sim_Jaccard", entry_ids_list, titulos_list, parte_jaccard,
+                              "Jaccard", append=modo_parcial == 'a') as sink_jaccard:
         report_file.write("--- [Reporte de Similitud de Abstracts] ---\n")
         status_callback(f"SimilarityAnalyzer: Reporte detallado se guardará en: {report_txt_path}")
         status_callback(f"SimilarityAnalyzer: Pares TF-IDF CSV: {os.path.basename(tfidf_csv_path)}")
@@ -216,128 +490,125 @@ def run_similarity_analysis(status_callback, project_root_dir, stop_event=None):
         # Calcular similitud TF-IDF + Coseno
         report_file.write("\n--- [Similitud TF-IDF + Coseno] ---\n")
         status_callback("\n--- [Similitud TF-IDF + Coseno] ---")
-        # Pasar stop_event a _calcular_tfidf_internal
-        vectores_tfidf = _calcular_tfidf_internal(abstracts_list, status_callback, stop_event)
 
         if stop_event and stop_event.is_set():
             status_callback("SimilarityAnalyzer: Detenido durante el cálculo de TF-IDF.")
             # El reporte TXT y los CSV se guardarán con lo que se haya procesado.
 
-        pares_similares_tfidf_count = 0
-        umbral_tfidf = 0.3
-
-        if vectores_tfidf and len(vectores_tfidf) == len(titulos_list):  # Asegurar consistencia
+        if matriz_tfidf is not None and len(matriz_tfidf["indptr"]) - 1 == len(titulos_list):  # Asegurar consistencia
+            if not reanudar:
+                similarityCheckpoint.save_vocabulary(output_similarity_dir, matriz_tfidf["vocabulary"],
+                                                     matriz_tfidf["idf"])
             report_file.write(f"Umbral de similitud TF-IDF aplicado: {umbral_tfidf}\n\n")
+            num_vectores = len(titulos_list)
+            # Filas por comparar: en modo incremental solo las de los abstracts nuevos (cada una con todas
+            # las posteriores, es decir, con los demás nuevos y con los anteriores)
+            limite_filas = num_vectores - docs_previos if snapshot is not None else num_vectores
+            if snapshot is not None and limite_filas == 0:
+                status_callback("SimilarityAnalyzer: No hay abstracts nuevos; se conservan los pares de la "
+                                "ejecución anterior.")
+            lsh, pares_lsh = None, None
+            if jaccard_method == 'lsh':
+                lsh, pares_lsh = _pares_jaccard_lsh_internal(matriz_tfidf, opciones, limite_filas, stop_event,
+                                                             status_callback)
+            # Coseno y Jaccard se calculan en la misma pasada por bloques: los conjuntos de tokens de
+            # cada abstract son las columnas no nulas de su fila en la matriz (IDs enteros ordenados)
+            bloques = similarityMatrix.PairwiseBlocks(matriz_tfidf["indptr"], matriz_tfidf["indices"],
+                                                      matriz_tfidf["data"], len(matriz_tfidf["vocabulary"]),
+                                                      umbral_tfidf if cosine_method == 'blocks' else None,
+                                                      umbral_jaccard if lsh is None else None,
+                                                      checkpoint["block_rows"] if reanudar else None)
             status_callback(
-                f"SimilarityAnalyzer: Comparando {len(vectores_tfidf)} vectores TF-IDF (umbral: {umbral_tfidf})...")
-            num_vectores = len(vectores_tfidf)
-            for i in range(num_vectores):
-                if stop_event and stop_event.is_set():
-                    status_callback(f"SimilarityAnalyzer: Comparación TF-IDF detenida en vector {i + 1}.")
-                    break  # Salir del bucle de comparación TF-IDF
-                if i > 0 and i % 50 == 0:
-                    status_callback(
-                        f"SimilarityAnalyzer: (TF-IDF) Comparando vector {i + 1}/{num_vectores} con el resto...")
-                for j in range(i + 1, num_vectores):
-                    # No es estrictamente necesario chequear stop_event en el bucle interno si el externo lo hace,
-                    # pero no hace daño y puede hacer la detención un poco más responsiva.
-                    if stop_event and stop_event.is_set() and j % 100 == 0:  # Chequeo menos frecuente en bucle interno
-                        break
-                    sim = _coseno_internal(vectores_tfidf[i], vectores_tfidf[j])
-                    if sim >= umbral_tfidf:
-                        report_file.write(
-                            f"  - TF-IDF Sim: '{titulos_list[i]}' ≈ '{titulos_list[j]}' (sim: {sim:.3f})\n")
-                        tfidf_pairs_data.append({
-                            "ID_1": entry_ids_list[i], "Titulo_1": titulos_list[i],
-                            "ID_2": entry_ids_list[j], "Titulo_2": titulos_list[j],
-                            "Sim_TFIDF": round(sim, 4)
-                        })
-                        pares_similares_tfidf_count += 1
-                if stop_event and stop_event.is_set(): break  # Salir del bucle externo si el interno se rompió por stop
-            report_file.write(
-                f"\nTotal pares encontrados con similitud TF-IDF >= {umbral_tfidf} (hasta detención si aplica): {pares_similares_tfidf_count}\n")
-            status_callback(
-                f"SimilarityAnalyzer: {pares_similares_tfidf_count} pares TF-IDF >= {umbral_tfidf} (guardados en reporte).")
+                f"SimilarityAnalyzer: Comparando {num_vectores} vectores TF-IDF (umbral: {umbral_tfidf}) y con "
+                f"Índice de Jaccard (umbral: {umbral_jaccard}) en {len(bloques.blocks)} bloques de "
+                f"{bloques.block_rows} filas...")
+            if top_k:
+                vecinos = _vecinos_topk_internal(num_vectores, top_k, checkpoint, snapshot, limite_filas,
+                                                 status_callback)
+            fila_siguiente = checkpoint["next_row"] if reanudar else 0
+            if reanudar:
+                conteos_previos = checkpoint["counts"]
+            elif snapshot is not None:
+                conteos_previos = snapshot["counts"]
+            else:
+                conteos_previos = {"tfidf": 0, "jaccard": 0}
+            # El último bloque se recorta en limite_filas para no repetir pares entre abstracts anteriores
+            bloques_pendientes = [(fila_inicio, min(fila_fin, limite_filas))
+                                  for fila_inicio, fila_fin in bloques.blocks
+                                  if fila_siguiente <= fila_inicio < limite_filas]
+
+            def _guardar_punto_control(fila):
+                sink_tfidf.flush()
+                sink_jaccard.flush()
+                similarityCheckpoint.save_progress(
+                    output_similarity_dir, bibtex_file_input, opciones, fila, bloques.block_rows,
+                    {"tfidf": conteos_previos["tfidf"] + sink_tfidf.count,
+                     "jaccard": conteos_previos["jaccard"] + sink_jaccard.count},
+                    salidas_parciales, vecinos)
+
+            pares_por_bloque = _iter_pares_modo_internal(matriz_tfidf, bloques, bloques_pendientes, opciones, lsh,
+                                                         parallel, max_workers, stop_event, vecinos, status_callback)
+            total_bloques = sum(1 for fila_inicio, _ in bloques.blocks if fila_inicio < limite_filas)
+            fila_siguiente = _recorrer_bloques_internal(
+                pares_por_bloque, total_bloques, total_bloques - len(bloques_pendientes), num_vectores,
+                fila_siguiente, pares_lsh, vecinos, sink_tfidf, sink_jaccard, _guardar_punto_control,
+                status_callback)
+            completado = fila_siguiente >= limite_filas
+            if not completado:
+                status_callback(f"SimilarityAnalyzer: Comparación detenida en vector {fila_siguiente + 1}.")
+                # La próxima ejecución sobre el mismo unificados.bib continuará desde aquí
+                _guardar_punto_control(fila_siguiente)
+                status_callback("SimilarityAnalyzer: Punto de control guardado; la próxima ejecución continuará "
+                                "desde este vector.")
+            if vecinos is not None:
+                _guardar_topk_internal(vecinos, matriz_tfidf, topk_csv_path, entry_ids_list, titulos_list, top_k,
+                                       status_callback)
+            pares_similares_tfidf_count = _copiar_seccion_internal(
+                report_file, parte_tfidf_path, sink_tfidf, conteos_previos["tfidf"], "TF-IDF", umbral_tfidf,
+                status_callback)
+
+            if stop_event and stop_event.is_set():
+                status_callback("SimilarityAnalyzer: Detenido por el usuario; la sección Jaccard será parcial.")
+            report_file.write("\n--- [Similitud Jaccard] ---\n")
+            status_callback("\n--- [Similitud Jaccard] ---")
+            report_file.write(f"Umbral de similitud Jaccard aplicado: {umbral_jaccard}\n\n")
+            pares_similares_jaccard_count = _copiar_seccion_internal(
+                report_file, parte_jaccard_path, sink_jaccard, conteos_previos["jaccard"], "Jaccard", umbral_jaccard,
+                status_callback)
+
+            # En modo incremental solo se tienen los pares nuevos, así que no hay recall que estimar
+            if lsh is not None and snapshot is None and not (stop_event and stop_event.is_set()):
+                linea_recall = _linea_recall_lsh_internal(matriz_tfidf, lsh, pares_lsh, umbral_jaccard,
+                                                          recall_sample_size)
+                report_file.write(linea_recall + "\n")
+                status_callback(f"SimilarityAnalyzer: {linea_recall}.")
         else:
             if not (stop_event and stop_event.is_set()):
                 msg_err = "SimilarityAnalyzer: No se generaron vectores TF-IDF o hay inconsistencia en datos."
                 status_callback(msg_err)
                 report_file.write(msg_err + "\n")
 
-        # Chequeo antes de Jaccard
-        if stop_event and stop_event.is_set():
-            status_callback("SimilarityAnalyzer: Detenido por el usuario antes de la comparación Jaccard.")
-        else:
-            # Calcular similitud Jaccard
-            report_file.write("\n--- [Similitud Jaccard] ---\n")
-            status_callback("\n--- [Similitud Jaccard] ---")
-            umbral_jaccard = 0.25
-            report_file.write(f"Umbral de similitud Jaccard aplicado: {umbral_jaccard}\n\n")
-            status_callback(f"SimilarityAnalyzer: Comparando con Índice de Jaccard (umbral: {umbral_jaccard})...")
-            pares_similares_jaccard_count = 0
-            num_abstracts_jaccard = len(abstracts_list)
-
-            for i in range(num_abstracts_jaccard):
-                if stop_event and stop_event.is_set():
-                    status_callback(f"SimilarityAnalyzer: Comparación Jaccard detenida en abstract {i + 1}.")
-                    break  # Salir del bucle de comparación Jaccard
-                if i > 0 and i % 50 == 0:
-                    status_callback(
-                        f"SimilarityAnalyzer: (Jaccard) Comparando abstract {i + 1}/{num_abstracts_jaccard} con el resto...")
-                for j in range(i + 1, num_abstracts_jaccard):
-                    if stop_event and stop_event.is_set() and j % 100 == 0:
-                        break
-                    sim = _jaccard_internal(abstracts_list[i], abstracts_list[j], status_callback)
-                    if sim >= umbral_jaccard:
-                        report_file.write(
-                            f"  - Jaccard Sim: '{titulos_list[i]}' ≈ '{titulos_list[j]}' (sim: {sim:.3f})\n")
-                        jaccard_pairs_data.append({
-                            "ID_1": entry_ids_list[i], "Titulo_1": titulos_list[i],
-                            "ID_2": entry_ids_list[j], "Titulo_2": titulos_list[j],
-                            "Sim_Jaccard": round(sim, 4)
-                        })
-                        pares_similares_jaccard_count += 1
-                if stop_event and stop_event.is_set(): break  # Salir del bucle externo
-            report_file.write(
-                f"\nTotal pares encontrados con similitud Jaccard >= {umbral_jaccard} (hasta detención si aplica): {pares_similares_jaccard_count}\n")
-            status_callback(
-                f"SimilarityAnalyzer: {pares_similares_jaccard_count} pares Jaccard >= {umbral_jaccard} (guardados en reporte).")
-
-    # --- Guardar datos de pares en archivos CSV (fuera del 'with open(report_txt_path...)') ---
-    try:
-        if tfidf_pairs_data:  # Guardar incluso si está vacío por detención (tendrá solo cabeceras)
-            with open(tfidf_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ["ID_1", "Titulo_1", "ID_2", "Titulo_2", "Sim_TFIDF"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                if tfidf_pairs_data: writer.writerows(tfidf_pairs_data)  # Solo escribir filas si hay datos
-            status_callback(f"SimilarityAnalyzer: Pares TF-IDF guardados en: {os.path.basename(tfidf_csv_path)}")
-        elif not (stop_event and stop_event.is_set()):
-            status_callback(f"SimilarityAnalyzer: No se encontraron pares TF-IDF para CSV (umbral: {umbral_tfidf}).")
-            # Crear CSV vacío con cabeceras si no hay datos y no se detuvo
-            with open(tfidf_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ["ID_1", "Titulo_1", "ID_2", "Titulo_2", "Sim_TFIDF"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-
-        if jaccard_pairs_data:  # Guardar incluso si está vacío por detención
-            with open(jaccard_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ["ID_1", "Titulo_1", "ID_2", "Titulo_2", "Sim_Jaccard"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                if jaccard_pairs_data: writer.writerows(jaccard_pairs_data)
-            status_callback(f"SimilarityAnalyzer: Pares Jaccard guardados en: {os.path.basename(jaccard_csv_path)}")
-        elif not (stop_event and stop_event.is_set()):
-            status_callback(f"SimilarityAnalyzer: No se encontraron pares Jaccard para CSV (umbral: {umbral_jaccard}).")
-            with open(jaccard_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ["ID_1", "Titulo_1", "ID_2", "Titulo_2", "Sim_Jaccard"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-
-    except Exception as e_csv:
-        status_callback(f"SimilarityAnalyzer: Error guardando reportes CSV: {e_csv}")
+    if completado:
+        # Análisis completo: el punto de control ya no hace falta y la instantánea (con las secciones
+        # parciales del reporte) queda como base de la próxima ejecución incremental
+        similarityCheckpoint.save_snapshot(output_similarity_dir, opciones_analisis, huellas_list,
+                                           matriz_tfidf["vocabulary"], matriz_tfidf["idf"],
+                                           {"tfidf": pares_similares_tfidf_count,
+                                            "jaccard": pares_similares_jaccard_count},
+                                           salidas_parciales, vecinos)
+        similarityCheckpoint.clear_checkpoint(output_similarity_dir)
+
+    # --- Los CSV ya se escribieron por lotes durante la comparación (fuera del 'with open(report_txt_path...)') ---
+    if pares_similares_tfidf_count:
+        status_callback(f"SimilarityAnalyzer: Pares TF-IDF guardados en: {os.path.basename(tfidf_csv_path)}")
+    elif not (stop_event and stop_event.is_set()):
+        status_callback(f"SimilarityAnalyzer: No se encontraron pares TF-IDF para CSV (umbral: {umbral_tfidf}).")
+    if pares_similares_jaccard_count:
+        status_callback(f"SimilarityAnalyzer: Pares Jaccard guardados en: {os.path.basename(jaccard_csv_path)}")
+    elif not (stop_event and stop_event.is_set()):
+        status_callback(f"SimilarityAnalyzer: No se encontraron pares Jaccard para CSV (umbral: {umbral_jaccard}).")
 
     if stop_event and stop_event.is_set():
         status_callback("\nSimilarityAnalyzer INTERRUMPIDO por el usuario. Resultados parciales guardados.")
     else:
-        status_callback("\nSimilarityAnalyzer completado.")
\ No newline at end of file
+        status_callback("\nSimilarityAnalyzer completado.")
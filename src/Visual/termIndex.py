@@ -0,0 +1,123 @@
+import numpy as np
+
+# Índice invertido posicional de las variables: para cada variable, sus apariciones como
+# (fila de la entrada, campo, offset en caracteres dentro del texto normalizado del campo),
+# ordenadas por fila, campo y offset. Las filas son las mismas de la matriz de incidencia.
+TERM_INDEX_FILENAME = "term_index.npz"
+
+# Separación entre (fila, campo) al codificar posiciones en un solo int64 para las búsquedas por proximidad
+_POSITION_STRIDE = 1 << 32
+
+
+def build_postings(variables, rows, fields, offsets, num_variables):
+    """Ordena y deduplica las apariciones; devuelve (var_ptr, rows, fields, offsets) por variable."""
+    variables = np.asarray(variables, dtype=np.int32)
+    rows = np.asarray(rows, dtype=np.int32)
+    fields = np.asarray(fields, dtype=np.int8)
+    offsets = np.asarray(offsets, dtype=np.int32)
+    order = np.lexsort((offsets, fields, rows, variables))
+    variables, rows, fields, offsets = variables[order], rows[order], fields[order], offsets[order]
+    if len(order):
+        # Dos claves de la misma variable (frase y acrónimo) pueden coincidir en la misma posición
+        keep = np.ones(len(order), dtype=np.bool_)
+        keep[1:] = ((variables[1:] != variables[:-1]) | (rows[1:] != rows[:-1]) | (fields[1:] != fields[:-1])
+                    | (offsets[1:] != offsets[:-1]))
+        variables, rows, fields, offsets = variables[keep], rows[keep], fields[keep], offsets[keep]
+    var_ptr = np.zeros(num_variables + 1, dtype=np.int64)
+    np.cumsum(np.bincount(variables, minlength=num_variables), out=var_ptr[1:])
+    return var_ptr, rows, fields, offsets
+
+
+def save_term_index(path, var_ptr, rows, fields, offsets, entry_ids, variables, field_names):
+    np.savez_compressed(path, var_ptr=var_ptr, rows=rows, fields=fields, offsets=offsets,
+                        entry_ids=np.asarray(entry_ids, dtype=str), variables=np.asarray(variables, dtype=str),
+                        field_names=np.asarray(field_names, dtype=str))
+
+
+class TermIndex:
+    """Consultas booleanas y de proximidad sobre el índice guardado por el DataNormalizer.
+
+    Ejemplo: entradas que mencionan Scratch y Abstraction a menos de 200 caracteres::
+
+        index = TermIndex.load(os.path.join(output_dn_dir, TERM_INDEX_FILENAME))
+        index.entry_ids_of(index.near('Scratch', 'Abstraction', 200))
+    """
+
+    def __init__(self, var_ptr, rows, fields, offsets, entry_ids, variables, field_names):
+        self.var_ptr = var_ptr
+        self.rows = rows
+        self.fields = fields
+        self.offsets = offsets
+        self.entry_ids = entry_ids
+        self.variables = [str(name) for name in variables]
+        self.field_names = [str(name) for name in field_names]
+        self._variable_index = {name: idx for idx, name in enumerate(self.variables)}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['var_ptr'], data['rows'], data['fields'], data['offsets'], data['entry_ids'],
+                       data['variables'], data['field_names'])
+
+    def _slice_internal(self, variable, field=None):
+        var_idx = self._variable_index.get(variable)
+        if var_idx is None:
+            return slice(0, 0), None
+        lo, hi = self.var_ptr[var_idx], self.var_ptr[var_idx + 1]
+        mask = None
+        if field is not None:
+            mask = self.fields[lo:hi] == self.field_names.index(field)
+        return slice(lo, hi), mask
+
+    def postings(self, variable, field=None):
+        """Lista de (entry ID, campo, offset) de la variable."""
+        span, mask = self._slice_internal(variable, field)
+        rows, fields, offsets = self.rows[span], self.fields[span], self.offsets[span]
+        if mask is not None:
+            rows, fields, offsets = rows[mask], fields[mask], offsets[mask]
+        return [(str(self.entry_ids[row]), self.field_names[field_code], int(offset))
+                for row, field_code, offset in zip(rows, fields, offsets)]
+
+    def rows_with(self, variable, field=None):
+        span, mask = self._slice_internal(variable, field)
+        rows = self.rows[span]
+        return np.unique(rows[mask] if mask is not None else rows)
+
+    def all_of(self, variables, field=None):
+        # AND: filas que contienen todas las variables
+        result = None
+        for variable in variables:
+            rows = self.rows_with(variable, field)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+        return result if result is not None else np.zeros(0, dtype=np.int32)
+
+    def any_of(self, variables, field=None):
+        # OR: filas que contienen al menos una de las variables
+        rows = [self.rows_with(variable, field) for variable in variables]
+        return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int32)
+
+    def without(self, rows, variables, field=None):
+        # NOT: quita de rows las filas que contienen alguna de las variables
+        return np.setdiff1d(rows, self.any_of(variables, field), assume_unique=True)
+
+    def _encoded_positions_internal(self, variable, field=None):
+        span, mask = self._slice_internal(variable, field)
+        rows, fields, offsets = self.rows[span], self.fields[span], self.offsets[span]
+        if mask is not None:
+            rows, fields, offsets = rows[mask], fields[mask], offsets[mask]
+        scope = rows.astype(np.int64) * len(self.field_names) + fields
+        return rows, scope * _POSITION_STRIDE + offsets
+
+    def near(self, variable_a, variable_b, max_distance, field=None):
+        """Filas donde alguna aparición de a está a <= max_distance caracteres de una de b, en el mismo campo."""
+        rows_a, positions_a = self._encoded_positions_internal(variable_a, field)
+        _, positions_b = self._encoded_positions_internal(variable_b, field)
+        if not len(positions_a) or not len(positions_b):
+            return np.zeros(0, dtype=np.int32)
+        # Las posiciones codificadas ya están ordenadas; el rango [p - d, p + d] nunca cruza de (fila, campo)
+        lo = np.searchsorted(positions_b, positions_a - max_distance, side='left')
+        hi = np.searchsorted(positions_b, positions_a + max_distance, side='right')
+        return np.unique(rows_a[hi > lo])
+
+    def entry_ids_of(self, rows):
+        return [str(self.entry_ids[row]) for row in rows]
@@ -0,0 +1,79 @@
+from collections import deque
+
+# Autómata de Aho-Corasick para buscar todas las variables de variables.csv en una sola pasada
+# por texto. Cada coincidencia se acepta solo si respeta los límites de palabra con la misma
+# semántica que r'\b' + re.escape(clave) + r'\b' (carácter de palabra = alfanumérico o '_').
+
+
+def _is_word_char_internal(ch):
+    return ch.isalnum() or ch == '_'
+
+
+def _is_boundary_internal(text, pos):
+    before = pos > 0 and _is_word_char_internal(text[pos - 1])
+    after = pos < len(text) and _is_word_char_internal(text[pos])
+    return before != after
+
+
+class TermMatcher:
+    def __init__(self, search_map):
+        """search_map: clave de búsqueda normalizada -> nombre canónico de la variable."""
+        self.keys = [key for key in search_map if key]
+        self.canonical_names = sorted(set(search_map[key] for key in self.keys))
+        canonical_index = {name: idx for idx, name in enumerate(self.canonical_names)}
+        self.key_canonical = [canonical_index[search_map[key]] for key in self.keys]
+        self._build_automaton_internal()
+
+    def _build_automaton_internal(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+        for key_idx, key in enumerate(self.keys):
+            state = 0
+            for ch in key:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append(())
+                state = next_state
+            self._outputs[state] += (key_idx,)
+
+        # Enlaces de fallo por niveles (BFS); las salidas de cada estado incluyen las de su cadena de fallo
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and ch not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                target = self._goto[fail_state].get(ch, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] += self._outputs[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """Genera (inicio, fin, índice de clave) por cada aparición que respeta los límites de palabra."""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        keys = self.keys
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if outputs[state]:
+                end = pos + 1
+                for key_idx in outputs[state]:
+                    start = end - len(keys[key_idx])
+                    if _is_boundary_internal(text, start) and _is_boundary_internal(text, end):
+                        yield start, end, key_idx
+
+    def find_canonical_indices(self, text):
+        return {self.key_canonical[key_idx] for _, _, key_idx in self.iter_matches(text)}
+
+    def find_canonical_terms(self, text):
+        return {self.canonical_names[idx] for idx in self.find_canonical_indices(text)}
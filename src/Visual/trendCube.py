@@ -0,0 +1,70 @@
+import numpy as np
+from src.Visual import incidenceMatrix
+
+# Cubo variable × año para análisis de tendencias: frecuencias por año (matriz densa V × Y) y
+# pesos de co-ocurrencia por año en formato COO (año, origen, destino, peso), indexados por el
+# índice de la variable. Los cortes por periodo se obtienen sumando columnas, sin re-escanear.
+TREND_CUBE_FILENAME = "term_year_cube.npz"
+
+
+def parse_year(year):
+    year = str(year or '').strip()[:4]
+    return int(year) if year.isdigit() else -1
+
+
+def select_rows(indptr, indices, rows):
+    # Submatriz CSR con las filas pedidas (en ese orden)
+    lengths = np.diff(indptr)[rows]
+    sub_indptr, _ = incidenceMatrix.build_csr(lengths, [])
+    gather = np.repeat(indptr[:-1][rows] - sub_indptr[:-1], lengths) + np.arange(sub_indptr[-1])
+    return sub_indptr, indices[gather]
+
+
+def build_trend_cube(indptr, indices, row_years, num_variables):
+    row_years = np.asarray(row_years, dtype=np.int32)
+    years = np.unique(row_years[row_years >= 0])
+    year_of_row = np.searchsorted(years, row_years)
+
+    # Frecuencia de cada variable en cada año: la fila de cada índice se obtiene de indptr
+    rows_of_indices = np.repeat(np.arange(len(row_years)), np.diff(indptr))
+    dated = row_years[rows_of_indices] >= 0
+    term_year = np.bincount(indices[dated] * len(years) + year_of_row[rows_of_indices[dated]],
+                            minlength=num_variables * len(years)).reshape(num_variables, len(years))
+
+    # Co-ocurrencias por año en una sola pasada: cada par (a, b) de una fila fechada se codifica con el año
+    # como clave (índice del año * V² + a * V + b) y se cuenta una vez; las filas sin año no entran
+    dated_rows = np.flatnonzero(row_years >= 0)
+    sub_indptr, sub_indices = select_rows(indptr, indices, dated_rows)
+    codes, weights = incidenceMatrix.cooccurrence_counts(sub_indptr, sub_indices, num_variables,
+                                                         year_of_row[dated_rows])
+    pair_codes = codes % (num_variables * num_variables)
+    return {"years": years, "term_year": term_year.astype(np.int32),
+            "edge_year": (codes // (num_variables * num_variables)).astype(np.int32),
+            "edge_source": (pair_codes // num_variables).astype(np.int32),
+            "edge_target": (pair_codes % num_variables).astype(np.int32),
+            "edge_weight": weights.astype(np.int32)}
+
+
+def save_trend_cube(path, cube, variables):
+    np.savez_compressed(path, variables=np.asarray(variables, dtype=str), **cube)
+
+
+def load_trend_cube(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def term_counts_between(cube, start_year, end_year):
+    # Frecuencia de cada variable en el periodo [start_year, end_year]
+    in_period = (cube["years"] >= start_year) & (cube["years"] <= end_year)
+    return cube["term_year"][:, in_period].sum(axis=1)
+
+
+def edges_between(cube, start_year, end_year):
+    """Aristas (origen, destino, peso) del grafo de co-ocurrencia del periodo [start_year, end_year]."""
+    num_variables = len(cube["variables"])
+    in_period = (cube["years"][cube["edge_year"]] >= start_year) & (cube["years"][cube["edge_year"]] <= end_year)
+    codes = cube["edge_source"][in_period].astype(np.int64) * num_variables + cube["edge_target"][in_period]
+    codes, inverse = np.unique(codes, return_inverse=True)
+    weights = np.bincount(inverse, weights=cube["edge_weight"][in_period]).astype(np.int64)
+    return codes // num_variables, codes % num_variables, weights